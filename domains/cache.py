@@ -0,0 +1,97 @@
+import hashlib
+import os
+import pickle
+import warnings
+
+CACHE_DIR = 'results/cache/'
+
+class LazyNamespace:
+    """Namespace whose contents are loaded the first time they are needed
+
+    The first time an attribute is missing from the namespace, `loader` is called. The
+    loader can either assign the namespace's attributes itself, or return a dict of them.
+
+    Args:
+        loader (callable):
+            A function that takes no arguments and loads the namespace's contents
+        doc (str, optional):
+            A description of the namespace
+    """
+    def __init__(self, loader, doc=None):
+        self._loader = loader
+        self.__doc__ = doc
+
+    def __getattr__(self, name):
+        # Only called when normal attribute lookup fails
+        loader = self.__dict__.get('_loader')
+        if loader is None or name.startswith('__'):
+            raise AttributeError(name)
+        self._loader = None
+        attributes = loader()
+        if attributes:
+            self.__dict__.update(attributes)
+        return getattr(self, name)
+
+def cached(name, content, build_fn):
+    """Return build_fn(content), using an on-disk cache keyed by the given content
+
+    The cache key is a hash of repr(content), so any change to the content results in a
+    new cache entry. If the cache cannot be read or written, the result is just rebuilt.
+
+    Args:
+        name (str):
+            A prefix identifying what is being cached, e.g. 'cube-models'. Change it
+            whenever build_fn changes, so that stale results aren't loaded.
+        content:
+            The input to build_fn. Its repr() must uniquely identify the result.
+        build_fn (callable):
+            A function that takes content as input and returns a picklable result
+    """
+    key = hashlib.sha1(repr(content).encode()).hexdigest()
+    filename = os.path.join(CACHE_DIR, '{}-{}.pickle'.format(name, key))
+    try:
+        with open(filename, 'rb') as file:
+            return pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        pass
+
+    result = build_fn(content)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_filename = '{}.{}.tmp'.format(filename, os.getpid())
+        with open(tmp_filename, 'wb') as file:
+            pickle.dump(result, file)
+        os.replace(tmp_filename, filename)
+    except OSError as error:
+        warnings.warn('Failed to write cache file {}: {}'.format(filename, error))
+    return result
+
+def test():
+    """Test lazy namespaces and the on-disk cache"""
+    import tempfile
+    global CACHE_DIR  # pylint: disable=W0603
+    calls = []
+    namespace = LazyNamespace(lambda: calls.append(1) or {'value': 3}, 'A test namespace')
+    assert not calls
+    assert namespace.value == 3 and namespace.value == 3
+    assert len(calls) == 1
+    try:
+        namespace.missing  # pylint: disable=W0104
+        assert False, 'Expected AttributeError'
+    except AttributeError:
+        pass
+
+    old_cache_dir = CACHE_DIR
+    try:
+        with tempfile.TemporaryDirectory() as CACHE_DIR:
+            build_fn = lambda content: calls.append(1) or sum(content)
+            assert cached('test', [1, 2, 3], build_fn) == 6
+            assert cached('test', [1, 2, 3], build_fn) == 6
+            assert cached('test', [1, 2, 4], build_fn) == 7
+            assert len(calls) == 3
+    finally:
+        CACHE_DIR = old_cache_dir
+    print('All tests passed.')
+
+if __name__ == '__main__':
+    test()
@@ -1,7 +1,8 @@
-import copy
 import enum
 import random
 
+import numpy as np
+
 class ANSIColor:  # pylint: disable=R0903
     """Namespace for ANSI color codes"""
 ANSIColor.RED = '\x1b[41m'
@@ -64,6 +65,11 @@ ACTION_MAP = {
 }
 ACTIONS = sorted(list(ACTION_MAP.keys()))
 
+# Each sticker position (Face, Pos) has an integer id: face * len(Pos) + pos
+N_POSITIONS = len(Face) * len(Pos)
+POSITIONS = [(face, pos) for face in Face for pos in Pos]
+NON_CENTER_POSITIONS = np.asarray([i for i, (_, pos) in enumerate(POSITIONS) if pos != Pos.M])
+
 # Mapping from Faces to CubeColors
 INITIAL_COLORS = {
     Face.F: CubeColor.R,
@@ -192,6 +198,17 @@ def get_position_swaps(action):
     }
     return swaps[action]
 
+def get_action_swaps(action):
+    """Return the list of position swaps associated with a single quarter-turn action"""
+    face, is_inverted = ACTION_MAP[action]
+    swaps = get_position_swaps(face)
+
+    # Since swaps are implemented w.r.t the 2-D render diagram, half of them need to be flipped
+    need_flip = (face in [Face.B, Face.L, Face.D])
+    if (need_flip and not is_inverted) or (is_inverted and not need_flip):
+        swaps = get_inverse_swaps(swaps)
+    return swaps
+
 def get_inverse_swaps(swap_list):
     """Invert a given list of position swaps
 
@@ -201,75 +218,118 @@ def get_inverse_swaps(swap_list):
     result = list(zip(end, start))
     return result
 
+def get_permutation(swap_list):
+    """Compile a list of position swaps into an index permutation
+
+    The result is an array of position ids, such that cube.state[permutation] has the
+    same effect as applying the swap_list to the Cube.
+    """
+    permutation = np.arange(N_POSITIONS, dtype=np.uint8)
+    for ((start_face, start_pos), (end_face, end_pos)) in swap_list:
+        permutation[end_face * len(Pos) + end_pos] = start_face * len(Pos) + start_pos
+    return permutation
+
+# Mapping from action names to their compiled index permutations
+ACTION_PERMUTATIONS = {action: get_permutation(get_action_swaps(action)) for action in ACTIONS}
+
+# Mapping from position ids to the CubeColor of the sticker that starts there
+STICKER_COLORS = np.asarray([INITIAL_COLORS[face] for (face, _) in POSITIONS])
+
 class Cube:
-    """Rubik's cube puzzle simulator"""
+    """Rubik's cube puzzle simulator
+
+    The state is stored as a compact array of sticker ids, where state[i] is the id of
+    the sticker currently at position i. Sticker ids are the position ids where each
+    sticker starts out in the solved Cube.
+    """
     def __init__(self):
         self.reset()
 
     def reset(self):
         """Reset the Cube to the canonical 'solved' state"""
         self.sequence = []
-        self.faces = [
-            [INITIAL_COLORS[Face.F] for _ in range(9)],
-            [INITIAL_COLORS[Face.B] for _ in range(9)],
-            [INITIAL_COLORS[Face.L] for _ in range(9)],
-            [INITIAL_COLORS[Face.R] for _ in range(9)],
-            [INITIAL_COLORS[Face.U] for _ in range(9)],
-            [INITIAL_COLORS[Face.D] for _ in range(9)],
-        ]
-        self.indices = [
-            [(Face.F, Pos(i)) for i in range(9)],
-            [(Face.B, Pos(i)) for i in range(9)],
-            [(Face.L, Pos(i)) for i in range(9)],
-            [(Face.R, Pos(i)) for i in range(9)],
-            [(Face.U, Pos(i)) for i in range(9)],
-            [(Face.D, Pos(i)) for i in range(9)],
-        ]
+        self.state = np.arange(N_POSITIONS, dtype=np.uint8)
         return self
 
+    @property
+    def faces(self):
+        """Nested list of sticker colors, indexed by [Face][Pos]"""
+        colors = STICKER_COLORS[self.state].tolist()
+        return [colors[face * len(Pos):(face + 1) * len(Pos)] for face in Face]
+
+    @property
+    def indices(self):
+        """Nested list of original sticker positions, indexed by [Face][Pos]"""
+        positions = [POSITIONS[i] for i in self.state]
+        return [positions[face * len(Pos):(face + 1) * len(Pos)] for face in Face]
+
     def __len__(self):
-        return len(Face) * (len(Pos) - 1) # skip middle squares
+        return len(NON_CENTER_POSITIONS) # skip middle squares
 
     def __getitem__(self, key):
         if key >= len(self):
             raise IndexError('cube index out of range')
-        n_positions = len(Pos) - 1
-        face = key // n_positions
-        index = key % n_positions
-        position = index if index < Pos.M else index+1 # skip middle squares
-        return self.faces[Face(face)][Pos(position)]
+        return STICKER_COLORS[self.state[NON_CENTER_POSITIONS[key]]]
 
     def __iter__(self):
-        iter_face = 0
-        iter_pos = 0
-        while iter_face < len(Face):
-            yield self.faces[Face(iter_face)][Pos(iter_pos)]
-            iter_pos = (iter_pos+1)%len(Pos)
-            if iter_pos == Pos.M: # skip middle squares
-                iter_pos += 1
-            if iter_pos == 0:
-                iter_face += 1
+        return iter(STICKER_COLORS[self.state[NON_CENTER_POSITIONS]].tolist())
+
+    def all_atoms(self):
+        """Set of every possible (position, color) atom, matching enumerate(self)"""
+        colors = set(INITIAL_COLORS.values())
+        return set((pos, color) for pos in range(len(self)) for color in colors)
+
+    @property
+    def state(self):
+        """Array of sticker ids, indexed by position id"""
+        return self._state
+
+    @state.setter
+    def state(self, value):
+        self._state = value
+        self._key = None
+
+    @property
+    def key(self):
+        """Compact canonical key for the Cube's state, cached until the state changes"""
+        if self._key is None:
+            self._key = self._state.tobytes()
+        return self._key
+
+    def __deepcopy__(self, memo):
+        result = Cube.__new__(Cube)
+        result.sequence = list(self.sequence)
+        result._state = self._state.copy()
+        result._key = self._key
+        return result
+
+    def __getstate__(self):
+        return {'sequence': self.sequence, 'state': self.state}
+
+    def __setstate__(self, state):
+        self.sequence = state['sequence']
+        if 'indices' in state:
+            # Convert Cubes pickled with the older nested-list representation
+            ids = [face * len(Pos) + pos for row in state['indices'] for (face, pos) in row]
+            self.state = np.asarray(ids, dtype=np.uint8)
+        else:
+            self.state = state['state']
 
     def transform(self, action):
         """Transform the Cube with a single quarter-turn action"""
-        face, is_inverted = ACTION_MAP[action]
-        swaps = get_position_swaps(face)
-
-        # Since swaps are implemented w.r.t the 2-D render diagram, half of them need to be flipped
-        need_flip = (face in [Face.B, Face.L, Face.D])
-        if (need_flip and not is_inverted) or (is_inverted and not need_flip):
-            swaps = get_inverse_swaps(swaps)
-        self.apply(swap_list=swaps)
+        self.state = self.state[ACTION_PERMUTATIONS[action]]
         return self
 
-    def apply(self, sequence=None, swap_list=None):
-        """Apply a sequence of actions or a swap_list to transform the Cube"""
-        assert sequence is not None or swap_list is not None
-        if swap_list is not None:
-            cube_copy = copy.deepcopy(self)
-            for ((start_face,start_pos), (end_face,end_pos)) in swap_list:
-                self.faces[end_face][end_pos] = cube_copy.faces[start_face][start_pos]
-                self.indices[end_face][end_pos] = cube_copy.indices[start_face][start_pos]
+    def apply(self, sequence=None, swap_list=None, permutation=None):
+        """Apply a sequence of actions, a swap_list, or an index permutation to transform the Cube
+
+        Permutations can be compiled from swap_lists ahead of time using get_permutation().
+        """
+        assert sequence is not None or swap_list is not None or permutation is not None
+        if permutation is not None:
+            self.state = self.state[permutation]
+        elif swap_list is not None:
+            self.state = self.state[get_permutation(swap_list)]
         elif sequence is not None:
             for action in sequence:
                 self.transform(action)
@@ -277,6 +337,64 @@ class Cube:
             self.sequence += sequence
         return self
 
+    def expand(self, permutations, goal=None, changed_positions=None):
+        """Apply each of a stack of index permutations to the Cube in a single batch
+
+        Args:
+            permutations (numpy.ndarray):
+                An (m, N_POSITIONS) array of index permutations, one per macro-action
+            goal (Cube, optional):
+                The Cube to compare successors against. Defaults to the solved Cube.
+            changed_positions (numpy.ndarray, optional):
+                The positions each permutation changes (see domains.effects). If given,
+                goal counts are computed incrementally with goal_count_delta().
+
+        Returns:
+            A (states, goal_counts) tuple, where states is an (m, N_POSITIONS) array of
+            successor states, and goal_counts[i] is the number of positions that differ
+            from the goal, i.e. len(successor.summarize_effects(baseline=goal)).
+        """
+        states = self.state[permutations]
+        goal_state = np.arange(N_POSITIONS) if goal is None else goal.state
+        if changed_positions is None:
+            goal_counts = np.count_nonzero(states != goal_state, axis=1)
+        else:
+            goal_count = np.count_nonzero(self.state != goal_state)
+            goal_counts = goal_count + self.goal_count_delta(permutations, changed_positions, goal)
+        return states, goal_counts
+
+    def goal_count_delta(self, permutations, changed_positions, goal=None):
+        """Compute how applying each permutation changes the number of positions that
+        differ from the goal, looking only at the positions each permutation changes
+
+        Adding the result to the current goal count gives each successor's goal count
+        without building the successor states.
+
+        Args:
+            permutations (numpy.ndarray):
+                An (m, N_POSITIONS) array of index permutations
+            changed_positions (numpy.ndarray):
+                The positions each permutation changes (see domains.effects)
+            goal (Cube, optional):
+                The Cube to compare against. Defaults to the solved Cube.
+
+        Returns:
+            An array of m (possibly negative) differences in goal count
+        """
+        goal_state = np.arange(N_POSITIONS) if goal is None else goal.state
+        targets = goal_state[changed_positions]
+        sources = np.take_along_axis(permutations, changed_positions, axis=1)
+        before = np.count_nonzero(self.state[changed_positions] != targets, axis=1)
+        after = np.count_nonzero(self.state[sources] != targets, axis=1)
+        return after - before
+
+    def child(self, state):
+        """Return a copy of the Cube with its state replaced, e.g. by a row from expand()"""
+        result = Cube.__new__(Cube)
+        result.sequence = list(self.sequence)
+        result.state = state
+        return result
+
     def scramble(self, length=60):
         """Scramble the Cube with randomly selected actions
 
@@ -287,10 +405,10 @@ class Cube:
         return self
 
     def __hash__(self):
-        return hash(repr((self.faces, self.indices)))
+        return hash(self.key)
 
     def __eq__(self, another):
-        return self.faces == another.faces
+        return self.key == another.key
 
     def __ne__(self, another):
         return not self.__eq__(another)
@@ -350,43 +468,44 @@ class Cube:
         # The unnamed placeholders are each replaced with the appropriate CubeColor
         # code for the sticker at that position. The named placeholders are wider,
         # so we fill them with 6 repeated copies of their CubeColor code.
+        faces = self.faces
         diagram = outline.format(
-            self.faces[Face.L][Pos.NE], self.faces[Face.R][Pos.NE],
-            self.faces[Face.L][Pos.NE], self.faces[Face.R][Pos.NE],
-            self.faces[Face.L][Pos.N], self.faces[Face.R][Pos.N],
-            self.faces[Face.L][Pos.N], self.faces[Face.L][Pos.E],
-            self.faces[Face.R][Pos.N], self.faces[Face.R][Pos.E],
-            self.faces[Face.L][Pos.NW], self.faces[Face.L][Pos.E],
-            self.faces[Face.R][Pos.NW], self.faces[Face.R][Pos.E],
-            self.faces[Face.L][Pos.NW], self.faces[Face.L][Pos.M],
-            self.faces[Face.R][Pos.NW], self.faces[Face.R][Pos.M],
-            self.faces[Face.L][Pos.M], self.faces[Face.L][Pos.SE],
-            self.faces[Face.R][Pos.M], self.faces[Face.R][Pos.SE],
-            self.faces[Face.L][Pos.W], self.faces[Face.L][Pos.SE],
-            self.faces[Face.R][Pos.W], self.faces[Face.R][Pos.SE],
-            self.faces[Face.L][Pos.W], self.faces[Face.L][Pos.S],
-            self.faces[Face.R][Pos.W], self.faces[Face.R][Pos.S],
-            self.faces[Face.L][Pos.S], self.faces[Face.R][Pos.S],
-            self.faces[Face.L][Pos.SW], self.faces[Face.R][Pos.SW],
-            self.faces[Face.L][Pos.SW], self.faces[Face.R][Pos.SW],
-            B_NW=self.faces[Face.B][Pos.NW]*6, B__N=self.faces[Face.B][Pos.N]*6,
-            B_NE=self.faces[Face.B][Pos.NE]*6, B__W=self.faces[Face.B][Pos.W]*6,
-            B__M=self.faces[Face.B][Pos.M]*6, B__E=self.faces[Face.B][Pos.E]*6,
-            B_SW=self.faces[Face.B][Pos.SW]*6, B__S=self.faces[Face.B][Pos.S]*6,
-            B_SE=self.faces[Face.B][Pos.SE]*6, U_NW=self.faces[Face.U][Pos.NW]*6,
-            U__N=self.faces[Face.U][Pos.N]*6, U_NE=self.faces[Face.U][Pos.NE]*6,
-            U__W=self.faces[Face.U][Pos.W]*6, U__M=self.faces[Face.U][Pos.M]*6,
-            U__E=self.faces[Face.U][Pos.E]*6, U_SW=self.faces[Face.U][Pos.SW]*6,
-            U__S=self.faces[Face.U][Pos.S]*6, U_SE=self.faces[Face.U][Pos.SE]*6,
-            F_NW=self.faces[Face.F][Pos.NW]*6, F__N=self.faces[Face.F][Pos.N]*6,
-            F_NE=self.faces[Face.F][Pos.NE]*6, F__W=self.faces[Face.F][Pos.W]*6,
-            F__M=self.faces[Face.F][Pos.M]*6, F__E=self.faces[Face.F][Pos.E]*6,
-            F_SW=self.faces[Face.F][Pos.SW]*6, F__S=self.faces[Face.F][Pos.S]*6,
-            F_SE=self.faces[Face.F][Pos.SE]*6, D_NW=self.faces[Face.D][Pos.NW]*6,
-            D__N=self.faces[Face.D][Pos.N]*6, D_NE=self.faces[Face.D][Pos.NE]*6,
-            D__W=self.faces[Face.D][Pos.W]*6, D__M=self.faces[Face.D][Pos.M]*6,
-            D__E=self.faces[Face.D][Pos.E]*6, D_SW=self.faces[Face.D][Pos.SW]*6,
-            D__S=self.faces[Face.D][Pos.S]*6, D_SE=self.faces[Face.D][Pos.SE]*6,
+            faces[Face.L][Pos.NE], faces[Face.R][Pos.NE],
+            faces[Face.L][Pos.NE], faces[Face.R][Pos.NE],
+            faces[Face.L][Pos.N], faces[Face.R][Pos.N],
+            faces[Face.L][Pos.N], faces[Face.L][Pos.E],
+            faces[Face.R][Pos.N], faces[Face.R][Pos.E],
+            faces[Face.L][Pos.NW], faces[Face.L][Pos.E],
+            faces[Face.R][Pos.NW], faces[Face.R][Pos.E],
+            faces[Face.L][Pos.NW], faces[Face.L][Pos.M],
+            faces[Face.R][Pos.NW], faces[Face.R][Pos.M],
+            faces[Face.L][Pos.M], faces[Face.L][Pos.SE],
+            faces[Face.R][Pos.M], faces[Face.R][Pos.SE],
+            faces[Face.L][Pos.W], faces[Face.L][Pos.SE],
+            faces[Face.R][Pos.W], faces[Face.R][Pos.SE],
+            faces[Face.L][Pos.W], faces[Face.L][Pos.S],
+            faces[Face.R][Pos.W], faces[Face.R][Pos.S],
+            faces[Face.L][Pos.S], faces[Face.R][Pos.S],
+            faces[Face.L][Pos.SW], faces[Face.R][Pos.SW],
+            faces[Face.L][Pos.SW], faces[Face.R][Pos.SW],
+            B_NW=faces[Face.B][Pos.NW]*6, B__N=faces[Face.B][Pos.N]*6,
+            B_NE=faces[Face.B][Pos.NE]*6, B__W=faces[Face.B][Pos.W]*6,
+            B__M=faces[Face.B][Pos.M]*6, B__E=faces[Face.B][Pos.E]*6,
+            B_SW=faces[Face.B][Pos.SW]*6, B__S=faces[Face.B][Pos.S]*6,
+            B_SE=faces[Face.B][Pos.SE]*6, U_NW=faces[Face.U][Pos.NW]*6,
+            U__N=faces[Face.U][Pos.N]*6, U_NE=faces[Face.U][Pos.NE]*6,
+            U__W=faces[Face.U][Pos.W]*6, U__M=faces[Face.U][Pos.M]*6,
+            U__E=faces[Face.U][Pos.E]*6, U_SW=faces[Face.U][Pos.SW]*6,
+            U__S=faces[Face.U][Pos.S]*6, U_SE=faces[Face.U][Pos.SE]*6,
+            F_NW=faces[Face.F][Pos.NW]*6, F__N=faces[Face.F][Pos.N]*6,
+            F_NE=faces[Face.F][Pos.NE]*6, F__W=faces[Face.F][Pos.W]*6,
+            F__M=faces[Face.F][Pos.M]*6, F__E=faces[Face.F][Pos.E]*6,
+            F_SW=faces[Face.F][Pos.SW]*6, F__S=faces[Face.F][Pos.S]*6,
+            F_SE=faces[Face.F][Pos.SE]*6, D_NW=faces[Face.D][Pos.NW]*6,
+            D__N=faces[Face.D][Pos.N]*6, D_NE=faces[Face.D][Pos.NE]*6,
+            D__W=faces[Face.D][Pos.W]*6, D__M=faces[Face.D][Pos.M]*6,
+            D__E=faces[Face.D][Pos.E]*6, D_SW=faces[Face.D][Pos.SW]*6,
+            D__S=faces[Face.D][Pos.S]*6, D_SE=faces[Face.D][Pos.SE]*6,
         )
 
         # If we are using color, replace the CubeColor codes with their
@@ -413,10 +532,29 @@ class Cube:
         Returns:
             A tuple of position swaps ((StartFace, StartPos), (EndFace, EndPos))
         """
-        if not baseline:
+        if baseline is None:
             baseline = Cube()
-        src_indices = [idx for face in baseline.indices for idx in face]
-        dst_indices = [idx for face in self.indices for idx in face]
-        swap_list = list(zip(dst_indices, src_indices))
-        swap_list = tuple([swap for swap in swap_list if swap[0] != swap[1]])
+        changed = np.flatnonzero(self.state != baseline.state)
+        swap_list = tuple([(POSITIONS[self.state[i]], POSITIONS[baseline.state[i]])
+                           for i in changed])
         return swap_list
+
+def expand_all(cubes, permutations, goal=None):
+    """Apply each of a stack of index permutations to each of a list of Cubes in one batch
+
+    Args:
+        cubes (list):
+            The Cubes to expand
+        permutations (numpy.ndarray):
+            An (m, N_POSITIONS) array of index permutations, one per macro-action
+        goal (Cube, optional):
+            The Cube to compare successors against. Defaults to the solved Cube.
+
+    Returns:
+        A (states, goal_counts) tuple of (k, m, N_POSITIONS) and (k, m) arrays, where row i
+        matches cubes[i].expand(permutations, goal)
+    """
+    states = np.stack([cube.state for cube in cubes])[:, permutations]
+    goal_state = np.arange(N_POSITIONS) if goal is None else goal.state
+    goal_counts = np.count_nonzero(states != goal_state, axis=2)
+    return states, goal_counts
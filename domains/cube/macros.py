@@ -2,18 +2,38 @@ import pickle
 import random as pyrandom
 import warnings
 
-from domains import cube
+from domains import cache, cube
 from domains.cube import formula
 
-class primitive:  # pylint: disable=R0903,C0103
-    """Namespace for primitive actions and their corresponding models"""
-    alg_formulas = [[a] for a in cube.ACTIONS]
-    actions = alg_formulas
-    models = [cube.Cube().apply(sequence=a).summarize_effects() for a in actions]
+def _build_models(macros):
+    cubes = [cube.Cube().apply(sequence=macro) for macro in macros]
+    models = [cube_.summarize_effects() for cube_ in cubes]
+    # Applying a macro to the solved Cube leaves its index permutation as the state
+    permutations = [cube_.state for cube_ in cubes]
+    return models, permutations
 
-class expert:  # pylint: disable=R0903,C0103
-    """Namespace for expert macro-actions and their corresponding models"""
-    alg_formulas = [
+def build_models(macros):
+    """Build the effect models and compiled index permutations for a list of macro-actions
+
+    Results are cached on disk, keyed by the content of the macro-actions.
+
+    Returns:
+        A (models, permutations) tuple of lists, with one entry per macro-action
+    """
+    return cache.cached('cube-models', macros, _build_models)
+
+def load_primitive_actions():
+    """Build the set of primitive actions"""
+    primitive.alg_formulas = [[a] for a in cube.ACTIONS]
+    primitive.actions = primitive.alg_formulas
+    primitive.models, primitive.permutations = build_models(primitive.actions)
+
+primitive = cache.LazyNamespace(load_primitive_actions,
+                                'Namespace for primitive actions and their corresponding models')
+
+def load_expert_macros():
+    """Build the set of expert macro-actions"""
+    expert.alg_formulas = [
         formula.R_PERMUTATION,
         formula.SWAP_3_EDGES_FACE,
         formula.SWAP_3_EDGES_MID,
@@ -21,11 +41,11 @@ class expert:  # pylint: disable=R0903,C0103
         formula.ORIENT_2_EDGES,
         formula.ORIENT_2_CORNERS,
     ]
-    macros = [variation for f in alg_formulas for variation in formula.variations(f)]
-    models = [cube.Cube().apply(sequence=macro).summarize_effects() for macro in macros]
+    expert.macros = [variation for f in expert.alg_formulas for variation in formula.variations(f)]
+    expert.models, expert.permutations = build_models(expert.macros)
 
-class learned:  # pylint: disable=R0903,C0103
-    """Namespace for learned macro-actions and their corresponding models"""
+expert = cache.LazyNamespace(load_expert_macros,
+                             'Namespace for expert macro-actions and their corresponding models')
 
 def load_learned_macros():
     """Load the set of learned macro-actions"""
@@ -38,16 +58,15 @@ def load_learned_macros():
         warnings.warn('Failed to load learned macros from file {}'.format(filename))
         _macros = []
 
-    _models = [cube.Cube().apply(sequence=macro).summarize_effects() for macro in _macros]
+    _models, _permutations = build_models(_macros)
 
     global learned  # pylint: disable=W0601,C0103
     learned.macros = _macros
     learned.models = _models
+    learned.permutations = _permutations
 
-load_learned_macros()
-
-class random:  # pylint: disable=R0903,C0103
-    """Namespace for randomly generated macro-actions and their corresponding models"""
+learned = cache.LazyNamespace(load_learned_macros,
+                              'Namespace for learned macro-actions and their corresponding models')
 
 def generate_random_macro_set(seed):
     """Generate a new set of random macro-actions using the given random seed"""
@@ -59,15 +78,18 @@ def generate_random_macro_set(seed):
     _macros = [variation
                for formula_ in random_formulas
                for variation in formula.variations(formula.simplify(formula_))]
-    _models = [cube.Cube().apply(sequence=macro).summarize_effects() for macro in _macros]
+    _models, _permutations = build_models(_macros)
 
     global random  # pylint: disable=W0601,C0103
     random.seed = seed
     random.alg_formulas = random_formulas
     random.macros = _macros
     random.models = _models
+    random.permutations = _permutations
 
-generate_random_macro_set(0)
+random = cache.LazyNamespace(lambda: generate_random_macro_set(0),
+                             'Namespace for randomly generated macro-actions and their '
+                             'corresponding models')
 
 def test():
     """Test generating macros"""
@@ -0,0 +1,242 @@
+import argparse
+import math
+import os
+
+import numpy as np
+
+from domains.cube.cube import Cube, Face, Pos, ACTIONS, ACTION_PERMUTATIONS, N_POSITIONS
+
+PDB_DIR = 'results/pdb/'
+UNVISITED = 0xF
+
+def get_cubie_slots():
+    """Group the sticker positions into corner and edge cubie slots
+
+    Each slot is identified by the set of faces whose quarter turns move its positions.
+    Within a slot, positions are ordered starting with the reference position: the one
+    on the U or D face if there is one, otherwise the one on the F or B face.
+
+    Returns:
+        A dict mapping 'corner' and 'edge' to an (n_slots, n_positions_per_slot) array of
+        position ids
+    """
+    moved_by = {pos: set() for pos in range(N_POSITIONS)}
+    for action in ACTIONS:
+        face = Face[action[0]]
+        permutation = ACTION_PERMUTATIONS[action]
+        for pos in np.flatnonzero(permutation != np.arange(N_POSITIONS)):
+            moved_by[int(pos)].add(face)
+
+    groups = {}
+    for pos, faces in moved_by.items():
+        groups.setdefault(tuple(sorted(faces)), []).append(pos)
+
+    def reference_order(pos):
+        face = pos // len(Pos)
+        return (face not in (Face.U, Face.D), face not in (Face.F, Face.B), pos)
+
+    slots = {'corner': [], 'edge': []}
+    for faces in sorted(groups):
+        cubie_type = {3: 'corner', 2: 'edge'}.get(len(faces))
+        if cubie_type is not None:
+            slots[cubie_type].append(sorted(groups[faces], key=reference_order))
+    return {cubie_type: np.asarray(slot_list) for cubie_type, slot_list in slots.items()}
+
+CUBIE_SLOTS = get_cubie_slots()
+
+# Default patterns: (cubie type, pattern cubies), where cubies are numbered by home slot
+PATTERNS = {
+    'corners': ('corner', tuple(range(8))),
+    'edges-a': ('edge', tuple(range(6))),
+    'edges-b': ('edge', tuple(range(6, 12))),
+}
+
+def n_arrangements(n, k):
+    """Return the number of ways to place k distinct cubies in n slots, i.e. n!/(n-k)!"""
+    return math.factorial(n) // math.factorial(n - k)
+
+class PatternAbstraction:
+    """Abstraction of the Cube onto the locations and orientations of a subset of cubies
+
+    Abstract states are ranked as a partial permutation of the pattern cubies' slots,
+    followed by their orientations, giving a dense index in [0, size).
+
+    Args:
+        cubie_type (str):
+            Either 'corner' or 'edge'
+        cubies (tuple):
+            The pattern cubies, identified by the index of their home slot
+    """
+    def __init__(self, cubie_type, cubies):
+        self.cubie_type = cubie_type
+        self.cubies = tuple(cubies)
+        self.slots = CUBIE_SLOTS[cubie_type]
+        self.n_slots, self.n_orientations = self.slots.shape
+        self.k = len(self.cubies)
+        # Reference sticker id of each pattern cubie (sticker ids are home positions)
+        self.references = self.slots[list(self.cubies), 0]
+        self.slot_of = np.full(N_POSITIONS, -1, dtype=np.int64)
+        self.orientation_of = np.full(N_POSITIONS, -1, dtype=np.int64)
+        for slot, positions in enumerate(self.slots):
+            self.slot_of[positions] = slot
+            self.orientation_of[positions] = np.arange(self.n_orientations)
+        # Mixed-radix place values for ranking
+        self.perm_weights = np.asarray([n_arrangements(self.n_slots - 1 - i, self.k - 1 - i)
+                                        for i in range(self.k)], dtype=np.int64)
+        self.orientation_weights = self.n_orientations ** np.arange(self.k, dtype=np.int64)
+        self.n_orientation_states = self.n_orientations ** self.k
+        self.size = n_arrangements(self.n_slots, self.k) * self.n_orientation_states
+        # Where each position's sticker ends up under each primitive action
+        self.move_tables = np.stack([np.argsort(ACTION_PERMUTATIONS[action])
+                                     for action in ACTIONS]).astype(np.int64)
+
+    @property
+    def name(self):
+        return '{}-{}'.format(self.cubie_type, '_'.join(map(str, self.cubies)))
+
+    def rank(self, positions):
+        """Rank an (m, k) array of reference sticker positions, returning m indices"""
+        slots = self.slot_of[positions]
+        orientations = self.orientation_of[positions]
+        digits = slots.copy()
+        for i in range(1, self.k):
+            digits[:, i] -= np.count_nonzero(slots[:, :i] < slots[:, i:i+1], axis=1)
+        perm_rank = digits @ self.perm_weights
+        return perm_rank * self.n_orientation_states + orientations @ self.orientation_weights
+
+    def unrank(self, indices):
+        """Convert an array of m indices to an (m, k) array of reference sticker positions"""
+        perm_rank, orientation_rank = np.divmod(indices, self.n_orientation_states)
+        available = np.ones((len(indices), self.n_slots), dtype=bool)
+        rows = np.arange(len(indices))
+        positions = np.empty((len(indices), self.k), dtype=np.int64)
+        for i in range(self.k):
+            digit = (perm_rank // self.perm_weights[i]) % (self.n_slots - i)
+            slot = np.argmax(np.cumsum(available, axis=1) > digit[:, None], axis=1)
+            available[rows, slot] = False
+            orientation = (orientation_rank // self.orientation_weights[i]) % self.n_orientations
+            positions[:, i] = self.slots[slot, orientation]
+        return positions
+
+    def abstract(self, states, goal=None):
+        """Return the reference sticker positions for an (m, N_POSITIONS) array of states
+
+        If a goal Cube is given, states are first relabeled so that the goal looks solved.
+        """
+        states = np.atleast_2d(states)
+        targets = self.references if goal is None else goal.state[self.references]
+        inverse = np.empty(states.shape, dtype=np.int64)
+        inverse[np.arange(len(states))[:, None], states] = np.arange(N_POSITIONS)
+        return inverse[:, targets]
+
+    def build(self, quiet=False):
+        """Compute the distance from the solved Cube to every abstract state by breadth-first
+        search, returning an unpacked uint8 array with UNVISITED for unreachable states"""
+        distances = np.full(self.size, UNVISITED, dtype=np.uint8)
+        # The frontier is kept as reference sticker positions, so it never needs unranking
+        frontier = self.abstract(Cube().state).astype(np.uint8)
+        distances[self.rank(frontier)] = 0
+        move_tables = self.move_tables.astype(np.uint8)
+        depth = 0
+        while len(frontier):
+            if not quiet:
+                print('{}: depth {} has {} states'.format(self.name, depth, len(frontier)))
+            depth += 1
+            children = []
+            for chunk in np.array_split(frontier, max(1, len(frontier) // 2**20)):
+                for move_table in move_tables:
+                    child = move_table[chunk]
+                    indices = self.rank(child)
+                    is_new = distances[indices] == UNVISITED
+                    # Mark new states right away, so the frontier never holds duplicates
+                    indices, first = np.unique(indices[is_new], return_index=True)
+                    distances[indices] = depth
+                    children.append(child[is_new][first])
+            frontier = np.concatenate(children)
+            assert depth < UNVISITED or not len(frontier), 'Depth overflows a nibble'
+        return distances
+
+def pack(distances):
+    """Pack an array of 4-bit values into bytes, two per byte (low nibble first)"""
+    if len(distances) % 2:
+        distances = np.append(distances, UNVISITED).astype(np.uint8)
+    return distances[0::2] | (distances[1::2] << 4)
+
+def lookup(table, indices):
+    """Look up 4-bit values at the given indices in a nibble-packed table"""
+    return (table[indices >> 1] >> ((indices & 1) << 2).astype(np.uint8)) & 0xF
+
+def get_pdb_path(abstraction):
+    """Return the path of the pattern database file for the given abstraction"""
+    return os.path.join(PDB_DIR, abstraction.name + '.npy')
+
+def build_pdb(abstraction, quiet=False):
+    """Build a pattern database and save it to disk (see get_pdb_path)"""
+    table = pack(abstraction.build(quiet=quiet))
+    path = get_pdb_path(abstraction)
+    os.makedirs(PDB_DIR, exist_ok=True)
+    tmp_path = '{}.{}.tmp.npy'.format(path[:-len('.npy')], os.getpid())
+    np.save(tmp_path, table)
+    os.replace(tmp_path, path)
+    return path
+
+def load_pdb(abstraction, quiet=False):
+    """Memory-map a pattern database, building it first if necessary
+
+    The table is opened read-only, so worker processes share one copy via the page cache.
+    """
+    path = get_pdb_path(abstraction)
+    if not os.path.exists(path):
+        build_pdb(abstraction, quiet=quiet)
+    return np.load(path, mmap_mode='r')
+
+class PDBHeuristic:
+    """Pattern database heuristic for the Cube
+
+    The heuristic value is the maximum over the pattern databases of the number of
+    quarter turns needed to solve each pattern, so it is admissible for primitive actions
+    (but not for macro-actions with unit cost).
+
+    Args:
+        patterns (list):
+            Pattern names (see PATTERNS) or (cubie_type, cubies) tuples
+        goal (Cube, optional):
+            The goal Cube. Defaults to the solved Cube.
+        quiet (bool):
+            Whether to suppress progress output if a pattern database needs to be built
+    """
+    def __init__(self, patterns=('corners', 'edges-a', 'edges-b'), goal=None, quiet=False):
+        patterns = [PATTERNS.get(pattern, pattern) for pattern in patterns]
+        self.abstractions = [PatternAbstraction(*pattern) for pattern in patterns]
+        self.tables = [load_pdb(abstraction, quiet=quiet) for abstraction in self.abstractions]
+        self.goal = goal
+
+    def batch(self, states):
+        """Return the heuristic values for an (m, N_POSITIONS) array of states"""
+        values = [lookup(table, abstraction.rank(abstraction.abstract(states, self.goal)))
+                  for abstraction, table in zip(self.abstractions, self.tables)]
+        return np.max(values, axis=0)
+
+    def __call__(self, cube):
+        return int(self.batch(cube.state)[0])
+
+def parse_args():
+    """Parse input arguments
+
+    Use --help to see a pretty description of the arguments
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--patterns', type=str, nargs='+', default=list(PATTERNS),
+                        choices=list(PATTERNS), help='Which pattern databases to build')
+    return parser.parse_args()
+
+def main():
+    """Build pattern databases from the command line"""
+    args = parse_args()
+    for pattern in args.patterns:
+        abstraction = PatternAbstraction(*PATTERNS[pattern])
+        print('Building {} ({} entries)...'.format(pattern, abstraction.size))
+        print('Saved', build_pdb(abstraction))
+
+if __name__ == '__main__':
+    main()
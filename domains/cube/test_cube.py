@@ -1,4 +1,11 @@
-from domains.cube import Cube, pattern
+import copy
+import tempfile
+
+import numpy as np
+
+from domains.cube import Cube, pattern, pdb
+from domains.cube.cube import ACTIONS, get_permutation, expand_all
+from domains.effects import get_changed_positions
 
 def test_cube():
     """Test Cube functionality"""
@@ -23,7 +30,90 @@ def test_cube():
     assert hash(other_cube) == hash(solved_cube)
     assert isinstance(other_cube.summarize_effects(), tuple)
     assert other_cube.summarize_effects() == tuple()
+
+    # Compiled permutations have the same effect as the corresponding swap lists
+    scrambled = Cube().apply(pattern.SCRAMBLE_1)
+    swap_list = Cube().apply(pattern.CUBE_IN_CUBE).summarize_effects()
+    permutation = get_permutation(swap_list)
+    assert (copy.deepcopy(scrambled).apply(permutation=permutation)
+            == copy.deepcopy(scrambled).apply(swap_list=swap_list))
+    assert (Cube().apply(permutation=permutation).summarize_effects() == swap_list)
+
+    # Batch expansion matches applying each permutation to a copy
+    goal = Cube().apply(pattern.SUPERFLIP_QTM)
+    permutations = np.stack([Cube().apply([action]).state for action in ACTIONS])
+    states, goal_counts = scrambled.expand(permutations, goal=goal)
+    for state, goal_count, action in zip(states, goal_counts, ACTIONS):
+        expected = copy.deepcopy(scrambled).apply([action])
+        assert scrambled.child(state) == expected
+        assert goal_count == len(expected.summarize_effects(baseline=goal))
+
+    # Incremental goal counts only look at the positions each permutation changes
+    permutations = np.concatenate([permutations, permutation[None], np.arange(54)[None]])
+    changed_positions = get_changed_positions(permutations != np.arange(54))
+    assert changed_positions.shape == (len(permutations), len(swap_list))
+    states, goal_counts = scrambled.expand(permutations, goal=goal)
+    goal_count = len(scrambled.summarize_effects(baseline=goal))
+    deltas = scrambled.goal_count_delta(permutations, changed_positions, goal)
+    assert np.all(goal_count + deltas == goal_counts)
+    incremental_states, incremental_goal_counts = scrambled.expand(
+        permutations, goal=goal, changed_positions=changed_positions)
+    assert np.all(incremental_states == states)
+    assert np.all(incremental_goal_counts == goal_counts)
+
+    # Expanding several Cubes at once matches expanding each of them
+    all_states, all_goal_counts = expand_all([scrambled, goal], permutations, goal=goal)
+    for row, cube_ in enumerate([scrambled, goal]):
+        states, goal_counts = cube_.expand(permutations, goal=goal)
+        assert np.all(all_states[row] == states) and np.all(all_goal_counts[row] == goal_counts)
     print('All tests passed.')
 
+def test_pattern_database():
+    """Test pattern databases against a reference breadth-first search over abstract states"""
+    assert pdb.CUBIE_SLOTS['corner'].shape == (8, 3)
+    assert pdb.CUBIE_SLOTS['edge'].shape == (12, 2)
+    for cubie_type, cubies in [('corner', (0, 5)), ('edge', (1, 4))]:
+        abstraction = pdb.PatternAbstraction(cubie_type, cubies)
+        indices = np.arange(abstraction.size)
+        assert np.all(abstraction.rank(abstraction.unrank(indices)) == indices)
+
+        # Reference search, using the full Cube simulator
+        def abstract(cube):
+            return tuple(abstraction.abstract(cube.state)[0])
+        distances = {abstract(Cube()): 0}
+        frontier = [Cube()]
+        while frontier:
+            next_frontier = []
+            for cube in frontier:
+                for action in ACTIONS:
+                    child = copy.deepcopy(cube).transform(action)
+                    if abstract(child) not in distances:
+                        distances[abstract(child)] = distances[abstract(cube)] + 1
+                        next_frontier.append(child)
+            frontier = next_frontier
+        assert len(distances) == abstraction.size
+        table = pdb.pack(abstraction.build(quiet=True))
+        positions = np.asarray(list(distances.keys()))
+        assert np.all(pdb.lookup(table, abstraction.rank(positions)) == list(distances.values()))
+
+    old_pdb_dir = pdb.PDB_DIR
+    with tempfile.TemporaryDirectory() as pdb.PDB_DIR:
+        patterns = [('corner', (0, 1, 2)), ('edge', (0, 1, 2))]
+        heuristic = pdb.PDBHeuristic(patterns, quiet=True)
+        assert isinstance(pdb.load_pdb(heuristic.abstractions[0]), np.memmap)
+        assert heuristic(Cube()) == 0
+        assert 0 < heuristic(Cube().apply(['R', 'U', "F'"])) <= 3
+        # Relative to a goal, the goal looks solved
+        goal = Cube().apply(pattern.scramble(1))
+        goal_heuristic = pdb.PDBHeuristic(patterns, goal=goal, quiet=True)
+        assert goal_heuristic(goal) == 0
+        for sequence in [['R'], ['R', 'U', "F'"], pattern.scramble(2)]:
+            cube = copy.deepcopy(goal).apply(sequence)
+            assert goal_heuristic(cube) == heuristic(Cube().apply(sequence))
+            states = np.stack([cube.state, goal.state])
+            assert np.all(goal_heuristic.batch(states) == [goal_heuristic(cube), 0])
+    pdb.PDB_DIR = old_pdb_dir
+
 if __name__ == '__main__':
     test_cube()
+    test_pattern_database()
@@ -0,0 +1,18 @@
+import numpy as np
+
+def get_changed_positions(changed):
+    """Return the positions changed by each of a stack of effects
+
+    Rows are padded with unchanged positions up to the largest number of changed
+    positions, so every row has the same length and the padding never affects deltas.
+
+    Args:
+        changed (numpy.ndarray):
+            An (m, n) boolean array, where changed[i, j] says whether effect i changes
+            position j, e.g. permutations != np.arange(n), or diffs != 0
+
+    Returns:
+        An (m, k) array of position indices, where k is the largest number of changed positions
+    """
+    k = max(1, int(np.count_nonzero(changed, axis=-1).max()))
+    return np.argsort(~changed, axis=-1, kind='stable')[..., :k]
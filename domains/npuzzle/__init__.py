@@ -1,2 +1,2 @@
 __all__ = ['npuzzle', 'macros']
-from .npuzzle import NPuzzle
+from .npuzzle import NPuzzle, get_permutation, expand_all
@@ -5,10 +5,30 @@ import warnings
 
 import numpy as np
 
-from domains import npuzzle
+from domains import cache, npuzzle
 
-class learned:
-    """Namespace for learned macro-actions and their corresponding models"""
+def build_permutations(models):
+    """Compile the effect models for each blank index into index permutations"""
+    return {blank_idx: [npuzzle.get_permutation(swap_list, n_positions=16)
+                        for (swap_list, _) in model_list]
+            for blank_idx, model_list in models.items()}
+
+def _build_models(macros):
+    models = {}
+    for blank_idx, sequences in macros.items():
+        puzzle = npuzzle.NPuzzle(n=15, start_blank=blank_idx)
+        models[blank_idx] = [copy.deepcopy(puzzle)
+                             .apply_macro(macro)
+                             .summarize_effects(baseline=puzzle)
+                             for macro in sequences]
+    return models
+
+def build_models(macros):
+    """Build the effect models for the macro-actions at each blank index
+
+    Results are cached on disk, keyed by the content of the macro-actions.
+    """
+    return cache.cached('npuzzle-models', macros, _build_models)
 
 def load_learned_macros():
     """Load the set of learned macro-actions"""
@@ -21,22 +41,15 @@ def load_learned_macros():
         warnings.warn('Failed to load learned macros from file {}'.format(filename))
         _macros = {}
 
-    _models = {}
-    for blank_idx, sequences in _macros.items():
-        puzzle = npuzzle.NPuzzle(n=15, start_blank=blank_idx)
-        _models[blank_idx] = [copy.deepcopy(puzzle)
-                              .apply_macro(macro)
-                              .summarize_effects(baseline=puzzle)
-                              for macro in sequences]
+    _models = build_models(_macros)
 
     global learned
     learned.macros = _macros
     learned.models = _models
+    learned.permutations = build_permutations(_models)
 
-load_learned_macros()
-
-class random:
-    """Namespace for randomly generated macro-actions and their corresponding models"""
+learned = cache.LazyNamespace(load_learned_macros,
+                              'Namespace for learned macro-actions and their corresponding models')
 
 def random_macro(start_blank, length):
     """Generate a random macro-action using the given starting blank position and length"""
@@ -53,8 +66,8 @@ def random_macro(start_blank, length):
         effect_size = len(model[0])
     return sequence, model
 
-def generate_random_macro_set(seed):
-    """Generate a new set of random macro-actions using the given random seed"""
+def _generate_random_macros(content):
+    seed, macro_lengths = content
     py_st = pyrandom.getstate()
     np_st = np.random.get_state()
     pyrandom.seed(seed)
@@ -63,18 +76,32 @@ def generate_random_macro_set(seed):
     _macros = {}
     _models = {}
 
-    for blank_idx, macro_list in learned.macros.items():
-        random_macros = [random_macro(blank_idx, len(macro)) for macro in macro_list]
+    for blank_idx, lengths in macro_lengths.items():
+        random_macros = [random_macro(blank_idx, length) for length in lengths]
         _macros[blank_idx], _models[blank_idx] = zip(*random_macros)
 
     pyrandom.setstate(py_st)
     np.random.set_state(np_st)
+    return _macros, _models
+
+def generate_random_macro_set(seed):
+    """Generate a new set of random macro-actions using the given random seed
+
+    Results are cached on disk, keyed by the seed and the learned macro-action lengths.
+    """
+    macro_lengths = {blank_idx: [len(macro) for macro in macro_list]
+                     for blank_idx, macro_list in learned.macros.items()}
+    _macros, _models = cache.cached('npuzzle-random-macros', (seed, macro_lengths),
+                                    _generate_random_macros)
 
     global random
     random.macros = _macros
     random.models = _models
+    random.permutations = build_permutations(_models)
 
-generate_random_macro_set(0)
+random = cache.LazyNamespace(lambda: generate_random_macro_set(0),
+                             'Namespace for randomly generated macro-actions and their '
+                             'corresponding models')
 
 def test():
     """Test generating macros"""
@@ -2,6 +2,20 @@ import copy
 import random
 import numpy as np
 
+from domains import effects
+
+
+def get_permutation(swap_list, n_positions):
+    """Compile a model's swap_list into an index permutation
+
+    The result is an array of position indices, such that state.flatten()[permutation]
+    has the same effect as applying the model to an NPuzzle with a flattened state.
+    """
+    permutation = np.arange(n_positions)
+    for (src_idx, dst_idx) in swap_list:
+        permutation[dst_idx] = src_idx
+    return permutation
+
 
 class NPuzzle:
     """N-Puzzle simulator"""
@@ -23,6 +37,31 @@ class NPuzzle:
                 self.transition(self.left())
             assert self.blank_idx == start_blank
 
+    @property
+    def state(self):
+        """Array of tile values, indexed by (row, col)"""
+        return self._state
+
+    @state.setter
+    def state(self, value):
+        self._state = value
+        self._key = None
+
+    @property
+    def key(self):
+        """Compact canonical key for the NPuzzle's state, cached until the state changes"""
+        if self._key is None:
+            self._key = self._state.astype(np.min_scalar_type(self.n)).tobytes()
+        return self._key
+
+    def __setstate__(self, state):
+        if 'state' in state:
+            # Convert NPuzzles pickled before the state was stored behind a property
+            state = dict(state)
+            state['_state'] = state.pop('state')
+            state['_key'] = None
+        self.__dict__.update(state)
+
     def __len__(self):
         return len(self.state.reshape(-1))
 
@@ -46,6 +85,15 @@ class NPuzzle:
         directions = [self.above, self.below, self.left, self.right]
         return [d(self.blank_idx) for d in directions if d(self.blank_idx) is not None]
 
+    def action_permutations(self):
+        """Return the list of index permutations for the current state's actions()"""
+        blank = self.blank_idx[0]*self.width + self.blank_idx[1]
+        permutations = []
+        for (row, col) in self.actions():
+            tile = row*self.width + col
+            permutations.append(get_permutation(((tile, blank), (blank, tile)), self.n+1))
+        return permutations
+
     def above(self, loc=None):
         """Return the tile index above the given (row, col) location tuple, or None
 
@@ -145,6 +193,7 @@ class NPuzzle:
 
     def _unchecked_transition(self, tile_idx, blank_idx):
         self.state[tile_idx], self.state[blank_idx] = self.state[blank_idx], self.state[tile_idx]
+        self._key = None
 
     def __repr__(self):
         string_form = np.asarray(list(map(lambda x: self.labels[x],
@@ -153,12 +202,12 @@ class NPuzzle:
         return '{}-Puzzle(\n{})'.format(self.n, string_form)
 
     def __hash__(self):
-        return hash(repr(self))
+        return hash(self.key)
 
     def __eq__(self, another):
         assert self.n == another.n, 'Instances must have same n_var'
         assert self.width == another.width, 'Instances must have same n_values'
-        return np.all(self.state == another.state) and np.all(self.blank_idx == another.blank_idx)
+        return self.key == another.key
 
     def __ne__(self, another):
         return not self.__eq__(another)
@@ -189,6 +238,67 @@ class NPuzzle:
             self.sequence += sequence
         return self
 
+    def expand(self, permutations, goal=None, changed_positions=None):
+        """Apply each of a stack of index permutations to the NPuzzle in a single batch
+
+        The permutations must all be valid for the current blank index.
+
+        Args:
+            permutations (numpy.ndarray):
+                An (m, n+1) array of index permutations (see get_permutation)
+            goal (NPuzzle, optional):
+                The NPuzzle to compare successors against. Defaults to the solved NPuzzle.
+            changed_positions (numpy.ndarray, optional):
+                The positions each permutation changes (see domains.effects). If given,
+                goal counts are computed incrementally with goal_count_delta().
+
+        Returns:
+            A (states, goal_counts) tuple, where states is an (m, n+1) array of flattened
+            successor states, and goal_counts[i] is the number of positions that differ
+            from the goal, i.e. len(successor.summarize_effects(baseline=goal)[0]).
+        """
+        state = self.state.reshape(-1)
+        states = state[permutations]
+        goal_state = np.arange(self.n+1) if goal is None else goal.state.reshape(-1)
+        if changed_positions is None:
+            goal_counts = np.count_nonzero(states != goal_state, axis=1)
+        else:
+            goal_count = np.count_nonzero(state != goal_state)
+            goal_counts = goal_count + self.goal_count_delta(permutations, changed_positions, goal)
+        return states, goal_counts
+
+    def goal_count_delta(self, permutations, changed_positions, goal=None):
+        """Compute how applying each permutation changes the number of positions that
+        differ from the goal, looking only at the positions each permutation changes
+
+        Args:
+            permutations (numpy.ndarray):
+                An (m, n+1) array of index permutations (see get_permutation)
+            changed_positions (numpy.ndarray):
+                The positions each permutation changes (see domains.effects)
+            goal (NPuzzle, optional):
+                The NPuzzle to compare against. Defaults to the solved NPuzzle.
+
+        Returns:
+            An array of m (possibly negative) differences in goal count
+        """
+        state = self.state.reshape(-1)
+        goal_state = np.arange(self.n+1) if goal is None else goal.state.reshape(-1)
+        targets = goal_state[changed_positions]
+        sources = np.take_along_axis(permutations, changed_positions, axis=1)
+        before = np.count_nonzero(state[changed_positions] != targets, axis=1)
+        after = np.count_nonzero(state[sources] != targets, axis=1)
+        return after - before
+
+    def child(self, state):
+        """Return a copy of the NPuzzle with its state replaced, e.g. by a row from expand()"""
+        result = NPuzzle.__new__(NPuzzle)
+        result.__dict__.update(self.__dict__)
+        result.sequence = list(self.sequence)
+        result.state = state.reshape(self.width, self.width)
+        result.blank_idx = divmod(int(np.argmax(state == self.n)), self.width)
+        return result
+
     def summarize_effects(self, baseline=None):
         """Summarize the position changes in the NPuzzle relative to a baseline NPuzzle
 
@@ -210,6 +320,31 @@ class NPuzzle:
         return swap_list, baseline.blank_idx
 
 
+def expand_all(puzzles, permutations, goal=None):
+    """Apply each of a stack of index permutations to each of a list of NPuzzles in one batch
+
+    The NPuzzles must all have the same blank index, and the permutations must all be
+    valid for it.
+
+    Args:
+        puzzles (list):
+            The NPuzzles to expand
+        permutations (numpy.ndarray):
+            An (m, n+1) array of index permutations (see get_permutation)
+        goal (NPuzzle, optional):
+            The NPuzzle to compare successors against. Defaults to the solved NPuzzle.
+
+    Returns:
+        A (states, goal_counts) tuple of (k, m, n+1) and (k, m) arrays, where row i
+        matches puzzles[i].expand(permutations, goal)
+    """
+    states = np.stack([puz.state.reshape(-1) for puz in puzzles])[:, permutations]
+    n_positions = states.shape[-1]
+    goal_state = np.arange(n_positions) if goal is None else goal.state.reshape(-1)
+    goal_counts = np.count_nonzero(states != goal_state, axis=2)
+    return states, goal_counts
+
+
 def test_default_baseline():
     """Test NPuzzle when building models with the default baseline"""
     puz = NPuzzle(15)
@@ -227,6 +362,12 @@ def test_default_baseline():
 
     baseline.apply_macro(model=puz.summarize_effects())
     assert baseline == puz
+    assert hash(baseline) == hash(puz)
+
+    # Cached keys are invalidated when the state changes
+    key = baseline.key
+    baseline.transition(baseline.actions()[0])
+    assert baseline.key != key and baseline != puz
 
 
 def test_custom_baseline():
@@ -255,10 +396,45 @@ def test_custom_baseline():
     assert puz != newpuz
 
 
+def test_expand():
+    """Test NPuzzle batch expansion against applying each model individually"""
+    goal = NPuzzle(15)
+    puz = NPuzzle(15)
+    puz.scramble(seed=3)
+    models = [copy.deepcopy(puz).transition(a).summarize_effects(baseline=puz)
+              for a in puz.actions()]
+    permutations = np.stack([get_permutation(swap_list, puz.n+1) for swap_list, _ in models])
+    assert np.all(permutations == np.stack(puz.action_permutations()))
+
+    states, goal_counts = puz.expand(permutations, goal=goal)
+    for state, goal_count, model in zip(states, goal_counts, models):
+        expected = copy.deepcopy(puz).apply_macro(model=model)
+        child = puz.child(state)
+        assert child == expected and child.blank_idx == expected.blank_idx
+        assert goal_count == len(expected.summarize_effects(baseline=goal)[0])
+
+    goal_count = len(puz.summarize_effects(baseline=goal)[0])
+    changed_positions = effects.get_changed_positions(permutations != np.arange(puz.n+1))
+    deltas = puz.goal_count_delta(permutations, changed_positions, goal)
+    assert np.all(goal_count + deltas == goal_counts)
+    _, incremental_goal_counts = puz.expand(permutations, goal, changed_positions)
+    assert np.all(incremental_goal_counts == goal_counts)
+
+    # Another NPuzzle with the same blank index, but two tiles swapped
+    other = copy.deepcopy(puz)
+    tiles = np.flatnonzero(other.state.reshape(-1) != other.n)[:2]
+    other.state.reshape(-1)[tiles] = other.state.reshape(-1)[tiles[::-1]]
+    all_states, all_goal_counts = expand_all([puz, other], permutations, goal=goal)
+    for row, puz_ in enumerate([puz, other]):
+        states, goal_counts = puz_.expand(permutations, goal=goal)
+        assert np.all(all_states[row] == states) and np.all(all_goal_counts[row] == goal_counts)
+
+
 def test():
     """Test NPuzzle functionality"""
     test_default_baseline()
     test_custom_baseline()
+    test_expand()
     print('All tests passed.')
 
 
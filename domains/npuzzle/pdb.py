@@ -0,0 +1,246 @@
+import argparse
+import math
+import multiprocessing
+import os
+
+import numpy as np
+
+PDB_DIR = 'results/pdb/'
+UNVISITED = 0xFF
+
+# Disjoint partitions of the goal cells (excluding the blank's cell, n) into patterns
+PARTITIONS = {
+    8: {
+        '4-4': ((0, 1, 3, 4), (2, 5, 6, 7)),
+    },
+    15: {
+        '5-5-5': ((0, 1, 2, 4, 5), (3, 6, 7, 10, 11), (8, 9, 12, 13, 14)),
+        '6-6-3': ((0, 1, 4, 5, 8, 9), (2, 3, 6, 7, 10, 11), (12, 13, 14)),
+        '7-8': ((0, 1, 2, 3, 4, 5, 6), (7, 8, 9, 10, 11, 12, 13, 14)),
+    },
+    24: {
+        '4-4-4-4-4-4': ((0, 1, 5, 6), (2, 3, 7, 8), (4, 9, 14, 19), (10, 11, 15, 16),
+                        (12, 13, 17, 18), (20, 21, 22, 23)),
+        '6-6-6-6': ((0, 1, 2, 5, 6, 7), (3, 4, 8, 9, 13, 14), (10, 11, 15, 16, 20, 21),
+                    (12, 17, 18, 19, 22, 23)),
+    },
+}
+# The largest partitions that can be built in a few GB of memory
+DEFAULT_PARTITIONS = {8: '4-4', 15: '5-5-5', 24: '4-4-4-4-4-4'}
+
+def n_arrangements(n, k):
+    """Return the number of ways to place k distinct tiles in n cells, i.e. n!/(n-k)!"""
+    return math.factorial(n) // math.factorial(n - k)
+
+def get_neighbors(width):
+    """Return an (n_cells, 4) array of the cells above/below/left/right of each cell, or -1"""
+    neighbors = np.full((width**2, 4), -1, dtype=np.int64)
+    for cell in range(width**2):
+        row, col = divmod(cell, width)
+        for i, (d_row, d_col) in enumerate([(-1, 0), (1, 0), (0, -1), (0, 1)]):
+            if 0 <= row + d_row < width and 0 <= col + d_col < width:
+                neighbors[cell, i] = (row + d_row) * width + col + d_col
+    return neighbors
+
+class TilePattern:
+    """Abstraction of the NPuzzle onto the cells of a subset of tiles
+
+    Tiles are identified by their goal cells. Abstract states are ranked as a partial
+    permutation of the pattern tiles' cells, giving a dense index in [0, size).
+
+    Args:
+        width (int):
+            The width of the NPuzzle
+        cells (tuple):
+            The goal cells of the pattern tiles
+    """
+    def __init__(self, width, cells):
+        self.width = width
+        self.n_cells = width**2
+        self.cells = tuple(sorted(cells))
+        self.k = len(self.cells)
+        self.perm_weights = np.asarray([n_arrangements(self.n_cells - 1 - i, self.k - 1 - i)
+                                        for i in range(self.k)], dtype=np.int64)
+        self.size = n_arrangements(self.n_cells, self.k)
+
+    @property
+    def name(self):
+        return '{}-puzzle-{}'.format(self.n_cells - 1, '_'.join(map(str, self.cells)))
+
+    def rank(self, positions):
+        """Rank an (m, k) array of pattern tile cells, returning m indices"""
+        positions = positions.astype(np.int64)
+        digits = positions.copy()
+        for i in range(1, self.k):
+            digits[:, i] -= np.count_nonzero(positions[:, :i] < positions[:, i:i+1], axis=1)
+        return digits @ self.perm_weights
+
+    def abstract(self, states, goal=None):
+        """Return the pattern tile cells for an (m, n+1) array of flattened states
+
+        If a goal NPuzzle is given, tiles are identified by their cells in the goal.
+        """
+        states = np.atleast_2d(states)
+        targets = self.cells if goal is None else goal.state.reshape(-1)[list(self.cells)]
+        inverse = np.empty(states.shape, dtype=np.int64)
+        inverse[np.arange(len(states))[:, None], states] = np.arange(self.n_cells)
+        return inverse[:, targets]
+
+    def build(self, quiet=False):
+        """Compute the minimum number of pattern tile moves needed to bring every abstract
+        state to the goal, from any blank position, by 0-1 breadth-first search
+
+        Moves that swap the blank with a non-pattern tile are free, so each layer is first
+        closed under free moves before taking the moves that cost 1.
+
+        Returns:
+            A uint8 array of distances, with UNVISITED for unreachable states
+        """
+        neighbors = get_neighbors(self.width)
+        distances = np.full(self.size, UNVISITED, dtype=np.uint8)
+        visited = np.zeros(self.size * self.n_cells, dtype=bool)
+        def index(frontier):
+            return self.rank(frontier[:, :-1]) * self.n_cells + frontier[:, -1]
+        def mark_new(frontier):
+            indices, first = np.unique(index(frontier), return_index=True)
+            is_new = ~visited[indices]
+            visited[indices[is_new]] = True
+            return frontier[first[is_new]]
+
+        # Frontier rows are the pattern tile cells, followed by the blank cell
+        blanks = [cell for cell in range(self.n_cells) if cell not in self.cells]
+        frontier = np.asarray([self.cells + (blank,) for blank in blanks], dtype=np.int64)
+        frontier = mark_new(frontier)
+        depth = 0
+        while len(frontier):
+            layer = [frontier]
+            paid_moves = []
+            queue = frontier
+            while len(queue):
+                free_moves = []
+                for direction in range(4):
+                    blank = queue[:, -1]
+                    target = neighbors[blank, direction]
+                    is_tile = queue[:, :-1] == target[:, None]
+                    child = queue.copy()
+                    child[:, -1] = target
+                    child[:, :-1][is_tile] = np.repeat(blank, self.k)[is_tile.reshape(-1)]
+                    is_paid = is_tile.any(axis=1)
+                    free_moves.append(child[(target >= 0) & ~is_paid])
+                    paid_moves.append(child[(target >= 0) & is_paid])
+                queue = mark_new(np.concatenate(free_moves))
+                layer.append(queue)
+            ranks = self.rank(np.concatenate(layer)[:, :-1])
+            distances[ranks] = np.minimum(distances[ranks], depth)
+            if not quiet:
+                print('{}: depth {} has {} states'.format(self.name, depth, len(ranks)))
+            depth += 1
+            frontier = mark_new(np.concatenate(paid_moves))
+            assert depth < UNVISITED or not len(frontier), 'Depth overflows a byte'
+        return distances
+
+def get_pdb_path(pattern):
+    """Return the path of the pattern database file for the given pattern"""
+    return os.path.join(PDB_DIR, pattern.name + '.npy')
+
+def build_pdb(pattern, quiet=False):
+    """Build a pattern database and save it to disk (see get_pdb_path)"""
+    table = pattern.build(quiet=quiet)
+    path = get_pdb_path(pattern)
+    os.makedirs(PDB_DIR, exist_ok=True)
+    tmp_path = '{}.{}.tmp.npy'.format(path[:-len('.npy')], os.getpid())
+    np.save(tmp_path, table)
+    os.replace(tmp_path, path)
+    return path
+
+def _build_pdb(args):
+    return build_pdb(*args)
+
+def build_pdbs(patterns, n_workers=1, quiet=False):
+    """Build the pattern databases that don't exist yet, using one process per pattern"""
+    missing = [pattern for pattern in patterns if not os.path.exists(get_pdb_path(pattern))]
+    if n_workers > 1 and len(missing) > 1:
+        with multiprocessing.Pool(min(n_workers, len(missing))) as pool:
+            return pool.map(_build_pdb, [(pattern, quiet) for pattern in missing])
+    return [build_pdb(pattern, quiet) for pattern in missing]
+
+def get_patterns(n=15, partition=None, goal=None):
+    """Return the TilePatterns for a partition of the NPuzzle's goal cells
+
+    Args:
+        n (int):
+            The number of tiles
+        partition (str, optional):
+            The name of the partition (see PARTITIONS). Defaults to DEFAULT_PARTITIONS[n].
+        goal (NPuzzle, optional):
+            The goal NPuzzle. If its blank is not in the usual cell, that cell takes the
+            blank's place in the partition.
+    """
+    if n not in PARTITIONS:
+        raise ValueError('No pattern database partitions for the {}-puzzle'.format(n))
+    width = int(np.round(np.sqrt(n+1)))
+    partition = PARTITIONS[n][partition or DEFAULT_PARTITIONS[n]]
+    goal_blank = n
+    if goal is not None:
+        goal_blank = goal.blank_idx[0] * width + goal.blank_idx[1]
+    swap = {goal_blank: n}
+    return [TilePattern(width, [swap.get(cell, cell) for cell in cells]) for cells in partition]
+
+class AdditivePDBHeuristic:
+    """Additive disjoint pattern database heuristic for the NPuzzle
+
+    Each pattern database only counts moves of its own tiles, so the sum over a disjoint
+    partition is admissible for primitive actions (but not for macro-actions with unit
+    cost). The tables are memory-mapped, so worker processes share one copy via the page
+    cache.
+
+    Args:
+        n (int):
+            The number of tiles
+        partition (str, optional):
+            The name of the partition (see PARTITIONS). Defaults to DEFAULT_PARTITIONS[n].
+        goal (NPuzzle, optional):
+            The goal NPuzzle. Defaults to the solved NPuzzle.
+        n_workers (int):
+            The number of processes to use if the pattern databases need to be built
+        quiet (bool):
+            Whether to suppress progress output if the pattern databases need to be built
+    """
+    def __init__(self, n=15, partition=None, goal=None, n_workers=1, quiet=False):
+        self.patterns = get_patterns(n, partition, goal)
+        build_pdbs(self.patterns, n_workers=n_workers, quiet=quiet)
+        self.tables = [np.load(get_pdb_path(pattern), mmap_mode='r')
+                       for pattern in self.patterns]
+        self.goal = goal
+
+    def batch(self, states):
+        """Return the heuristic values for an (m, n+1) array of flattened states"""
+        return sum(table[pattern.rank(pattern.abstract(states, self.goal))].astype(np.int64)
+                   for pattern, table in zip(self.patterns, self.tables))
+
+    def __call__(self, puz):
+        return int(self.batch(puz.state.reshape(-1))[0])
+
+def parse_args():
+    """Parse input arguments
+
+    Use --help to see a pretty description of the arguments
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', type=int, default=15, choices=list(PARTITIONS),
+                        help='Number of tiles')
+    parser.add_argument('--partition', type=str, default=None,
+                        help='Which partition to build (defaults to the largest practical one)')
+    parser.add_argument('--n_workers', type=int, default=os.cpu_count(),
+                        help='Number of worker processes')
+    return parser.parse_args()
+
+def main():
+    """Build pattern databases from the command line"""
+    args = parse_args()
+    patterns = get_patterns(args.n, args.partition)
+    for path in build_pdbs(patterns, n_workers=args.n_workers):
+        print('Saved', path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+import copy
+from collections import deque
+import tempfile
+
+import numpy as np
+
+from domains.npuzzle import NPuzzle, pdb
+
+def reference_distances(width, cells):
+    """Compute pattern distances with a simple 0-1 breadth-first search over dicts"""
+    neighbors = pdb.get_neighbors(width)
+    starts = [tuple(cells) + (blank,) for blank in range(width**2) if blank not in cells]
+    distances = {state: 0 for state in starts}
+    queue = deque(starts)
+    while queue:
+        state = queue.popleft()
+        tiles, blank = list(state[:-1]), state[-1]
+        for target in neighbors[blank]:
+            if target < 0:
+                continue
+            child_tiles = list(tiles)
+            cost = 0
+            if target in tiles:
+                child_tiles[tiles.index(target)] = blank
+                cost = 1
+            child = tuple(child_tiles) + (int(target),)
+            if distances[state] + cost < distances.get(child, float('inf')):
+                distances[child] = distances[state] + cost
+                if cost == 0:
+                    queue.appendleft(child)
+                else:
+                    queue.append(child)
+    best = {}
+    for state, distance in distances.items():
+        best[state[:-1]] = min(best.get(state[:-1], distance), distance)
+    return best
+
+def test_pattern_database():
+    """Test NPuzzle pattern databases against a reference search"""
+    for cells in [(0, 1, 3), (2, 5, 6, 7)]:
+        pattern = pdb.TilePattern(3, cells)
+        table = pattern.build(quiet=True)
+        best = reference_distances(3, pattern.cells)
+        assert len(best) == pattern.size
+        assert np.all(table[pattern.rank(np.asarray(list(best)))] == list(best.values()))
+
+def test_additive_heuristic():
+    """Test that additive pattern databases are admissible and consistent"""
+    old_pdb_dir = pdb.PDB_DIR
+    try:
+        with tempfile.TemporaryDirectory() as pdb.PDB_DIR:
+            heuristic = pdb.AdditivePDBHeuristic(n=8, quiet=True)
+            assert heuristic(NPuzzle(n=8)) == 0
+            puz = NPuzzle(n=8).scramble(seed=1)
+            states, _ = puz.expand(np.stack(puz.action_permutations()))
+            values = heuristic.batch(states)
+            assert np.all(np.abs(values - heuristic(puz)) <= 1)
+            assert [heuristic(puz.child(state)) for state in states] == values.tolist()
+
+            # Manhattan distance is the sum of single-tile pattern databases
+            state = puz.state.reshape(-1)
+            manhattan = sum(abs(cell // 3 - tile // 3) + abs(cell % 3 - tile % 3)
+                            for cell, tile in enumerate(state) if tile != puz.n)
+            assert manhattan <= heuristic(puz)
+
+            # Goals with the blank elsewhere use a partition without the goal's blank cell
+            goal = NPuzzle(n=8).scramble(seed=2)
+            goal_heuristic = pdb.AdditivePDBHeuristic(n=8, goal=goal, quiet=True)
+            assert goal_heuristic(goal) == 0
+            assert goal_heuristic(copy.deepcopy(goal).transition(goal.actions()[0])) == 1
+    finally:
+        pdb.PDB_DIR = old_pdb_dir
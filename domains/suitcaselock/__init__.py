@@ -1,2 +1,2 @@
 __all__ = ['suitcaselock']
-from .suitcaselock import SuitcaseLock, reduce_mod2, rank_mod2
+from .suitcaselock import SuitcaseLock, reduce_mod2, rank_mod2, expand_all
@@ -3,6 +3,8 @@ import copy
 import gmpy
 import numpy as np
 
+from domains import effects
+
 
 def reduce_mod2(A):
     """Reduce a square binary matrix to reduced row echelon form (modulo 2)"""
@@ -38,6 +40,31 @@ class SuitcaseLock:
         self._actions = None
         self.actions()
 
+    @property
+    def state(self):
+        """Array of dial values"""
+        return self._state
+
+    @state.setter
+    def state(self, value):
+        self._state = value
+        self._key = None
+
+    @property
+    def key(self):
+        """Compact canonical key for the SuitcaseLock's state, cached until the state changes"""
+        if self._key is None:
+            self._key = self._state.astype(np.min_scalar_type(self.n_values-1)).tobytes()
+        return self._key
+
+    def __setstate__(self, state):
+        if 'state' in state:
+            # Convert SuitcaseLocks pickled before the state was stored behind a property
+            state = dict(state)
+            state['_state'] = state.pop('state')
+            state['_key'] = None
+        self.__dict__.update(state)
+
     def __len__(self):
         return self.n_vars
 
@@ -133,12 +160,12 @@ class SuitcaseLock:
         return 'SuitcaseLock({})'.format(self.state)
 
     def __hash__(self):
-        return hash(repr(self))
+        return hash(self.key)
 
     def __eq__(self, another):
         assert self.n_vars == another.n_vars, 'Instances must have same n_var'
         assert self.n_values == another.n_values, 'Instances must have same n_values'
-        return np.all(self.state == another.state)
+        return self.key == another.key
 
     def __ne__(self, another):
         return not self.__eq__(another)
@@ -153,6 +180,59 @@ class SuitcaseLock:
                 self.transition(move)
         return self
 
+    def expand(self, diffs, goal=None, changed_positions=None):
+        """Apply each of a stack of difference vectors to the SuitcaseLock in a single batch
+
+        Args:
+            diffs (numpy.ndarray):
+                An (m, n_vars) array of actions or difference vectors
+            goal (SuitcaseLock, optional):
+                The SuitcaseLock to compare successors against. Defaults to all-zeros.
+            changed_positions (numpy.ndarray, optional):
+                The dials each vector changes (see domains.effects). If given,
+                goal counts are computed incrementally with goal_count_delta().
+
+        Returns:
+            A (states, goal_counts) tuple, where states is an (m, n_vars) array of successor
+            states, and goal_counts[i] is the number of dials that differ from the goal.
+        """
+        states = (self.state + diffs) % self.n_values
+        goal_state = 0 if goal is None else goal.state
+        if changed_positions is None:
+            goal_counts = np.count_nonzero(states != goal_state, axis=1)
+        else:
+            goal_count = np.count_nonzero(self.state != goal_state)
+            goal_counts = goal_count + self.goal_count_delta(diffs, changed_positions, goal)
+        return states, goal_counts
+
+    def goal_count_delta(self, diffs, changed_positions, goal=None):
+        """Compute how applying each difference vector changes the number of dials that
+        differ from the goal, looking only at the dials each vector changes
+
+        Args:
+            diffs (numpy.ndarray):
+                An (m, n_vars) array of actions or difference vectors
+            changed_positions (numpy.ndarray):
+                The dials each vector changes (see domains.effects)
+            goal (SuitcaseLock, optional):
+                The SuitcaseLock to compare against. Defaults to all-zeros.
+
+        Returns:
+            An array of m (possibly negative) differences in goal count
+        """
+        targets = 0 if goal is None else goal.state[changed_positions]
+        values = self.state[changed_positions]
+        new_values = (values + np.take_along_axis(diffs, changed_positions, axis=1)) % self.n_values
+        before = np.count_nonzero(values != targets, axis=1)
+        after = np.count_nonzero(new_values != targets, axis=1)
+        return after - before
+
+    def child(self, state):
+        """Return a copy of the SuitcaseLock with its state replaced, e.g. by a row from expand()"""
+        result = copy.copy(self)
+        result.state = state
+        return result
+
     def summarize_effects(self, baseline=None):
         """Summarize the changes in the SuitcaseLock relative to a baseline SuitcaseLock
 
@@ -167,6 +247,28 @@ class SuitcaseLock:
         return diff
 
 
+def expand_all(locks, diffs, goal=None):
+    """Apply each of a stack of difference vectors to each of a list of SuitcaseLocks in one
+    batch
+
+    Args:
+        locks (list):
+            The SuitcaseLocks to expand
+        diffs (numpy.ndarray):
+            An (m, n_vars) array of actions or difference vectors
+        goal (SuitcaseLock, optional):
+            The SuitcaseLock to compare successors against. Defaults to all-zeros.
+
+    Returns:
+        A (states, goal_counts) tuple of (k, m, n_vars) and (k, m) arrays, where row i
+        matches locks[i].expand(diffs, goal)
+    """
+    states = (np.stack([lock.state for lock in locks])[:, None, :] + diffs) % locks[0].n_values
+    goal_state = 0 if goal is None else goal.state
+    goal_counts = np.count_nonzero(states != goal_state, axis=2)
+    return states, goal_counts
+
+
 def test_binary_matrix_ops():
     """Test functionality of reduce_mod2 and rank_mod2"""
     # Identity matrix is already reduced
@@ -268,6 +370,26 @@ def test_suitcaselock():
     action_matrix = np.stack(actions[0:len(actions)//2])
     assert np.linalg.matrix_rank(action_matrix) == 20
 
+    states, goal_counts = lock1.expand(np.stack(lock1.actions()), goal=lock2)
+    for state, goal_count, action in zip(states, goal_counts, lock1.actions()):
+        expected = copy.deepcopy(lock1).apply_macro(diff=action)
+        assert lock1.child(state) == expected
+        assert goal_count == sum(expected.summarize_effects(baseline=lock2) > 0)
+
+    diffs = np.concatenate([np.stack(lock1.actions()), -np.stack(lock1.actions())])
+    _, goal_counts = lock1.expand(diffs, goal=lock2)
+    goal_count = sum(lock1.summarize_effects(baseline=lock2) > 0)
+    changed_positions = effects.get_changed_positions(diffs != 0)
+    deltas = lock1.goal_count_delta(diffs, changed_positions, goal=lock2)
+    assert np.all(goal_count + deltas == goal_counts)
+    _, incremental_goal_counts = lock1.expand(diffs, lock2, changed_positions)
+    assert np.all(incremental_goal_counts == goal_counts)
+
+    all_states, all_goal_counts = expand_all([lock1, lock2], diffs, goal=lock2)
+    for row, lock in enumerate([lock1, lock2]):
+        states, goal_counts = lock.expand(diffs, goal=lock2)
+        assert np.all(all_states[row] == states) and np.all(all_goal_counts[row] == goal_counts)
+
 def test():
     """Test all SuitcaseLock functionality"""
     test_binary_matrix_ops()
@@ -0,0 +1,168 @@
+import argparse
+import contextlib
+import importlib
+import multiprocessing
+import os
+import resource
+import signal
+import sys
+import time
+import traceback
+
+from experiments.results import get_manifest_path, get_registered_paths
+
+DOMAINS = ['cube', 'npuzzle', 'suitcaselock', 'pddlgym']
+
+def parse_args():
+    """Parse input arguments
+
+    Use --help to see a pretty description of the arguments. Any unrecognized
+    arguments are forwarded to the domain's solve script.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('domain', type=str, choices=DOMAINS,
+                        help='Which domain to solve')
+    parser.add_argument('--search_alg', type=str, default='gbfs',
+                        help='Search algorithm to run')
+    parser.add_argument('--macro_type','-m', type=str, default=None,
+                        help='Type of macros to consider during search (if the domain has any)')
+    parser.add_argument('--seeds', type=str, default='1-100',
+                        help='Seeds to solve, as comma-separated ranges, e.g. 1-10,15,20-30')
+    parser.add_argument('--n_workers', type=int, default=os.cpu_count(),
+                        help='Number of worker processes')
+    parser.add_argument('--max_memory_gb', type=float, default=None,
+                        help='Maximum address space per solve (in GB)')
+    parser.add_argument('--max_minutes', type=float, default=None,
+                        help='Maximum wall-clock time per solve (in minutes)')
+    parser.add_argument('--overwrite', action='store_true', default=False,
+                        help='Re-run seeds that already have results')
+    parser.add_argument('--verbose', '-v', action='store_true', default=False,
+                        help='Show the output of each solve')
+    return parser.parse_known_args()
+
+def parse_seeds(seed_str):
+    """Convert a string of comma-separated ranges (e.g. '1-10,15') to a list of seeds"""
+    seeds = []
+    for part in seed_str.split(','):
+        first, _, last = part.partition('-')
+        seeds.extend(range(int(first), int(last or first)+1))
+    return seeds
+
+class TimeLimitExceeded(Exception):
+    """Raised in a worker when a solve exceeds its time limit"""
+
+def _raise_time_limit(signum, frame):
+    raise TimeLimitExceeded()
+
+def _solve_seed(task):
+    """Solve a single seed in a worker process, subject to the task's resource limits
+
+    Returns:
+        A (seed, status, seconds) tuple
+    """
+    domain, solve_args, seed, max_memory, max_seconds, verbose = task
+    solve_module = importlib.import_module('experiments.{}.solve'.format(domain))
+    if max_memory is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (max_memory, max_memory))
+    if max_seconds is not None:
+        signal.signal(signal.SIGALRM, _raise_time_limit)
+        signal.setitimer(signal.ITIMER_REAL, max_seconds)
+
+    start_time = time.time()
+    with open(os.devnull, 'w') as devnull, contextlib.ExitStack() as stack:
+        if not verbose:
+            stack.enter_context(contextlib.redirect_stdout(devnull))
+            stack.enter_context(contextlib.redirect_stderr(devnull))
+        try:
+            solve_module.solve(solve_module.parse_args(solve_args))
+            status = 'done'
+        except TimeLimitExceeded:
+            status = 'time limit'
+        except MemoryError:
+            status = 'memory limit'
+        except Exception: # pylint: disable=broad-except
+            status = 'error\n' + traceback.format_exc()
+    signal.setitimer(signal.ITIMER_REAL, 0)
+    return seed, status, time.time() - start_time
+
+def batch_solve(domain, solve_args, seeds, n_workers=1, max_memory=None, max_seconds=None,
+                overwrite=False, verbose=False):
+    """Solve a range of seeds for one domain configuration using a pool of worker processes
+
+    The domain's solve module (and its macros, gym, etc.) is imported once here, and each
+    task runs in a fresh process forked from this one, so that resource limits and leftover
+    state don't carry over between seeds.
+
+    Args:
+        domain (str):
+            The name of the domain, i.e. the package in experiments/ with a solve.py
+        solve_args (list):
+            Argument strings for the domain's solve script, not including the seed
+        seeds (list):
+            The seeds to solve
+        n_workers (int):
+            The number of worker processes
+        max_memory (int, optional):
+            The maximum address space per solve, in bytes
+        max_seconds (float, optional):
+            The maximum wall-clock time per solve, in seconds
+        overwrite (bool):
+            Whether to re-run seeds that already have results
+        verbose (bool):
+            Whether to show the output of each solve
+
+    Returns:
+        A dict mapping each seed that was run to its final status
+    """
+    solve_module = importlib.import_module('experiments.{}.solve'.format(domain))
+
+    # Seeds are looked up in each experiment's manifest, so that the results directories
+    # don't need to be walked. Results that aren't in a manifest are checked directly.
+    registered_paths = {}
+    tasks = []
+    for seed in seeds:
+        seed_args = solve_args + ['-s', str(seed)]
+        results_path = solve_module.get_results_path(solve_module.parse_args(seed_args))
+        results_dir = os.path.dirname(get_manifest_path(results_path))
+        if results_dir not in registered_paths:
+            registered_paths[results_dir] = get_registered_paths(results_dir)
+        is_done = (os.path.normpath(results_path) in registered_paths[results_dir]
+                   or os.path.exists(results_path))
+        if is_done and not overwrite:
+            continue
+        tasks.append((domain, seed_args, seed, max_memory, max_seconds, verbose))
+    print('Skipping {} seeds with existing results'.format(len(seeds) - len(tasks)))
+    print('Solving {} seeds with {} workers'.format(len(tasks), n_workers))
+
+    statuses = {}
+    context = multiprocessing.get_context('fork')
+    with context.Pool(n_workers, maxtasksperchild=1) as pool:
+        for i, (seed, status, seconds) in enumerate(pool.imap_unordered(_solve_seed, tasks)):
+            statuses[seed] = status.split('\n')[0]
+            print('[{}/{}] seed {:03d}: {} ({:.1f}s)'.format(i+1, len(tasks), seed, status,
+                                                            seconds))
+            sys.stdout.flush()
+
+    failed = sorted(seed for seed, status in statuses.items() if status != 'done')
+    if failed:
+        print('Failed seeds:', ','.join(map(str, failed)))
+    return statuses
+
+def main():
+    """Run the batch solver from the command line"""
+    args, solve_args = parse_args()
+    solve_args = solve_args + ['--search_alg', args.search_alg]
+    if args.macro_type is not None:
+        solve_args += ['--macro_type', args.macro_type]
+    max_memory = None
+    if args.max_memory_gb is not None:
+        max_memory = int(args.max_memory_gb * 2**30)
+    max_seconds = None
+    if args.max_minutes is not None:
+        max_seconds = args.max_minutes * 60
+    batch_solve(args.domain, solve_args, parse_seeds(args.seeds), n_workers=args.n_workers,
+                max_memory=max_memory, max_seconds=max_seconds, overwrite=args.overwrite,
+                verbose=args.verbose)
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,9 @@ def bfws(start, *args, heuristic=None, R=set([]), precision=3, **kwargs):
             The state->heuristic function to wrap with the BFWS width augmentation
         R (set):
             The set of relevant atoms to use for #r, default is R = R0
+
+    Other arguments, including the max_transitions, max_seconds and max_memory_bytes
+    budgets, are passed to best_first_search.
     """
     width_aug_heuristic = WidthAugmentedHeuristic(
                               n_variables=len(start),
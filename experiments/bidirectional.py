@@ -0,0 +1,194 @@
+import heapq
+import itertools
+
+from tqdm import tqdm
+
+import experiments.priorityqueue as pq
+from experiments.search import (SearchNode, get_key, reconstruct_path, reconstruct_best_n,
+                                AStarPriority, GBFSPriority)
+
+class _Frontier:
+    """One direction of a bidirectional search
+
+    Nodes in the backward frontier point towards the goal: a node's parent is the next
+    state along the path to the goal, and its action is the (forward) action that
+    transitions from the node's state to its parent's state.
+    """
+    def __init__(self, root, get_neighbors, heuristic):
+        self.get_neighbors = get_neighbors
+        self.heuristic = heuristic
+        self.open_set = []
+        self.closed_set = set()
+        self.g_score = {get_key(root.state): 0}
+        # The most recently generated node for each state, for joining paths at a meeting
+        self.nodes = {get_key(root.state): root}
+        self.other = None
+
+    def h_score(self, state, precomputed_h):
+        if precomputed_h:
+            return precomputed_h[0]
+        return self.heuristic(state)
+
+def _join_paths(forward_node, backward_node):
+    """Join the forward path ending at forward_node with the backward path starting at
+    backward_node, where both nodes have the same state"""
+    states, actions = reconstruct_path(forward_node)
+    node = backward_node
+    while node.parent:
+        actions.append(node.action)
+        states.append(node.parent.state)
+        node = node.parent
+    return states, actions
+
+def _bidirectional_search(start, goal, step_cost, heuristic, get_successors, get_predecessors,
+                          get_priority, backward_heuristic=None, max_transitions=0,
+                          save_best_n=1, quiet=False):
+    """Core implementation of front-to-end bidirectional best-first search
+
+    Two best-first searches are run, one forward from `start` and one backward from
+    `goal`. Each direction's heuristic estimates the distance to the other direction's
+    root (`goal` or `start`), not to the opposite frontier. At each step, the direction
+    with the smaller open list is expanded, and the search stops as soon as a newly
+    generated state has already been generated by the other direction (detected via the
+    state key). With an exact goal state, this can reduce the number of expansions from
+    roughly b^d to 2*b^(d/2).
+
+    The first meeting point is returned, so the plan is not guaranteed to be optimal,
+    even when using A* priorities.
+
+    Args:
+        start:
+            The state at which to begin the forward search
+        goal:
+            The state at which to begin the backward search
+        step_cost (callable):
+            A function that takes an action/macro as input and returns its step cost
+        heuristic (callable):
+            A function that takes a state as input and returns its heuristic distance to
+            the goal
+        get_successors (callable):
+            A function that takes a state as input and returns all possible successors, as
+            a list of (state, action) pairs, or (state, action, h) triples (see
+            search.best_first_search)
+        get_predecessors (callable):
+            A function that takes a state as input and returns all possible predecessors,
+            as a list of (state, action) pairs, or (state, action, h) triples, where
+            action transitions from the predecessor to the input state, and h is the
+            precomputed backward heuristic value of the predecessor
+        get_priority (callable):
+            A function that takes a SearchNode as input and returns its priority
+        backward_heuristic (callable, optional):
+            A function that takes a state as input and returns its heuristic distance to
+            the start. Defaults to a heuristic of zero.
+        max_transitions (int):
+            The simulation budget for the search, counting both directions
+        save_best_n (int):
+            The number of best (forward) SearchNodes to maintain during the search
+        quiet (boolean):
+            Whether to suppress progress bars
+
+    Returns:
+        A (states, actions, n_expanded, n_transitions, candidates) tuple, with the same
+        meaning as for search.best_first_search. Candidates only track the forward search,
+        plus a final candidate at the goal if the frontiers meet.
+    """
+    if backward_heuristic is None:
+        backward_heuristic = lambda x: 0
+    n_expanded = 0
+    n_transitions = 0
+    tiebreak = itertools.count()
+
+    root = SearchNode(state=start, g_score=0, h_score=heuristic(start))
+    goal_root = SearchNode(state=goal, g_score=0, h_score=backward_heuristic(goal))
+    forward = _Frontier(root, get_successors, heuristic)
+    backward = _Frontier(goal_root, get_predecessors, backward_heuristic)
+    forward.other, backward.other = backward, forward
+    for frontier, node in ((forward, root), (backward, goal_root)):
+        heapq.heappush(frontier.open_set, (get_priority(node), next(tiebreak), node))
+
+    candidates = [(n_transitions, root)]
+    best = root
+    # save best N nodes, always ejecting the max priority element to make room
+    best_n = pq.PriorityQueue(maxlen=save_best_n, mode='max')
+
+    def meet(forward_node, backward_node):
+        states, actions = _join_paths(forward_node, backward_node)
+        cost = forward_node.g_score + backward_node.g_score
+        candidates.append((n_transitions, SearchNode(state=states[-1], g_score=cost,
+                                                     h_score=heuristic(states[-1]))))
+        return states, actions, n_expanded, n_transitions, candidates
+
+    if get_key(start) == get_key(goal):
+        return meet(root, goal_root)
+
+    with tqdm(total=max_transitions, disable=quiet) as progress:
+        while forward.open_set and backward.open_set and n_transitions < max_transitions:
+            if len(forward.open_set) <= len(backward.open_set):
+                frontier = forward
+            else:
+                frontier = backward
+            _, _, current = heapq.heappop(frontier.open_set)
+            current_key = get_key(current.state)
+            if current_key in frontier.closed_set:
+                continue  # Node already in closed set; ignore it
+            frontier.closed_set.add(current_key)
+            n_expanded += 1
+
+            if frontier is forward:
+                if (current.h_score < best.h_score
+                        or (current.h_score == best.h_score
+                            and current.g_score < best.g_score)):
+                    # Found better node!
+                    best = current
+                    candidates.append((n_transitions, current))
+                best_n.push((current.h_score, current))
+
+            # Considering neighbors...
+            neighbors = frontier.get_neighbors(current.state)
+            n_transitions += len(neighbors)
+            progress.update(len(neighbors))
+            for state, action, *precomputed_h in neighbors:
+                key = get_key(state)
+                if key in frontier.closed_set:
+                    continue
+
+                g_score_via_current = frontier.g_score[current_key] + step_cost(action)
+                if g_score_via_current < frontier.g_score.get(key, float('inf')):
+                    # Found better path to `state`; duplicates in the heap are ignored
+                    # once `state` is added to the closed set.
+                    frontier.g_score[key] = g_score_via_current
+                    neighbor = SearchNode(state=state, g_score=g_score_via_current,
+                                          h_score=frontier.h_score(state, precomputed_h),
+                                          parent=current, action=action)
+                    frontier.nodes[key] = neighbor
+                    if key in frontier.other.nodes:
+                        # Frontiers met! Joining paths...
+                        if frontier is forward:
+                            return meet(neighbor, backward.nodes[key])
+                        return meet(forward.nodes[key], neighbor)
+                    heapq.heappush(frontier.open_set,
+                                   (get_priority(neighbor), next(tiebreak), neighbor))
+
+        # No solution found. Reconstructing path to best (forward) node...
+        if save_best_n > 1:
+            return reconstruct_path(best) + (n_expanded, n_transitions, candidates,
+                                             reconstruct_best_n(best_n))
+        return reconstruct_path(best) + (n_expanded, n_transitions, candidates)
+
+def bidirectional_search(*args, **kwargs):
+    """Bidirectional best-first search"""
+    # Strip the candidates' parent information so that the results can be pickled
+    # without hitting python's recursion limit (see search.best_first_search).
+    results = _bidirectional_search(*args, **kwargs)
+    candidates = results[4]
+    for _, node in candidates:
+        node.parent = None
+    return results
+
+def bidirectional_astar(*args, **kwargs):
+    """Bidirectional A* search (front-to-end, stopping at the first meeting)"""
+    return bidirectional_search(*args, get_priority=AStarPriority(), **kwargs)
+
+def bidirectional_gbfs(*args, **kwargs):
+    """Bidirectional greedy best-first search (GBFS)"""
+    return bidirectional_search(*args, get_priority=GBFSPriority(), **kwargs)
@@ -12,12 +12,15 @@ def main():
     cost_mode = 'per-macro'
     max_transitions = 1e6
     save_best_n = 1200
+    results_dir = 'results/macros/cube/'
+    # Long searches periodically save a checkpoint, and resume from it if restarted
+    checkpoint_path = results_dir+'macro-search.ckpt'
 
     newcube = cube.Cube()
     start = cube.Cube()
 
     actions = macros.primitive.actions
-    models = macros.primitive.models
+    permutations = macros.primitive.permutations
 
     is_goal = lambda node: False
     step_cost = lambda macro: len(macro) if cost_mode == 'per-action' else 1
@@ -29,7 +32,7 @@ def main():
         return len(effects)
 
     def get_successors(cube_):
-        return [(copy.deepcopy(cube_).apply(swap_list=m), a) for a, m in zip(actions, models)]
+        return [(copy.deepcopy(cube_).apply(permutation=p), a) for a, p in zip(actions, permutations)]
 
     #%% Run the search
     search_results = search.astar(start=start,
@@ -38,12 +41,14 @@ def main():
                                   heuristic=heuristic,
                                   get_successors=get_successors,
                                   max_transitions=max_transitions,
-                                  save_best_n=save_best_n)
+                                  save_best_n=save_best_n,
+                                  checkpoint_path=checkpoint_path)
 
     #%% Save the results
-    os.makedirs('results/macros/cube', exist_ok=True)
-    with open('results/macros/cube/macro-results.pickle', 'wb') as file:
+    os.makedirs(results_dir, exist_ok=True)
+    with open(results_dir+'macro-results.pickle', 'wb') as file:
         pickle.dump(search_results, file)
+    os.remove(checkpoint_path)
 
 if __name__ == '__main__':
     main()
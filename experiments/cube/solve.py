@@ -1,19 +1,26 @@
 import argparse
-import copy
 import os
-import pickle
 import sys
+import time
 from types import SimpleNamespace
 
-from domains import cube
-from domains.cube import macros, pattern, formula
-from experiments import search, iw, bfws
+import numpy as np
 
+from domains import cube, effects
+from domains.cube import macros, pattern, formula, pdb
+from experiments import search, iw, bfws, bidirectional, idastar, parallel_search
+from experiments.profiling import SearchProfile, get_profile_path
+from experiments.results import save_run
 
-def parse_args():
+
+def parse_args(args=None):
     """Parse input arguments
 
     Use --help to see a pretty description of the arguments
+
+    Args:
+        args (list, optional):
+            The list of argument strings to parse. Defaults to sys.argv[1:].
     """
     if 'ipykernel' in sys.argv[0]:
         sys.argv = [sys.argv[0]]
@@ -24,8 +31,25 @@ def parse_args():
                         choices=['primitive','expert','random','learned'],
                         help='Type of macros to consider during search')
     parser.add_argument('--search_alg', type=str, default='gbfs',
-                        choices=['astar','gbfs','weighted_astar', 'bfws_r0', 'bfws_rg'],
+                        choices=['astar','gbfs','weighted_astar', 'bfws_r0', 'bfws_rg',
+                                 'bidirectional_astar', 'bidirectional_gbfs', 'idastar',
+                                 'rbfs', 'parallel_astar', 'parallel_gbfs'],
                         help='Search algorithm to run')
+    parser.add_argument('--queue', type=str, default='heap',
+                        choices=['heap', 'bucket', 'indexed'],
+                        help='Open list for best-first search')
+    parser.add_argument('--k_best', type=int, default=1,
+                        help='Number of best nodes to expand per iteration of best-first search')
+    parser.add_argument('--profile', action='store_true',
+                        help='Time each phase of best-first search, and save the profile '
+                             'next to the results')
+    parser.add_argument('--profile_sample_every', type=int, default=0,
+                        help='Also record the per-phase costs of every Nth expansion')
+    parser.add_argument('--n_search_workers', type=int, default=os.cpu_count(),
+                        help='Number of worker processes for parallel search algorithms')
+    parser.add_argument('--heuristic', type=str, default='goal_count',
+                        choices=['goal_count', 'pdb'],
+                        help='Heuristic to use: sticker goal-count, or pattern databases')
     parser.add_argument('--cost_mode', type=str, default='per-macro',
                         choices=['per-macro','per-action'],
                         help='How to measure the plan cost')
@@ -39,14 +63,45 @@ def parse_args():
                         help='Use the Büchner 2018 problems instead of generating a scramble (for comparing with SAS+ planners)')
     parser.add_argument('--max_transitions', type=lambda x: int(float(x)), default=1e5,
                         help='Maximum number of variables changed per primitive action')
+    parser.add_argument('--max_seconds', type=float, default=None,
+                        help='Wall-clock budget for best-first search (including IW for '
+                             'bfws_rg), after which it stops with the best node so far')
+    parser.add_argument('--max_memory_gb', type=float, default=None,
+                        help='Resident memory budget for best-first search (and IW) in GB')
     parser.add_argument('--bfws_precision', type=int, default=3,
                         help='The number of width values, w \in {1,...,P}, to use when the search algorithm is best-first width search')
-    return parser.parse_args()
+    return parser.parse_args(args)
 
 
-def solve():
-    """Instantiate a Rubik's cube and solve with the specified macro-actions and search algorithm"""
-    args = parse_args()
+def get_results_path(args):
+    """Return the path of the results file for the given arguments"""
+    tag = args.macro_type
+    if args.random_goal:
+        tag = 'random_goal/'+tag
+    else:
+        tag = 'default_goal/'+tag
+    search_alg = args.search_alg
+    if search_alg == 'weighted_astar':
+        search_alg += '-g_{}-h_{}'.format(args.g_weight, args.h_weight)
+    if args.heuristic != 'goal_count':
+        search_alg += '-' + args.heuristic
+    if args.k_best > 1:
+        search_alg += '-k_{}'.format(args.k_best)
+    if args.queue != 'heap':
+        search_alg += '-queue_{}'.format(args.queue)
+    problem_name = 'cube' if not args.buchner2018 else 'cube-buchner2018'
+    results_dir = 'results/{}/{}/{}/'.format(problem_name, search_alg, tag)
+    return results_dir+'seed-{:03d}.npz'.format(args.seed)
+
+def solve(args=None):
+    """Instantiate a Rubik's cube and solve with the specified macro-actions and search algorithm
+
+    Args:
+        args (argparse.Namespace, optional):
+            The parsed arguments (see parse_args). Defaults to parsing sys.argv.
+    """
+    if args is None:
+        args = parse_args()
 
     # Set up the scramble
     if args.buchner2018:
@@ -72,13 +127,13 @@ def solve():
         macros.generate_random_macro_set(args.seed)
 
     macro_namespace = {
-        'primitive': SimpleNamespace(macros=[], models=[]),
+        'primitive': SimpleNamespace(macros=[], models=[], permutations=[]),
         'expert': macros.expert,
         'random': macros.random,
         'learned': macros.learned,
     }[args.macro_type]
     macro_list = macros.primitive.actions + macro_namespace.macros
-    model_list = macros.primitive.models + macro_namespace.models
+    permutation_list = macros.primitive.permutations + macro_namespace.permutations
 
     # Set up the search problem
     search_fn = {
@@ -87,21 +142,85 @@ def solve():
         'weighted_astar': search.weighted_astar,
         'bfws_r0': bfws.bfws,
         'bfws_rg': bfws.bfws,
+        'bidirectional_astar': bidirectional.bidirectional_astar,
+        'bidirectional_gbfs': bidirectional.bidirectional_gbfs,
+        'idastar': idastar.idastar,
+        'rbfs': idastar.rbfs,
+        'parallel_astar': parallel_search.parallel_astar,
+        'parallel_gbfs': parallel_search.parallel_gbfs,
     }[args.search_alg]
 
+    permutations = np.stack(permutation_list)
+    # Each macro only changes a few positions, so successor goal counts are computed from
+    # the current goal count plus the change at those positions
+    changed_positions = effects.get_changed_positions(
+        permutations != np.arange(permutations.shape[1]))
+
+    # Pattern databases are memory-mapped, so the tables are shared with other processes
+    pdb_heuristic = pdb.PDBHeuristic(goal=goal) if args.heuristic == 'pdb' else None
+    heuristic = pdb_heuristic or (lambda cube_: len(cube_.summarize_effects(baseline=goal)))
+
     def get_successors(cube_):
-        return [(copy.deepcopy(cube_).apply(swap_list=model), macro)
-                for (macro, model) in zip(macro_list, model_list)]
+        # Generate all successors and their heuristic values in one batch
+        states, goal_counts = cube_.expand(permutations, goal, changed_positions)
+        h_values = goal_counts if pdb_heuristic is None else pdb_heuristic.batch(states)
+        return [(cube_.child(state), macro, h)
+                for (state, macro, h) in zip(states, macro_list, h_values.tolist())]
+
+    def get_successors_batch(cubes):
+        # Generate the successors of several nodes and their heuristic values in one batch
+        states, goal_counts = cube.cube.expand_all(cubes, permutations, goal=goal)
+        h_values = goal_counts
+        if pdb_heuristic is not None:
+            h_values = pdb_heuristic.batch(states.reshape(-1, states.shape[-1]))
+            h_values = h_values.reshape(goal_counts.shape)
+        return [[(cube_.child(state), macro, h)
+                 for (state, macro, h) in zip(cube_states, macro_list, cube_h_values.tolist())]
+                for cube_, cube_states, cube_h_values in zip(cubes, states, h_values)]
 
     search_dict = {
         'start': start,
         'is_goal': lambda node: node.state == goal,
         'step_cost': lambda macro: len(macro) if args.cost_mode == 'per-action' else 1,
-        'heuristic': lambda cube_: len(cube_.summarize_effects(baseline=goal)),
+        'heuristic': heuristic,
         'get_successors': get_successors,
         'max_transitions': args.max_transitions,
     }
 
+    if 'bidirectional' in args.search_alg:
+        # Search backward from the goal using the inverse of each macro's permutation
+        inverse_permutations = np.argsort(permutations, axis=1)
+        backward_pdb_heuristic = pdb.PDBHeuristic(goal=start) if pdb_heuristic else None
+        backward_heuristic = (backward_pdb_heuristic
+                              or (lambda cube_: len(cube_.summarize_effects(baseline=start))))
+        def get_predecessors(cube_):
+            # Inverse permutations change the same positions as the originals
+            states, start_counts = cube_.expand(inverse_permutations, start, changed_positions)
+            if backward_pdb_heuristic is not None:
+                start_counts = backward_pdb_heuristic.batch(states)
+            return [(cube_.child(state), macro, h)
+                    for (state, macro, h) in zip(states, macro_list, start_counts.tolist())]
+        del search_dict['is_goal']
+        search_dict['goal'] = goal
+        search_dict['get_predecessors'] = get_predecessors
+        search_dict['backward_heuristic'] = backward_heuristic
+
+    # Bidirectional and linear-space searches don't use a single open list
+    if args.search_alg in ['astar', 'gbfs', 'weighted_astar', 'bfws_r0', 'bfws_rg']:
+        search_dict['queue'] = args.queue
+        if args.k_best > 1:
+            search_dict['k_best'] = args.k_best
+            search_dict['get_successors_batch'] = get_successors_batch
+        if args.profile:
+            search_dict['profile'] = SearchProfile(sample_every=args.profile_sample_every)
+        if args.max_seconds is not None:
+            search_dict['max_seconds'] = args.max_seconds
+        if args.max_memory_gb is not None:
+            search_dict['max_memory_bytes'] = int(args.max_memory_gb * 2**30)
+
+    if 'parallel' in args.search_alg:
+        search_dict['n_workers'] = args.n_search_workers
+
     if args.search_alg == 'weighted_astar':
         assert (args.g_weight is not None
                 and args.h_weight is not None), 'Must specify weights if using weighted A*.'
@@ -110,11 +229,18 @@ def solve():
 
     if 'bfws' in args.search_alg:
         search_dict['precision'] = args.bfws_precision
+    iw_stop_reason = None
     if args.search_alg == 'bfws_rg':
         goal_fns = [(lambda x, i=i: x.state[i] == goal[i]) for i, _ in enumerate(goal)]
-        relevant_atoms = iw.iw(1, start, get_successors, goal_fns)
-        if not relevant_atoms:
-            relevant_atoms = iw.iw(2, start, get_successors, goal_fns)
+        # IW counts against the run's budgets, and the search gets the time it leaves
+        iw_start_time = time.monotonic()
+        relevant_atoms = iw.find_relevant_atoms(start, get_successors, goal_fns,
+                                                search_dict.get('max_seconds'),
+                                                search_dict.get('max_memory_bytes'))
+        iw_stop_reason = relevant_atoms.stop_reason
+        if 'max_seconds' in search_dict:
+            search_dict['max_seconds'] = max(
+                0, search_dict['max_seconds'] - (time.monotonic() - iw_start_time))
         if not relevant_atoms:
             relevant_atoms = start.all_atoms()
         search_dict['R'] = relevant_atoms
@@ -124,18 +250,15 @@ def solve():
 
 
     #%% Save the results
-    tag = args.macro_type
-    if args.random_goal:
-        tag = 'random_goal/'+tag
-    else:
-        tag = 'default_goal/'+tag
-    if args.search_alg == 'weighted_astar':
-        args.search_alg += '-g_{}-h_{}'.format(*gh_weights)
-    problem_name = 'cube' if not args.buchner2018 else 'cube-buchner2018'
-    results_dir = 'results/{}/{}/{}/'.format(problem_name, args.search_alg, tag)
-    os.makedirs(results_dir, exist_ok=True)
-    with open(results_dir+'/seed-{:03d}.pickle'.format(args.seed), 'wb') as file:
-        pickle.dump(search_results, file)
+    results_path = get_results_path(args)
+    action_ids = {name: i for i, name in enumerate(cube.ACTIONS)}
+    plan = [[action_ids[name] for name in macro] for macro in search_results[1]]
+    n_errors = len(search_results[0][-1].summarize_effects(baseline=goal))
+    save_run(results_path, search_results, plan, n_errors, args=args,
+             iw_stop_reason=iw_stop_reason)
+    if 'profile' in search_dict:
+        search_dict['profile'].save(get_profile_path(results_path))
+        print(search_dict['profile'].summary())
 
 
 if __name__ == '__main__':
@@ -1,8 +1,63 @@
 import copy
+import json
+import os
+import pickle
+import random
+import tempfile
+import time
+
+import numpy as np
 
 from domains import cube
 from domains.cube import pattern, macros
-from experiments import search
+from experiments import search, bfws, bidirectional, idastar, iw, parallel_search
+from experiments.profiling import SearchProfile
+from experiments.width import WidthAugmentedHeuristic
+
+def get_cube_search_dict(expert_macros=False, batch=False, **kwargs):
+    """Return search arguments for solving pattern.SCRAMBLE_1 with batched Cube expansion
+
+    Successors come with their goal counts, as in experiments/cube/solve.py.
+
+    Args:
+        expert_macros (bool):
+            Whether to add the expert macro-actions to the primitive actions
+        batch (bool):
+            Whether to include a matching get_successors_batch function
+        **kwargs:
+            Additional search arguments, which override the defaults
+
+    Returns:
+        A dict of keyword arguments for the search functions
+    """
+    goal = cube.Cube()
+    actions = macros.primitive.actions
+    permutations = macros.primitive.permutations
+    if expert_macros:
+        actions = actions + macros.expert.macros
+        permutations = permutations + macros.expert.permutations
+    permutations = np.stack(permutations)
+    def get_successors(cube_):
+        states, goal_counts = cube_.expand(permutations, goal=goal)
+        return [(cube_.child(state), action, h)
+                for (state, action, h) in zip(states, actions, goal_counts.tolist())]
+    def get_successors_batch(cubes):
+        states, goal_counts = cube.cube.expand_all(cubes, permutations, goal=goal)
+        return [[(cube_.child(state), action, h)
+                 for (state, action, h) in zip(cube_states, actions, cube_goal_counts.tolist())]
+                for cube_, cube_states, cube_goal_counts in zip(cubes, states, goal_counts)]
+    search_dict = {
+        'start': cube.Cube().apply(pattern.SCRAMBLE_1),
+        'is_goal': lambda node: node.state == goal,
+        'step_cost': lambda _: 1,
+        'heuristic': lambda cube_: len(cube_.summarize_effects(baseline=goal)),
+        'get_successors': get_successors,
+        'quiet': True,
+    }
+    if batch:
+        search_dict['get_successors_batch'] = get_successors_batch
+    search_dict.update(kwargs)
+    return search_dict
 
 def test():
     """Test search functionality with Cube primitive actions and expert macro-actions"""
@@ -67,5 +122,316 @@ def test():
 
     print('All tests passed.')
 
+def test_permutation_search():
+    """Test that searching with compiled permutations matches searching with swap_lists"""
+    start = cube.Cube().apply(pattern.SCRAMBLE_1)
+    macros_ = macros.primitive.actions + macros.expert.macros
+    models = macros.primitive.models + macros.expert.models
+    permutations = macros.primitive.permutations + macros.expert.permutations
+    def search_with(apply_kwargs):
+        def get_successors(cube_):
+            return [(copy.deepcopy(cube_).apply(**kwargs), macro)
+                    for (macro, kwargs) in zip(macros_, apply_kwargs)]
+        return search.astar(start=start,
+                            is_goal=lambda node: node.state == cube.Cube(),
+                            step_cost=lambda _: 1,
+                            heuristic=lambda cube_: len(cube_.summarize_effects()),
+                            get_successors=get_successors,
+                            max_transitions=3e3,
+                            quiet=True)
+    swap_results = search_with([{'swap_list': model} for model in models])
+    permutation_results = search_with([{'permutation': p} for p in permutations])
+    assert swap_results[0] == permutation_results[0]
+    assert swap_results[1:4] == permutation_results[1:4]
+
+def test_search_node_pickle():
+    """Test that slotted SearchNodes survive a pickle round trip"""
+    root = search.SearchNode(state=cube.Cube(), g_score=0, h_score=48)
+    child = search.SearchNode(state=copy.deepcopy(root.state).apply(['R']), g_score=1,
+                              h_score=20, parent=root, action=['R'])
+    assert not hasattr(child, '__dict__')
+    loaded = pickle.loads(pickle.dumps(child))
+    assert loaded.state == child.state
+    assert (loaded.g_score, loaded.h_score, loaded.action) == (1, 20, ['R'])
+    assert loaded.parent.state == root.state and loaded.parent.parent is None
+
+def test_path_atoms():
+    """Test that incremental path atoms match a full walk of the search path"""
+    random.seed(0)
+    start = cube.Cube()
+    R = set(random.sample(sorted(search.get_unique_atoms([start]), key=str), 20))
+    width_aug_heuristic = WidthAugmentedHeuristic(len(start), heuristic=None, R=R)
+    for relevant_atoms in [frozenset, width_aug_heuristic.relevant_atoms]:
+        path_atoms = search.PathAtoms(relevant_atoms)
+        node = search.SearchNode(state=start, g_score=0, h_score=random.randint(0, 3))
+        for _ in range(30):
+            path_atoms.update(node)
+            expected = relevant_atoms(search.atoms_in_path(node))
+            assert path_atoms.decode(node.atoms) == expected and node.r == len(expected)
+            state = copy.deepcopy(node.state).apply(random.choice(macros.primitive.actions))
+            node = search.SearchNode(state=state, g_score=node.g_score+1,
+                                     h_score=random.randint(0, 3), parent=node)
+
+def test_bidirectional_search():
+    """Test that bidirectional search joins its frontiers into a valid plan"""
+    start = cube.Cube().apply(['R', 'U'])
+    goal = cube.Cube().apply(['F', 'L'])
+    macros_ = macros.primitive.actions
+    permutations = macros.primitive.permutations
+    inverse_permutations = [np.argsort(permutation) for permutation in permutations]
+    def get_neighbors(perms):
+        return lambda cube_: [(copy.deepcopy(cube_).apply(permutation=permutation), macro)
+                              for (macro, permutation) in zip(macros_, perms)]
+
+    states, actions, n_expanded, _, candidates = bidirectional.bidirectional_astar(
+        start=start,
+        goal=goal,
+        step_cost=len,
+        heuristic=lambda cube_: len(cube_.summarize_effects(baseline=goal)),
+        get_successors=get_neighbors(permutations),
+        get_predecessors=get_neighbors(inverse_permutations),
+        backward_heuristic=lambda cube_: len(cube_.summarize_effects(baseline=start)),
+        max_transitions=1e5,
+        quiet=True)
+    assert states[0] == start and states[-1] == goal
+    assert n_expanded > 0 and len(actions) == len(states) - 1
+    testcube = copy.deepcopy(start)
+    for action, state in zip(actions, states[1:]):
+        testcube.apply(action)
+        assert testcube == state
+    assert candidates[-1][1].h_score == 0 and candidates[-1][1].parent is None
+
+def test_linear_space_search():
+    """Test that IDA* and RBFS find optimal plans with an admissible heuristic"""
+    start = cube.Cube().apply(['R', 'U', "F'"])
+    goal = cube.Cube()
+    def get_successors(cube_):
+        return [(copy.deepcopy(cube_).apply(permutation=permutation), macro)
+                for (macro, permutation)
+                in zip(macros.primitive.actions, macros.primitive.permutations)]
+    # A quarter turn moves at most 20 stickers
+    heuristic = lambda cube_: -(-len(cube_.summarize_effects()) // 20)
+    for search_fn in [idastar.idastar, idastar.rbfs]:
+        states, actions, _, n_transitions, candidates = search_fn(
+            start=start,
+            is_goal=lambda node: node.state == goal,
+            step_cost=len,
+            heuristic=heuristic,
+            get_successors=get_successors,
+            max_transitions=1e5,
+            quiet=True)
+        assert states[-1] == goal and len(actions) == 3
+        assert 0 < n_transitions < 1e5
+        assert candidates[-1][1].state == goal and candidates[-1][1].parent is None
+
+def test_open_lists():
+    """Test that the open list implementations expand nodes in the same order"""
+    search_dict = get_cube_search_dict(expert_macros=True, max_transitions=5e3)
+    for search_fn in [search.gbfs, search.astar, bfws.bfws]:
+        # Replacing nodes in place only preserves the expansion order when better paths
+        # always have lower priority, as in A*
+        queues = ['heap', 'bucket'] + (['indexed'] if search_fn is search.astar else [])
+        for tiebreak in ['fifo', 'lifo']:
+            heap_results, *other_results = [
+                search_fn(**search_dict, queue=queue, tiebreak=tiebreak) for queue in queues]
+            for results in other_results:
+                assert heap_results[1] == results[1]
+                assert heap_results[2:4] == results[2:4]
+
+def test_k_best_search():
+    """Test that expanding the k best nodes per iteration gives valid plans"""
+    search_dict = get_cube_search_dict(expert_macros=True, batch=True, max_transitions=5e4)
+    start, goal = search_dict['start'], cube.Cube()
+    default_results = search.gbfs(**search_dict)
+    assert search.gbfs(**search_dict, k_best=1)[1:4] == default_results[1:4]
+    states, plan, _, n_transitions, candidates = search.gbfs(**search_dict, k_best=4)
+    cube_ = copy.deepcopy(start)
+    for state, macro in zip(states[1:], plan):
+        assert cube_.apply(macro) == state
+    assert cube_ == goal and candidates[-1][1].state == goal
+    assert [n for n, _ in candidates] == sorted(n for n, _ in candidates)
+    assert n_transitions < 5e4
+
+def test_checkpoint_resume():
+    """Test that searches resumed from a checkpoint match uninterrupted searches"""
+    search_dict = get_cube_search_dict(save_best_n=5)
+    goal = cube.Cube()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for i, (search_fn, queue) in enumerate([(search.astar, 'indexed'),
+                                                (search.gbfs, 'bucket'),
+                                                (bfws.bfws, 'heap')]):
+            path = os.path.join(tmp_dir, 'search-{}.ckpt'.format(i))
+            expected = search_fn(**search_dict, queue=queue, max_transitions=3e3)
+            first = search_fn(**search_dict, queue=queue, max_transitions=1e3,
+                              checkpoint_path=path, checkpoint_interval=0)
+            assert os.path.exists(path) and first[3] < expected[3]
+            # The start state is ignored when resuming
+            resumed = search_fn(**{**search_dict, 'start': goal}, queue=queue,
+                                max_transitions=3e3, checkpoint_path=path)
+            assert resumed[1:4] == expected[1:4]
+            assert [n for n, _ in resumed[4]] == [n for n, _ in expected[4]]
+            assert resumed[5] == expected[5]
+
+        # Deep search paths are saved without recursion
+        node = search.SearchNode(0, g_score=0, h_score=0)
+        for i in range(1, 10000):
+            node = search.SearchNode(i, g_score=i, h_score=0, parent=node, action=i)
+        path = os.path.join(tmp_dir, 'deep.ckpt')
+        search.save_checkpoint(path, {'leaf': node, 'root': node.parent.parent})
+        loaded = search.load_checkpoint(path)
+        states, actions_ = search.reconstruct_path(loaded['leaf'])
+        assert states == list(range(10000)) and actions_ == list(range(1, 10000))
+        assert loaded['root'] is loaded['leaf'].parent.parent
+        assert not [name for name in os.listdir(tmp_dir) if name.endswith('.tmp')]
+
+def test_search_profile():
+    """Test that profiled searches match unprofiled ones and account for each phase"""
+    search_dict = get_cube_search_dict(max_transitions=2e3)
+    n_actions = len(macros.primitive.actions)
+    for search_fn in [search.gbfs, bfws.bfws]:
+        profile = SearchProfile(sample_every=10)
+        results = search_fn(**search_dict, profile=profile)
+        assert results[1:4] == search_fn(**search_dict)[1:4]
+        n_expanded, n_transitions = results[2:4]
+        assert (profile.n_expanded, profile.n_transitions) == (n_expanded, n_transitions)
+        assert profile.counts['successors'] == profile.counts['best_n'] == n_expanded
+        assert profile.counts['pop'] >= n_expanded
+        assert profile.counts['keys'] == profile.counts['pop'] + n_transitions + 2
+        assert (profile.counts['atoms'] > 0) == (search_fn is bfws.bfws)
+        assert 0 < sum(profile.times.values()) <= profile.total_time
+        assert len(profile.samples) == n_expanded // 10
+        assert all(row[0] % 10 == 0 and row[1] == n_actions for row in profile.samples)
+        loaded = SearchProfile.from_dict(json.loads(json.dumps(profile.to_dict())))
+        assert loaded.to_dict() == profile.to_dict()
+
+def test_search_budgets():
+    """Test that searches stop cleanly on each budget, and record which one ran out"""
+    search_dict = get_cube_search_dict(max_transitions=1e9)
+    start, goal = search_dict['start'], cube.Cube()
+    for search_fn in [search.gbfs, bfws.bfws]:
+        results = search_fn(**search_dict, max_seconds=0)
+        assert results.stop_reason == 'max_seconds'
+        assert results[0] == [start] and results[2:4] == (0, 0)
+
+        results = search_fn(**search_dict, max_seconds=0.5)
+        assert results.stop_reason == 'max_seconds' and 0 < results[3] < 1e9
+
+        results = search_fn(**search_dict, max_memory_bytes=search.get_rss_bytes())
+        assert results.stop_reason == 'max_memory_bytes' and results[2] == 0
+
+        results = search_fn(**{**search_dict, 'max_transitions': 2e3},
+                            max_seconds=60, max_memory_bytes=search.get_rss_bytes() + 2**30)
+        assert results.stop_reason == 'max_transitions' and results[3] >= 2e3
+
+    # The stop reason survives pickling
+    loaded = pickle.loads(pickle.dumps(results))
+    assert loaded == results and loaded.stop_reason == 'max_transitions'
+
+    # Searches that run out of nodes, or that find the goal
+    results = search.gbfs(start=0, is_goal=lambda node: False, step_cost=lambda _: 1,
+                          heuristic=lambda x: 0, max_transitions=100, quiet=True,
+                          get_successors=lambda x: [(x + 1, '+1')] if x < 5 else [])
+    assert results.stop_reason == 'exhausted' and results[2:4] == (6, 5)
+    results = search.gbfs(start=0, is_goal=lambda node: node.state == 3, step_cost=lambda _: 1,
+                          heuristic=lambda x: 0, max_transitions=100, quiet=True,
+                          get_successors=lambda x: [(x + 1, '+1')])
+    assert results.stop_reason == 'goal' and results[1] == ['+1'] * 3
+
+    # IW records when its budget runs out, so callers don't mistake it for IW(1) failing
+    goal_fns = [(lambda x, i=i: x.state[i] == goal[i]) for i, _ in enumerate(goal)]
+    relevant_atoms = iw.iw(1, start, search_dict['get_successors'], goal_fns, max_seconds=0)
+    assert relevant_atoms == set([]) and relevant_atoms.stop_reason == 'max_seconds'
+    relevant_atoms = iw.find_relevant_atoms(start, search_dict['get_successors'], goal_fns,
+                                            max_memory_bytes=search.get_rss_bytes())
+    assert relevant_atoms == set([]) and relevant_atoms.stop_reason == 'max_memory_bytes'
+    relevant_atoms = iw.iw(1, goal, search_dict['get_successors'], goal_fns)
+    assert relevant_atoms and relevant_atoms.stop_reason == 'goal'
+    assert pickle.loads(pickle.dumps(relevant_atoms)).stop_reason == 'goal'
+
+def test_save_best_n():
+    """Test that the saved best N paths lead to states with the saved heuristic values"""
+    search_dict = get_cube_search_dict(is_goal=lambda node: False, max_transitions=3e3,
+                                       save_best_n=20)
+    start, heuristic = search_dict['start'], search_dict['heuristic']
+    for search_fn in [search.gbfs, search.astar, idastar.idastar]:
+        best_n = search_fn(**search_dict)[5]
+        assert len(best_n) == 20
+        assert [h_score for h_score, _ in best_n] == sorted((h for h, _ in best_n), reverse=True)
+        for h_score, plan in best_n:
+            cube_ = copy.deepcopy(start)
+            for action in plan:
+                cube_.apply(action)
+            assert heuristic(cube_) == h_score
+
+def test_parallel_search():
+    """Test that parallel search reaches the goal with a valid plan and reports its workers"""
+    search_dict = get_cube_search_dict(expert_macros=True, max_transitions=3e5)
+    start, goal = search_dict['start'], cube.Cube()
+    worker_stats = []
+    states, plan, n_expanded, n_transitions, candidates = parallel_search.parallel_gbfs(
+        **search_dict, n_workers=2, worker_stats=worker_stats)
+    cube_ = copy.deepcopy(start)
+    for state, macro in zip(states[1:], plan):
+        assert cube_.apply(macro) == state
+    assert cube_ == goal and candidates[-1][1].state == goal
+    assert len(worker_stats) == 2
+    assert sum(stats['expanded'] for stats in worker_stats) == n_expanded
+    assert sum(stats['transitions'] for stats in worker_stats) == n_transitions
+
+def test_parallel_search_termination():
+    """Test that parallel search only gives up once every worker has run out of nodes
+
+    States are integers, which hash to themselves, so consecutive states have different
+    owners. In the first instance, the frontier keeps moving between workers, and most
+    batches only contain duplicates. In the second, worker 1 sends a dead end to another
+    worker and then keeps expanding a slow chain of its own states, so the other workers
+    go idle with balanced message counts while worker 1 is still busy.
+    """
+    n_states = 3000
+    def get_bouncing_successors(i):
+        return [((i + 1) % n_states, '+1', 0), ((3 * i) % n_states, '*3', 0),
+                ((7 * i + 2) % n_states, '*7+2', 0)]
+
+    chain_length = 50
+    def get_chain_successors(n_workers):
+        def get_successors(i):
+            if i == 0:
+                return [(1, 'start', 0)]
+            if i % n_workers != 1 or i >= 1 + chain_length * n_workers:
+                return []
+            time.sleep(0.002)
+            return [(i + n_workers, 'chain', 0)] + ([(2, 'dead end', 0)] if i == 1 else [])
+        return get_successors
+
+    for n_workers in [2, 3, 4]:
+        for get_successors, n_reachable in [(get_bouncing_successors, n_states),
+                                            (get_chain_successors(n_workers), chain_length + 3)]:
+            worker_stats = []
+            _, _, n_expanded, _, _ = parallel_search.parallel_gbfs(
+                start=0,
+                is_goal=lambda node: False,
+                step_cost=lambda _: 1,
+                heuristic=lambda _: 0,
+                get_successors=get_successors,
+                max_transitions=1e6,
+                n_workers=n_workers,
+                worker_stats=worker_stats,
+                quiet=True)
+            assert n_expanded == n_reachable
+            assert sum(stats['sent'] for stats in worker_stats) > 0
+
 if __name__ == '__main__':
     test()
+    test_permutation_search()
+    test_search_node_pickle()
+    test_path_atoms()
+    test_bidirectional_search()
+    test_linear_space_search()
+    test_open_lists()
+    test_k_best_search()
+    test_checkpoint_resume()
+    test_search_profile()
+    test_search_budgets()
+    test_save_best_n()
+    test_parallel_search()
+    test_parallel_search_termination()
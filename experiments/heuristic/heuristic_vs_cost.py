@@ -101,6 +101,55 @@ def compute_apsp_floyd_warshall(lock, n=6, v=2, k=1):
     return min_path_length
 
 
+def encode_states(states, v):
+    """Convert an (m, n) array of dial values to state ids (the same ids as get_state_id)"""
+    n = states.shape[-1]
+    return states @ (v ** np.arange(n-1, -1, -1))
+
+def decode_states(ids, n, v):
+    """Convert an array of state ids to an (m, n) array of dial values"""
+    return (np.asarray(ids)[:, None] // (v ** np.arange(n-1, -1, -1))) % v
+
+def compute_distances_from_zero(lock, n=6, v=2, k=1):
+    """Compute the shortest-path distance from the all-zeros state to every state
+
+    Every action adds a fixed difference vector modulo v, so the distance from start to
+    goal is the distance from zero to (goal - start) % v. A single breadth-first search
+    therefore gives every pairwise distance:
+
+        D[start, goal] == dist[encode_states((goal - start) % v, v)]
+
+    Each BFS layer is expanded in one batch per action, so this takes O(S * n^2) time and
+    O(S * n) memory for S = v**n states, rather than the O(S^2) memory and O(S^3) time of
+    all-pairs methods.
+
+    Returns:
+        An array of v**n distances, indexed by state id (-1 for unreachable states)
+    """
+    actions = lock.actions()[:n]
+    n_states = v**n
+
+    dist = np.full(n_states, -1, dtype=np.int32)
+    dist[0] = 0
+    frontier = np.zeros(1, dtype=np.int64)
+    depth = 0
+    with tqdm(total=n_states) as pbar:
+        pbar.update(1)
+        while len(frontier) > 0:
+            depth += 1
+            states = decode_states(frontier, n, v)
+            new_ids = []
+            for action in actions:
+                # Each action maps distinct states to distinct states, so successor ids
+                # only repeat across actions, and those repeats are already marked
+                ids = encode_states((states + action) % v, v)
+                ids = ids[dist[ids] < 0]
+                dist[ids] = depth
+                new_ids.append(ids)
+            frontier = np.concatenate(new_ids)
+            pbar.update(len(frontier))
+    return dist
+
 def compute_heuristic_matrix(lock, n=6, v=2, k=1):
     n_states = v**n
 
@@ -135,29 +184,22 @@ if __name__ == '__main__':
     lock = SuitcaseLock(n_vars=n, n_values=v, entanglement=k)
 
     with CPUTimer() as timer:
-        D = compute_apsp_floyd_warshall(lock, n, v, k)
-    print('floyd_warshall:', timer.duration)
-    assert False
+        dist = compute_distances_from_zero(lock, n, v, k)
+    print('bfs:', timer.duration)
 
+    # The goal-count heuristic also only depends on (goal - start) % v, and each difference
+    # occurs for exactly v**n (start, goal) pairs, so one row per difference gives the same
+    # distribution (and correlations) as one row per pair
     print('Comparing heuristic to true cost')
-    heuristic = lambda start, goal: sum(goal.summarize_effects(baseline=start) > 0)
-    data = []
+    diffs = decode_states(np.arange(n_states), n, v)
+    data = pd.DataFrame({
+        'n_dials': n,
+        'n_values': v,
+        'k': k,
+        'distance': dist,
+        'heuristic': np.count_nonzero(diffs, axis=1),
+        'seed': seed,
+    })
     results_file = results_dir+'k-{:02d}_seed-{:03d}.csv'.format(k, seed)
-
-    with open(results_file, 'w', newline='') as file:
-        index = 0
-        for row, start in enumerate(tqdm(lock.states(), total=n_states)):
-            for col, goal in enumerate(lock.states()):
-                h = heuristic(start, goal)
-                d = D[get_state_id(start),get_state_id(goal)]
-                data = {
-                    'n_dials': n,
-                    'n_values': v,
-                    'k': k,
-                    'distance': d,
-                    'heuristic': h,
-                    'seed': seed
-                }
-                pd.DataFrame([data]).to_csv(file, index=None, header=(index == 0))
-                index += 1
+    data.to_csv(results_file, index=None)
     print('Results saved to', results_file)
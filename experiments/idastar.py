@@ -0,0 +1,254 @@
+from inspect import signature
+
+from tqdm import tqdm
+
+import experiments.priorityqueue as pq
+from experiments.search import (SearchNode, get_key, reconstruct_path, reconstruct_best_n,
+                                AStarPriority)
+
+class _LinearSpaceSearch:
+    """Bookkeeping shared by the linear-space (depth-first) search algorithms
+
+    Only the nodes on the current search path, along with their generated children, are
+    kept in memory, so memory use is linear in the search depth. States are never closed,
+    so transpositions may be expanded more than once; only cycles along the current path
+    are pruned.
+    """
+    def __init__(self, start, is_goal, step_cost, heuristic, get_successors, get_priority,
+                 max_transitions, save_best_n, progress):
+        self.is_goal = is_goal
+        self.step_cost = step_cost
+        self.get_successors = get_successors
+        self.get_priority = get_priority
+        self.max_transitions = max_transitions
+        self.progress = progress
+        # Heuristics may optionally accept a precomputed value h
+        if 'h' in signature(heuristic).parameters:
+            self.heuristic_fn = lambda x, h=None: heuristic(x, h=h)
+        else:
+            self.heuristic_fn = lambda x, h=None: heuristic(x) if h is None else h
+
+        self.n_expanded = 0
+        self.n_transitions = 0
+        self.root = SearchNode(state=start, g_score=0, h_score=self.heuristic_fn(start))
+        self.best = self.root
+        self.candidates = [(self.n_transitions, self.root)]
+        # save best N nodes, always ejecting the max priority element to make room
+        self.save_best_n = save_best_n
+        self.best_n = pq.PriorityQueue(maxlen=save_best_n, mode='max')
+        # Keys of the states on the current search path, for cycle detection
+        self.path_keys = {get_key(start)}
+
+    def out_of_budget(self):
+        return self.n_transitions >= self.max_transitions
+
+    def expand(self, current):
+        """Expand a node, returning the list of its children that aren't on the current path
+
+        Returns None if the node satisfies the goal condition.
+        """
+        self.n_expanded += 1
+        if self.is_goal(current):
+            self.candidates.append((self.n_transitions, current))
+            return None
+
+        if (current.h_score < self.best.h_score
+                or (current.h_score == self.best.h_score
+                    and current.g_score < self.best.g_score)):
+            # Found better node!
+            self.best = current
+            self.candidates.append((self.n_transitions, current))
+        if self.save_best_n > 1:
+            self.best_n.push((current.h_score, current))
+
+        successors = self.get_successors(current.state)
+        self.n_transitions += len(successors)
+        self.progress.update(len(successors))
+        children = []
+        for state, action, *precomputed_h in successors:
+            if get_key(state) in self.path_keys:
+                continue
+            children.append(SearchNode(state=state,
+                                       g_score=current.g_score + self.step_cost(action),
+                                       h_score=self.heuristic_fn(state, *precomputed_h),
+                                       parent=current, action=action))
+        return children
+
+    def push(self, node):
+        self.path_keys.add(get_key(node.state))
+
+    def pop(self, node):
+        self.path_keys.discard(get_key(node.state))
+
+    def results(self, goal_node=None):
+        if goal_node is not None:
+            # Found goal! Reconstructing path...
+            return reconstruct_path(goal_node) + (self.n_expanded, self.n_transitions,
+                                                  self.candidates)
+        # No solution found. Reconstructing path to best node...
+        results = reconstruct_path(self.best) + (self.n_expanded, self.n_transitions,
+                                                 self.candidates)
+        if self.save_best_n > 1:
+            results += (reconstruct_best_n(self.best_n),)
+        return results
+
+def _idastar(start, is_goal, step_cost, heuristic, get_successors,
+             get_priority=AStarPriority(), max_transitions=0, save_best_n=1, quiet=False):
+    """Core implementation of iterative-deepening A* (IDA*)
+
+    Runs a series of depth-first searches, each of which prunes nodes whose priority
+    exceeds the current bound. The bound starts at the root's priority and is raised to
+    the smallest pruned priority after each iteration. The search uses an explicit stack,
+    so memory use is linear in the search depth.
+
+    Args:
+        start:
+            The state at which to begin the search
+        is_goal (callable[SearchNode]):
+            A function that returns whether a node has satisfied the goal condition
+        step_cost (callable):
+            A function that takes an action/macro as input and returns its step cost
+        heuristic (callable):
+            A function that takes a state as input and returns its heuristic value
+        get_successors (callable):
+            A function that takes a state as input and returns all possible successors, as
+            a list of (state, action) pairs, or (state, action, h) triples (see
+            search.best_first_search)
+        get_priority (callable):
+            A function that takes a SearchNode as input and returns its priority (f-score).
+            Defaults to g + h.
+        max_transitions (int):
+            The simulation budget for the search, counting repeated transitions
+        save_best_n (int):
+            The number of best SearchNodes to maintain during the search
+        quiet (boolean):
+            Whether to suppress progress bars
+    """
+    with tqdm(total=max_transitions, disable=quiet) as progress:
+        search = _LinearSpaceSearch(start, is_goal, step_cost, heuristic, get_successors,
+                                    get_priority, max_transitions, save_best_n, progress)
+        root = search.root
+        bound = get_priority(root)
+        while not search.out_of_budget():
+            next_bound = float('inf')
+            search.path_keys = {get_key(start)}
+            # Each stack entry is a node and an iterator over its remaining children
+            stack = [(root, None)]
+            while stack and not search.out_of_budget():
+                current, children = stack[-1]
+                if children is None:
+                    priority = get_priority(current)
+                    if priority > bound:
+                        next_bound = min(next_bound, priority)
+                        stack.pop()
+                        search.pop(current)
+                        continue
+                    expanded = search.expand(current)
+                    if expanded is None:
+                        return search.results(goal_node=current)
+                    children = iter(expanded)
+                    stack[-1] = (current, children)
+                child = next(children, None)
+                if child is None:
+                    stack.pop()
+                    search.pop(current)
+                    continue
+                search.push(child)
+                stack.append((child, None))
+            if next_bound == float('inf'):
+                break # The search space has been exhausted
+            bound = next_bound
+        return search.results()
+
+class _RBFSFrame:
+    """A stack frame for RBFS, i.e. one node on the current search path
+
+    Attributes:
+        node (SearchNode):
+            The node for this frame
+        priority (float):
+            The node's backed-up priority
+        f_limit (float):
+            The priority limit above which the search unwinds past this node
+        children (list):
+            The node's children, once it has been expanded
+        priorities (list):
+            The backed-up priority of each child
+        active (int):
+            The index of the child currently being searched
+    """
+    __slots__ = ('node', 'priority', 'f_limit', 'children', 'priorities', 'active')
+
+    def __init__(self, node, priority, f_limit):
+        self.node = node
+        self.priority = priority
+        self.f_limit = f_limit
+        self.children = None
+        self.priorities = None
+        self.active = None
+
+def _rbfs(start, is_goal, step_cost, heuristic, get_successors,
+          get_priority=AStarPriority(), max_transitions=0, save_best_n=1, quiet=False):
+    """Core implementation of recursive best-first search (RBFS)
+
+    RBFS expands nodes in best-first order using only linear space: it descends into the
+    best child while its backed-up priority stays within the priority of the best
+    alternative, and backs up the best remaining priority when it unwinds. The recursion
+    is implemented with an explicit stack to avoid python's recursion limit.
+
+    Args:
+        Same as for IDA* (see _idastar).
+    """
+    with tqdm(total=max_transitions, disable=quiet) as progress:
+        search = _LinearSpaceSearch(start, is_goal, step_cost, heuristic, get_successors,
+                                    get_priority, max_transitions, save_best_n, progress)
+        root = search.root
+        stack = [_RBFSFrame(root, get_priority(root), f_limit=float('inf'))]
+        while stack and not search.out_of_budget():
+            frame = stack[-1]
+            if frame.children is None:
+                children = search.expand(frame.node)
+                if children is None:
+                    return search.results(goal_node=frame.node)
+                # Children inherit their parent's backed-up priority if it has been raised
+                priority = get_priority(frame.node)
+                frame.children = children
+                frame.priorities = [get_priority(child) for child in children]
+                if priority < frame.priority:
+                    frame.priorities = [max(p, frame.priority) for p in frame.priorities]
+
+            ranked = sorted(range(len(frame.children)), key=frame.priorities.__getitem__)
+            if not ranked or frame.priorities[ranked[0]] > frame.f_limit:
+                # Unwind, backing up the best remaining priority to the parent frame
+                stack.pop()
+                search.pop(frame.node)
+                if stack:
+                    parent = stack[-1]
+                    parent.priorities[parent.active] = (frame.priorities[ranked[0]]
+                                                        if ranked else float('inf'))
+                continue
+
+            best_idx = ranked[0]
+            alternative = frame.priorities[ranked[1]] if len(ranked) > 1 else float('inf')
+            frame.active = best_idx
+            child = frame.children[best_idx]
+            search.push(child)
+            stack.append(_RBFSFrame(child, frame.priorities[best_idx],
+                                    f_limit=min(frame.f_limit, alternative)))
+        return search.results()
+
+def _strip_parents(results):
+    # Strip the candidates' parent information so that the results can be pickled
+    # without hitting python's recursion limit (see search.best_first_search).
+    candidates = results[4]
+    for _, node in candidates:
+        node.parent = None
+    return results
+
+def idastar(*args, **kwargs):
+    """Iterative-deepening A* (IDA*)"""
+    return _strip_parents(_idastar(*args, **kwargs))
+
+def rbfs(*args, **kwargs):
+    """Recursive best-first search (RBFS)"""
+    return _strip_parents(_rbfs(*args, **kwargs))
@@ -1,8 +1,45 @@
+import time
 from collections import deque
-from experiments.search import SearchNode, reconstruct_path, get_unique_atoms
+from experiments.search import (SearchNode, SearchBudget, reconstruct_path, get_unique_atoms,
+                                get_key)
 from experiments.width import WidthAugmentedHeuristic
 
-def iw(k, start, get_successors, goal_fns):
+class IWResults(set):
+    """The relevant atoms found by IW(k), with a record of why the search stopped
+
+    Attributes:
+        stop_reason (str):
+            'goal' if every goal function was satisfied, 'exhausted' if the states that
+            pass the novelty check ran out first, or else the name of the budget that ran
+            out: 'max_seconds' or 'max_memory_bytes'
+    """
+    def __init__(self, atoms=(), stop_reason=None):
+        super().__init__(atoms)
+        self.stop_reason = stop_reason
+
+def iw(k, start, get_successors, goal_fns, max_seconds=None, max_memory_bytes=None):
+    """Iterated width search IW(k) for the relevant atoms of a set of goals
+
+    Args:
+        k (int):
+            The maximum novelty width of states to expand
+        start:
+            The state at which to begin the search
+        get_successors (callable):
+            A function that takes a state as input and returns all possible successors
+        goal_fns (list):
+            Functions that each take a SearchNode and return whether it satisfies a goal
+        max_seconds (float, optional):
+            The wall-clock budget for the search, in seconds
+        max_memory_bytes (int, optional):
+            The budget for the process's resident memory, in bytes (see SearchBudget)
+
+    Returns:
+        An IWResults set of the atoms in the paths to the first node satisfying each goal
+        function. It is empty if some goal function was never satisfied before the search
+        (or its budget) ran out, and its stop_reason says which.
+    """
+    budget = SearchBudget(max_seconds, max_memory_bytes)
     goal_nodes = [None for g in goal_fns]
     width_heuristic = WidthAugmentedHeuristic(n_variables=len(start),
                                               heuristic = lambda x: 0,
@@ -17,15 +54,19 @@ def iw(k, start, get_successors, goal_fns):
     root = SearchNode(state=start, g_score=0, h_score=0, parent=None, action=None)
 
     # Adding root to open set
-    seen_set.add(start)
+    seen_set.add(get_key(start))
     _ = width_fn(start)# mark the start state as seen by novelty function
     open_queue.append(root)
 
     while open_queue:
+        stop_reason = budget.exceeded()
+        if stop_reason is not None:
+            return IWResults(stop_reason=stop_reason)
         current = open_queue.popleft()
-        if current.state in closed_set:
+        current_key = get_key(current.state)
+        if current_key in closed_set:
             continue  # Node already in closed set; ignore it
-        closed_set.add(current.state)
+        closed_set.add(current_key)
 
         # Check for satisfied goal_fns
         n_expanded += 1
@@ -42,30 +83,55 @@ def iw(k, start, get_successors, goal_fns):
         # Considering successors...
         successors = get_successors(current.state)
         n_transitions += len(successors)
-        for state, action in successors:
+        for state, action, *_ in successors:
+            key = get_key(state)
             # If the state fails the novelty check, prune it
             if width_fn(state) > k:
-                seen_set.add(state)
-                closed_set.add(state)
+                seen_set.add(key)
+                closed_set.add(key)
 
-            if state in closed_set:
+            if key in closed_set:
                 continue
 
-            if state not in seen_set:
-                seen_set.add(state)
+            if key not in seen_set:
+                seen_set.add(key)
                 neighbor = SearchNode(state=state, g_score=0, h_score=0,
                                       parent=current, action=action)
                 open_queue.append(neighbor)
     else:
         # At least one goal_fn was not satisfied
-        return set([])
+        return IWResults(stop_reason='exhausted')
 
     # All goal_fns were satisfied!
     goal_paths = [reconstruct_path(g) for g in goal_nodes]
     trajectories = [states for (states, actions) in goal_paths]
     visited_states = [state for trajectory in trajectories for state in trajectory]
     relevant_atoms = get_unique_atoms(visited_states)
-    return relevant_atoms
+    return IWResults(relevant_atoms, stop_reason='goal')
+
+def find_relevant_atoms(start, get_successors, goal_fns, max_seconds=None,
+                        max_memory_bytes=None):
+    """Find the relevant atoms for BFWS(R) with IW(1), falling back to IW(2) if IW(1)
+    runs out of states before satisfying every goal
+
+    Args:
+        start, get_successors, goal_fns:
+            As for iw()
+        max_seconds (float, optional):
+            The wall-clock budget for both IW searches together, in seconds
+        max_memory_bytes (int, optional):
+            The budget for the process's resident memory, in bytes (see SearchBudget)
+
+    Returns:
+        The IWResults of the last IW search
+    """
+    start_time = time.monotonic()
+    results = iw(1, start, get_successors, goal_fns, max_seconds, max_memory_bytes)
+    if results.stop_reason == 'exhausted':
+        if max_seconds is not None:
+            max_seconds -= time.monotonic() - start_time
+        results = iw(2, start, get_successors, goal_fns, max_seconds, max_memory_bytes)
+    return results
 
 if __name__ == "__main__":
     from domains.npuzzle.npuzzle import NPuzzle
\ No newline at end of file
@@ -43,19 +43,23 @@ def main():
         return [(copy.deepcopy(puz).transition(a), [a]) for a in puz.actions()]
 
     #%% Run the search
+    # Long searches periodically save a checkpoint, and resume from it if restarted
+    results_dir = 'results/macros/npuzzle/'
+    checkpoint_path = results_dir+'macro-{}-search.ckpt'.format(tag)
     search_results = search.astar(start = copy.deepcopy(puzzle),
                                   is_goal = lambda node: False,
                                   step_cost = lambda action: 1,
                                   heuristic = heuristic,
                                   get_successors = get_successors,
                                   max_transitions = args.max_transitions,
-                                  save_best_n = args.save_best_n)
+                                  save_best_n = args.save_best_n,
+                                  checkpoint_path = checkpoint_path)
 
     #%% Save the results
-    results_dir = 'results/macros/npuzzle/'
     os.makedirs(results_dir, exist_ok=True)
     with open(results_dir+'macro-{}-results.pickle'.format(tag), 'wb') as file:
         pickle.dump(search_results, file)
+    os.remove(checkpoint_path)
 
 
 if __name__ == '__main__':
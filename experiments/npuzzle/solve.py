@@ -1,20 +1,26 @@
 import argparse
-import copy
 import os
-import pickle
 import random
 import sys
+import time
 from types import SimpleNamespace
 
 import numpy as np
 
-from domains.npuzzle import NPuzzle, macros
-from experiments import search, iw, bfws
+from domains import effects
+from domains.npuzzle import NPuzzle, expand_all, macros, pdb
+from experiments import search, iw, bfws, bidirectional, idastar, parallel_search
+from experiments.profiling import SearchProfile, get_profile_path
+from experiments.results import save_run
 
-def parse_args():
+def parse_args(args=None):
     """Parse input arguments
 
     Use --help to see a pretty description of the arguments
+
+    Args:
+        args (list, optional):
+            The list of argument strings to parse. Defaults to sys.argv[1:].
     """
     if 'ipykernel' in sys.argv[0]:
         sys.argv = [sys.argv[0]]
@@ -27,8 +33,27 @@ def parse_args():
                         choices=['primitive','random','learned'],
                         help='Type of macro_list to consider during search')
     parser.add_argument('--search_alg', type=str, default='gbfs',
-                        choices = ['astar', 'gbfs', 'weighted_astar','bfws_r0', 'bfws_rg'],
+                        choices = ['astar', 'gbfs', 'weighted_astar','bfws_r0', 'bfws_rg',
+                                   'bidirectional_astar', 'bidirectional_gbfs', 'idastar',
+                                   'rbfs', 'parallel_astar', 'parallel_gbfs'],
                         help='Search algorithm to run')
+    parser.add_argument('--queue', type=str, default='heap',
+                        choices=['heap', 'bucket', 'indexed'],
+                        help='Open list for best-first search')
+    parser.add_argument('--k_best', type=int, default=1,
+                        help='Number of best nodes to expand per iteration of best-first search')
+    parser.add_argument('--profile', action='store_true',
+                        help='Time each phase of best-first search, and save the profile '
+                             'next to the results')
+    parser.add_argument('--profile_sample_every', type=int, default=0,
+                        help='Also record the per-phase costs of every Nth expansion')
+    parser.add_argument('--n_search_workers', type=int, default=os.cpu_count(),
+                        help='Number of worker processes for parallel search algorithms')
+    parser.add_argument('--heuristic', type=str, default='goal_count',
+                        choices=['goal_count', 'pdb'],
+                        help='Heuristic to use: misplaced-tile count, or additive pattern databases')
+    parser.add_argument('--pdb_partition', type=str, default=None,
+                        help='Which pattern database partition to use (see domains.npuzzle.pdb)')
     parser.add_argument('--g_weight', type=float, default=None,
                         help='Weight for g-score in weighted A*')
     parser.add_argument('--h_weight', type=float, default=None,
@@ -37,15 +62,47 @@ def parse_args():
                         help='Generate a random goal instead of the default solve configuration')
     parser.add_argument('--max_transitions', type=lambda x: int(float(x)), default=5e5,
                         help='Maximum number of state transitions')
+    parser.add_argument('--max_seconds', type=float, default=None,
+                        help='Wall-clock budget for best-first search (including IW for '
+                             'bfws_rg), after which it stops with the best node so far')
+    parser.add_argument('--max_memory_gb', type=float, default=None,
+                        help='Resident memory budget for best-first search (and IW) in GB')
     parser.add_argument('--bfws_precision', type=int, default=3,
                         help='The number of width values, w \in {1,...,P}, to use when the search algorithm is best-first width search')
-    return parser.parse_args()
+    return parser.parse_args(args)
+
+
+def get_results_path(args):
+    """Return the path of the results file for the given arguments"""
+    tag = '{}-puzzle/'.format(args.n)
+    if args.random_goal:
+        tag += 'random_goal/'
+    else:
+        tag += 'default_goal/'
+    tag += args.macro_type
 
+    search_alg = args.search_alg
+    if args.heuristic != 'goal_count':
+        search_alg += '-' + args.heuristic
+        if args.pdb_partition is not None:
+            search_alg += '_' + args.pdb_partition
+    if args.k_best > 1:
+        search_alg += '-k_{}'.format(args.k_best)
+    if args.queue != 'heap':
+        search_alg += '-queue_{}'.format(args.queue)
+    results_dir = 'results/npuzzle/{}/{}/'.format(search_alg, tag)
+    return results_dir+'seed-{:03d}.npz'.format(args.random_seed)
 
-def solve():
-    """Instantiate an N-Puzzle and solve with the specified macro-actions and search algorithm"""
-    args = parse_args()
-    #
+
+def solve(args=None):
+    """Instantiate an N-Puzzle and solve with the specified macro-actions and search algorithm
+
+    Args:
+        args (argparse.Namespace, optional):
+            The parsed arguments (see parse_args). Defaults to parsing sys.argv.
+    """
+    if args is None:
+        args = parse_args()
 
     # Set up the scramble
     random.seed(args.random_seed)
@@ -70,12 +127,12 @@ def solve():
         macros.generate_random_macro_set(args.random_seed)
 
     macro_namespace = {
-        'primitive': SimpleNamespace(macros=[], models=[]),
+        'primitive': SimpleNamespace(macros={}, models={}, permutations={}),
         'random': macros.random,
         'learned': macros.learned,
     }[args.macro_type]
     macro_list = macro_namespace.macros
-    model_list = macro_namespace.models
+    permutation_list = macro_namespace.permutations
 
     # Set up the search problem
     search_fn = {
@@ -84,27 +141,131 @@ def solve():
         'weighted_astar': search.weighted_astar,
         'bfws_r0': bfws.bfws,
         'bfws_rg': bfws.bfws,
+        'bidirectional_astar': bidirectional.bidirectional_astar,
+        'bidirectional_gbfs': bidirectional.bidirectional_gbfs,
+        'idastar': idastar.idastar,
+        'rbfs': idastar.rbfs,
+        'parallel_astar': parallel_search.parallel_astar,
+        'parallel_gbfs': parallel_search.parallel_gbfs,
     }[args.search_alg]
 
+    # The valid actions and macros only depend on the blank index, so stack their
+    # permutations and find the positions they change once per blank index
+    expansions = {}
+    def get_expansion(puz):
+        if puz.blank_idx not in expansions:
+            valid_macros = [[a] for a in puz.actions()]
+            valid_macros += list(macro_list.get(puz.blank_idx, []))
+            permutations = puz.action_permutations()
+            permutations += list(permutation_list.get(puz.blank_idx, []))
+            permutations = np.stack(permutations)
+            changed_positions = effects.get_changed_positions(
+                permutations != np.arange(permutations.shape[1]))
+            expansions[puz.blank_idx] = (valid_macros, permutations, changed_positions)
+        return expansions[puz.blank_idx]
+
+    # Pattern databases are memory-mapped, so the tables are shared with other processes
+    pdb_heuristic = None
+    if args.heuristic == 'pdb':
+        pdb_heuristic = pdb.AdditivePDBHeuristic(args.n, args.pdb_partition, goal=goal)
+    heuristic = pdb_heuristic or (lambda puz: len(puz.summarize_effects(baseline=goal)[0]))
+
     def get_successors(puz):
-        successors = [(copy.deepcopy(puz).transition(a), [a]) for a in puz.actions()]
-        if args.macro_type != 'primitive':
-            valid_macros = macro_list[puz.blank_idx]
-            valid_models = model_list[puz.blank_idx]
-            macro_successors = [(copy.deepcopy(puz).apply_macro(model=model), macro)
-                                for (macro, model) in zip(valid_macros, valid_models)]
-            successors += macro_successors
-        return successors
+        # Generate all successors and their heuristic values in one batch
+        valid_macros, permutations, changed_positions = get_expansion(puz)
+        states, goal_counts = puz.expand(permutations, goal, changed_positions)
+        h_values = goal_counts if pdb_heuristic is None else pdb_heuristic.batch(states)
+        return [(puz.child(state), macro, h)
+                for (state, macro, h) in zip(states, valid_macros, h_values.tolist())]
+
+    def get_successors_batch(puzzles):
+        # Puzzles with the same blank index share their valid macros, so generate the
+        # successors of each such group and their heuristic values in one batch
+        groups = {}
+        for i, puz in enumerate(puzzles):
+            groups.setdefault(puz.blank_idx, []).append(i)
+        successor_lists = [None] * len(puzzles)
+        for indices in groups.values():
+            group = [puzzles[i] for i in indices]
+            valid_macros, permutations, _ = get_expansion(group[0])
+            states, goal_counts = expand_all(group, permutations, goal=goal)
+            h_values = goal_counts
+            if pdb_heuristic is not None:
+                h_values = pdb_heuristic.batch(states.reshape(-1, states.shape[-1]))
+                h_values = h_values.reshape(goal_counts.shape)
+            for i, puz, puz_states, puz_h_values in zip(indices, group, states, h_values):
+                successor_lists[i] = [(puz.child(state), macro, h) for (state, macro, h)
+                                      in zip(puz_states, valid_macros, puz_h_values.tolist())]
+        return successor_lists
 
     search_dict = {
         'start': start,
         'is_goal': lambda node: node.state == goal,
         'step_cost': lambda macro: 1,
-        'heuristic': lambda puz: len(puz.summarize_effects(baseline=goal)[0]),
+        'heuristic': heuristic,
         'get_successors': get_successors,
         'max_transitions': args.max_transitions,
     }
 
+    if 'bidirectional' in args.search_alg:
+        # Search backward from the goal using inverse permutations. Primitive actions are
+        # their own inverses, but macros must be grouped by their *ending* blank index.
+        macros_by_end_blank = {}
+        for blank_idx, macro_perms in permutation_list.items():
+            blank = blank_idx[0]*start.width + blank_idx[1]
+            for macro, perm in zip(macro_list[blank_idx], macro_perms):
+                end_blank_idx = divmod(int(np.argmax(perm == blank)), start.width)
+                macros_by_end_blank.setdefault(end_blank_idx, []).append((macro, np.argsort(perm)))
+        reverse_expansions = {}
+        def get_reverse_expansion(puz):
+            if puz.blank_idx not in reverse_expansions:
+                valid_macros = [[puz.blank_idx]] * len(puz.actions())
+                permutations = puz.action_permutations()
+                for macro, inverse_perm in macros_by_end_blank.get(puz.blank_idx, []):
+                    valid_macros.append(macro)
+                    permutations.append(inverse_perm)
+                permutations = np.stack(permutations)
+                changed_positions = effects.get_changed_positions(
+                    permutations != np.arange(permutations.shape[1]))
+                reverse_expansions[puz.blank_idx] = (valid_macros, permutations,
+                                                     changed_positions)
+            return reverse_expansions[puz.blank_idx]
+
+        backward_pdb_heuristic = None
+        if pdb_heuristic is not None:
+            backward_pdb_heuristic = pdb.AdditivePDBHeuristic(args.n, args.pdb_partition,
+                                                              goal=start)
+        backward_heuristic = (backward_pdb_heuristic
+                              or (lambda puz: len(puz.summarize_effects(baseline=start)[0])))
+
+        def get_predecessors(puz):
+            valid_macros, permutations, changed_positions = get_reverse_expansion(puz)
+            states, start_counts = puz.expand(permutations, start, changed_positions)
+            if backward_pdb_heuristic is not None:
+                start_counts = backward_pdb_heuristic.batch(states)
+            return [(puz.child(state), macro, h)
+                    for (state, macro, h) in zip(states, valid_macros, start_counts.tolist())]
+        del search_dict['is_goal']
+        search_dict['goal'] = goal
+        search_dict['get_predecessors'] = get_predecessors
+        search_dict['backward_heuristic'] = backward_heuristic
+
+    # Bidirectional and linear-space searches don't use a single open list
+    if args.search_alg in ['astar', 'gbfs', 'weighted_astar', 'bfws_r0', 'bfws_rg']:
+        search_dict['queue'] = args.queue
+        if args.k_best > 1:
+            search_dict['k_best'] = args.k_best
+            search_dict['get_successors_batch'] = get_successors_batch
+        if args.profile:
+            search_dict['profile'] = SearchProfile(sample_every=args.profile_sample_every)
+        if args.max_seconds is not None:
+            search_dict['max_seconds'] = args.max_seconds
+        if args.max_memory_gb is not None:
+            search_dict['max_memory_bytes'] = int(args.max_memory_gb * 2**30)
+
+    if 'parallel' in args.search_alg:
+        search_dict['n_workers'] = args.n_search_workers
+
     if args.search_alg == 'weighted_astar':
         assert (args.g_weight is not None
                 and args.h_weight is not None), 'Must specify weights if using weighted A*.'
@@ -113,11 +274,18 @@ def solve():
 
     if 'bfws' in args.search_alg:
         search_dict['precision'] = args.bfws_precision
+    iw_stop_reason = None
     if args.search_alg == 'bfws_rg':
         goal_fns = [(lambda x, i=i: x.state[i] == goal[i]) for i, _ in enumerate(goal)]
-        relevant_atoms = iw.iw(1, start, get_successors, goal_fns)
-        if not relevant_atoms:
-            relevant_atoms = iw.iw(2, start, get_successors, goal_fns)
+        # IW counts against the run's budgets, and the search gets the time it leaves
+        iw_start_time = time.monotonic()
+        relevant_atoms = iw.find_relevant_atoms(start, get_successors, goal_fns,
+                                                search_dict.get('max_seconds'),
+                                                search_dict.get('max_memory_bytes'))
+        iw_stop_reason = relevant_atoms.stop_reason
+        if 'max_seconds' in search_dict:
+            search_dict['max_seconds'] = max(
+                0, search_dict['max_seconds'] - (time.monotonic() - iw_start_time))
         if not relevant_atoms:
             relevant_atoms = start.all_atoms()
         search_dict['R'] = relevant_atoms
@@ -126,17 +294,15 @@ def solve():
     search_results = search_fn(**search_dict)
 
     #%% Save the results
-    tag = '{}-puzzle/'.format(args.n)
-    if args.random_goal:
-        tag += 'random_goal/'
-    else:
-        tag += 'default_goal/'
-    tag += args.macro_type
-
-    results_dir = 'results/npuzzle/{}/{}/'.format(args.search_alg,tag)
-    os.makedirs(results_dir, exist_ok=True)
-    with open(results_dir+'seed-{:03d}.pickle'.format(args.random_seed), 'wb') as file:
-        pickle.dump(search_results, file)
+    results_path = get_results_path(args)
+    # Each primitive action is the (row, col) of the tile that moves into the blank
+    plan = [[row*start.width + col for (row, col) in macro] for macro in search_results[1]]
+    n_errors = len(search_results[0][-1].summarize_effects(baseline=goal)[0])
+    save_run(results_path, search_results, plan, n_errors, args=args,
+             iw_stop_reason=iw_stop_reason)
+    if 'profile' in search_dict:
+        search_dict['profile'].save(get_profile_path(results_path))
+        print(search_dict['profile'].summary())
 
 
 if __name__ == '__main__':
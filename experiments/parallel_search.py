@@ -0,0 +1,385 @@
+import multiprocessing
+import os
+import queue
+import threading
+import traceback
+
+from tqdm import tqdm
+
+import experiments.priorityqueue as pq
+from experiments.search import SearchNode, get_key, AStarPriority, GBFSPriority
+
+# Number of expansions between progress reports from each worker to the coordinator
+PROGRESS_INTERVAL = 16
+
+def get_owner(key, n_workers):
+    """Return the index of the worker that owns the state with the given key
+
+    Workers are forked from the coordinator, so they share its hash seed and agree on
+    the owner of every key.
+    """
+    return hash(key) % n_workers
+
+class _Worker:
+    """One process of a hash-distributed best-first search
+
+    The worker keeps the open list, g-scores and closed list for the states it owns.
+    Successors owned by other workers are sent to them in one batch per expansion.
+    Closed states remember their parent's key and the action that reached them, so
+    the coordinator can reconstruct paths by asking each owner in turn.
+    """
+    def __init__(self, index, inboxes, coordinator, problem):
+        self.index = index
+        self.inboxes = inboxes
+        self.inbox = inboxes[index]
+        self.coordinator = coordinator
+        (self.is_goal, self.step_cost, self.heuristic, self.get_successors,
+         self.get_priority, self.save_best_n) = problem
+        self.open_set = pq.HeapQueue()
+        self.g_score = {}
+        self.closed = {}
+        self.best = None
+        self.best_n = pq.PriorityQueue(maxlen=self.save_best_n, mode='max')
+        self.stats = {'expanded': 0, 'transitions': 0, 'duplicates': 0, 'sent': 0,
+                      'received': 0, 'max_open': 0}
+        self.unreported = [0, 0]
+        self.wave = 0
+        self.last_idle_report = None
+        self.stopped = False
+
+    def run(self):
+        """Expand nodes until stopped, then answer path queries until told to exit"""
+        while True:
+            if self.stopped or not self.open_set:
+                self.report_idle()
+                if not self.handle(self.inbox.get()):
+                    return
+            while True:
+                try:
+                    message = self.inbox.get_nowait()
+                except queue.Empty:
+                    break
+                if not self.handle(message):
+                    return
+            if self.open_set and not self.stopped:
+                self.expand()
+
+    def handle(self, message):
+        """Handle a message from the coordinator or another worker, returning False if
+        the worker should exit"""
+        kind = message[0]
+        if kind == 'nodes':
+            self.stats['received'] += 1
+            if not self.stopped:
+                for priority, entry in message[1]:
+                    self.add(priority, entry)
+                if self.open_set and self.last_idle_report is not None:
+                    # Withdraw the idle report, so the coordinator doesn't count on it
+                    self.coordinator.put(('active', self.index))
+                    self.last_idle_report = None
+        elif kind == 'probe':
+            # Report again once idle, even if the counts haven't changed
+            self.wave = message[1]
+            self.last_idle_report = None
+        elif kind == 'trace':
+            key = message[1]
+            self.coordinator.put(('trace', key, self.closed[key]))
+        elif kind == 'stop':
+            self.stopped = True
+            # Keep reading the inbox while the batches already sent are flushed
+            stats = ('stats', self.index, dict(self.stats), self.best_n.items())
+            threading.Thread(target=self.finish_sending, args=(stats,), daemon=True).start()
+        elif kind == 'exit':
+            self.coordinator.cancel_join_thread()
+            return False
+        return True
+
+    def add(self, priority, entry):
+        """Add a node to the open list if it is the best path so far to its state"""
+        key, g_score = entry[0], entry[1]
+        if key in self.closed or g_score >= self.g_score.get(key, float('inf')):
+            self.stats['duplicates'] += 1
+            return
+        self.g_score[key] = g_score
+        self.open_set.push(priority, entry)
+        self.stats['max_open'] = max(self.stats['max_open'], len(self.open_set))
+
+    def expand(self):
+        """Expand the best open node, routing its successors to their owners"""
+        _, (key, g_score, h_score, state, parent_key, action) = self.open_set.pop()
+        if key in self.closed:
+            return
+        self.closed[key] = (state, parent_key, action)
+        self.stats['expanded'] += 1
+        self.unreported[0] += 1
+        if self.best is None or (h_score, g_score) < self.best:
+            self.best = (h_score, g_score)
+            self.coordinator.put(('best', key, state, g_score, h_score))
+        self.best_n.push((h_score, key))
+
+        successors = self.get_successors(state)
+        self.stats['transitions'] += len(successors)
+        self.unreported[1] += len(successors)
+        n_workers = len(self.inboxes)
+        outboxes = {}
+        for successor, successor_action, *precomputed_h in successors:
+            successor_key = get_key(successor)
+            successor_g_score = g_score + self.step_cost(successor_action)
+            owner = get_owner(successor_key, n_workers)
+            if owner == self.index and (successor_key in self.closed
+                                        or successor_g_score >= self.g_score.get(
+                                            successor_key, float('inf'))):
+                self.stats['duplicates'] += 1
+                continue
+            if precomputed_h:
+                successor_h_score = precomputed_h[0]
+            else:
+                successor_h_score = self.heuristic(successor)
+            node = SearchNode(state=successor, g_score=successor_g_score,
+                              h_score=successor_h_score)
+            if self.is_goal(node):
+                self.report_progress()
+                self.coordinator.put(('goal', key, successor, successor_action,
+                                      successor_g_score, successor_h_score))
+                return
+            entry = (successor_key, successor_g_score, successor_h_score, successor, key,
+                     successor_action)
+            if owner == self.index:
+                self.add(self.get_priority(node), entry)
+            else:
+                outboxes.setdefault(owner, []).append((self.get_priority(node), entry))
+        for owner, batch in outboxes.items():
+            self.inboxes[owner].put(('nodes', batch))
+            self.stats['sent'] += 1
+        if self.stats['expanded'] % PROGRESS_INTERVAL == 0:
+            self.report_progress()
+
+    def finish_sending(self, stats):
+        """Wait until every batch sent to other workers is in their inboxes, then send
+        the worker's stats to the coordinator
+
+        A worker that exits while it is still writing to another worker's inbox would
+        leave that inbox locked, so the coordinator waits for every worker's stats before
+        telling them to exit.
+        """
+        for index, inbox in enumerate(self.inboxes):
+            if index != self.index:
+                inbox.close()
+                inbox.join_thread()
+        self.coordinator.put(stats)
+
+    def report_progress(self):
+        if any(self.unreported):
+            self.coordinator.put(('progress', self.index, *self.unreported))
+            self.unreported = [0, 0]
+
+    def report_idle(self):
+        """Tell the coordinator this worker has no work, along with its message counts
+        and the latest probe wave it has seen (see _parallel_best_first_search)"""
+        self.report_progress()
+        report = (self.wave, self.stats['sent'], self.stats['received'])
+        if not self.stopped and report != self.last_idle_report:
+            self.coordinator.put(('idle', self.index) + report)
+            self.last_idle_report = report
+
+def _run_worker(index, inboxes, coordinator, problem):
+    try:
+        _Worker(index, inboxes, coordinator, problem).run()
+    except Exception: # pylint: disable=broad-except
+        coordinator.put(('error', index, traceback.format_exc()))
+
+def _parallel_best_first_search(start, is_goal, step_cost, heuristic, get_successors,
+                                get_priority, max_transitions=0, save_best_n=1, n_workers=None,
+                                worker_stats=None, quiet=False):
+    """Core implementation of hash-distributed parallel best-first search (HDA*)
+
+    Each state is owned by one of n_workers processes, chosen by a hash of its key (see
+    get_owner). Workers expand their own open lists in parallel, and send generated
+    successors to their owners in batches over multiprocessing queues. A coordinator
+    (the calling process) tracks the simulation budget and the best nodes found, and
+    stops the workers when a goal is generated, the budget is spent, or every worker
+    is idle with no batches in flight.
+
+    Idle workers report how many batches they have sent and received. Once every
+    worker is idle and the totals balance, the coordinator probes all of the workers
+    for a second wave of reports. The search is only exhausted if every count is
+    unchanged, since a worker can receive a batch and forward new ones between the
+    reports of the others (Mattern's double counting method).
+
+    As with search.best_first_search, the search returns the first goal it generates,
+    so plans are not guaranteed to be optimal, even with A* priorities. The order of
+    expansions depends on process scheduling, so results can vary between runs.
+
+    Workers are forked, so the search functions need not be picklable, but states and
+    actions must be.
+
+    Args:
+        start:
+            The state at which to begin the search
+        is_goal (callable[SearchNode]):
+            A function that returns whether a node has satisfied the goal condition
+        step_cost (callable):
+            A function that takes an action/macro as input and returns its step cost
+        heuristic (callable):
+            A function that takes a state as input and returns its heuristic value
+        get_successors (callable):
+            A function that takes a state as input and returns all possible successors, as
+            a list of (state, action) pairs, or (state, action, h) triples (see
+            search.best_first_search)
+        get_priority (callable):
+            A function that takes a SearchNode as input and returns its priority
+        max_transitions (int):
+            The simulation budget for the search, summed over all workers. Workers report
+            in batches, so the search may overshoot it slightly.
+        save_best_n (int):
+            The number of best SearchNodes to maintain during the search
+        n_workers (int, optional):
+            The number of worker processes. Defaults to the number of CPUs.
+        worker_stats (list, optional):
+            If given, a list to fill with a dict of counters for each worker
+        quiet (boolean):
+            Whether to suppress progress bars and the per-worker summary
+
+    Returns:
+        A (states, actions, n_expanded, n_transitions, candidates) tuple, with the same
+        meaning as for search.best_first_search
+    """
+    n_workers = n_workers or os.cpu_count()
+    root = SearchNode(state=start, g_score=0, h_score=heuristic(start))
+    candidates = [(0, root)]
+    if is_goal(root) or max_transitions <= 0:
+        return [start], [], 0, 0, candidates
+
+    context = multiprocessing.get_context('fork')
+    inboxes = [context.Queue() for _ in range(n_workers)]
+    coordinator = context.Queue()
+    problem = (is_goal, step_cost, heuristic, get_successors, get_priority, save_best_n)
+    workers = [context.Process(target=_run_worker, args=(i, inboxes, coordinator, problem),
+                               daemon=True)
+               for i in range(n_workers)]
+    for worker in workers:
+        worker.start()
+
+    def receive():
+        message = coordinator.get()
+        if message[0] == 'error':
+            raise RuntimeError('Worker {} failed:\n{}'.format(*message[1:]))
+        return message
+
+    try:
+        root_key = get_key(start)
+        root_entry = (root_key, 0, root.h_score, start, None, None)
+        inboxes[get_owner(root_key, n_workers)].put(('nodes', [(get_priority(root), root_entry)]))
+        # Latest (wave, sent, received) report from each idle worker. The coordinator
+        # counts as having sent one batch (the root).
+        idle_reports = {}
+        wave = 0
+        last_counts = None
+        n_transitions = 0
+        best = (root.h_score, 0, root_key)
+        goal = None
+        with tqdm(total=max_transitions, disable=quiet) as progress:
+            while n_transitions < max_transitions:
+                message = receive()
+                kind = message[0]
+                if kind == 'progress':
+                    idle_reports.pop(message[1], None)
+                    n_transitions += message[3]
+                    progress.update(message[3])
+                elif kind == 'active':
+                    idle_reports.pop(message[1], None)
+                elif kind == 'best':
+                    _, key, state, g_score, h_score = message
+                    if (h_score, g_score) < best[:2]:
+                        best = (h_score, g_score, key)
+                        candidates.append((n_transitions, SearchNode(state=state, g_score=g_score,
+                                                                     h_score=h_score)))
+                elif kind == 'goal':
+                    goal = message[1:]
+                    break
+                elif kind == 'idle':
+                    idle_reports[message[1]] = message[2:]
+                    if (len(idle_reports) < n_workers
+                            or any(report[0] != wave for report in idle_reports.values())):
+                        continue
+                    counts = [idle_reports[index][1:] for index in range(n_workers)]
+                    n_sent, n_received = map(sum, zip(*counts))
+                    if n_sent + 1 != n_received:
+                        continue
+                    if counts == last_counts:
+                        break
+                    # Confirm the counts with a fresh report from every worker
+                    last_counts = counts
+                    wave += 1
+                    for inbox in inboxes:
+                        inbox.put(('probe', wave))
+
+        for inbox in inboxes:
+            inbox.put(('stop',))
+        all_stats = [None] * n_workers
+        best_n = pq.PriorityQueue(maxlen=save_best_n, mode='max')
+        while None in all_stats:
+            message = receive()
+            if message[0] == 'stats':
+                _, index, stats, worker_best_n = message
+                all_stats[index] = stats
+                for h_score, key in worker_best_n:
+                    best_n.push((h_score, key))
+        n_expanded = sum(stats['expanded'] for stats in all_stats)
+        n_transitions = sum(stats['transitions'] for stats in all_stats)
+
+        def trace(key):
+            """Reconstruct the path to a closed state by asking each owner for its parent"""
+            states, actions = [], []
+            while key is not None:
+                inboxes[get_owner(key, n_workers)].put(('trace', key))
+                message = receive()
+                while message[0] != 'trace' or message[1] != key:
+                    message = receive()
+                state, key, action = message[2]
+                states.append(state)
+                if action is not None:
+                    actions.append(action)
+            return list(reversed(states)), list(reversed(actions))
+
+        if goal is not None:
+            parent_key, state, action, g_score, h_score = goal
+            states, actions = trace(parent_key)
+            states.append(state)
+            actions.append(action)
+            candidates.append((n_transitions, SearchNode(state=state, g_score=g_score,
+                                                         h_score=h_score)))
+        else:
+            states, actions = trace(best[2])
+        results = (states, actions, n_expanded, n_transitions, candidates)
+        if save_best_n > 1:
+            best_n_paths = [(h_score, trace(key)[1]) for h_score, key in best_n.items()]
+            results += (best_n_paths,)
+    finally:
+        for inbox in inboxes:
+            inbox.put(('exit',))
+        for worker in workers:
+            worker.join(timeout=10)
+            if worker.is_alive():
+                worker.terminate()
+
+    if worker_stats is not None:
+        worker_stats.extend(all_stats)
+    if not quiet:
+        for index, stats in enumerate(all_stats):
+            print('Worker {}: {}'.format(index, ', '.join('{} {}'.format(name, value)
+                                                            for name, value in stats.items())))
+    return results
+
+def parallel_best_first_search(*args, **kwargs):
+    """Hash-distributed parallel best-first search"""
+    # Candidates are built without parents, so they can be pickled as-is
+    return _parallel_best_first_search(*args, **kwargs)
+
+def parallel_astar(*args, **kwargs):
+    """Hash-distributed parallel A* search (HDA*)"""
+    return parallel_best_first_search(*args, get_priority=AStarPriority(), **kwargs)
+
+def parallel_gbfs(*args, **kwargs):
+    """Hash-distributed parallel greedy best-first search (GBFS)"""
+    return parallel_best_first_search(*args, get_priority=GBFSPriority(), **kwargs)
@@ -4,6 +4,7 @@ import os
 import pickle
 import random
 import sys
+import time
 from types import SimpleNamespace
 
 import gym
@@ -14,11 +15,16 @@ from pddlgym.structs import LiteralConjunction
 from experiments import search, iw, bfws
 from domains.pddlgym.macros import load_learned_macros
 from domains.pddlgym.pddlgymenv import scramble
+from experiments.results import register_run
 
-def parse_args():
+def parse_args(args=None):
     """Parse input arguments
 
     Use --help to see a pretty description of the arguments
+
+    Args:
+        args (list, optional):
+            The list of argument strings to parse. Defaults to sys.argv[1:].
     """
     if 'ipykernel' in sys.argv[0]:
         sys.argv = [sys.argv[0]]
@@ -39,13 +45,32 @@ def parse_args():
                         help='Weight for h-score in weighted A*')
     parser.add_argument('--max_transitions', type=lambda x: int(float(x)), default=1e5,
                         help='Maximum number of state transitions')
+    parser.add_argument('--max_seconds', type=float, default=None,
+                        help='Wall-clock budget for best-first search (including IW for '
+                             'bfws_rg), after which it stops with the best node so far')
+    parser.add_argument('--max_memory_gb', type=float, default=None,
+                        help='Resident memory budget for best-first search (and IW) in GB')
     parser.add_argument('--bfws_precision', type=int, default=3,
                         help='The number of width values, w \in {1,...,P}, to use when the search algorithm is best-first width search')
-    return parser.parse_args()
+    return parser.parse_args(args)
 
-def solve():
-    """Instantiate PDDL domain with PDDLGym and solve with the specified macro-actions and search algorithm"""
-    args = parse_args()
+def get_results_path(args):
+    """Return the path of the results file for the given arguments"""
+    tag = '{}'.format(args.env_name)
+    tag += '/{}'.format(args.macro_type)
+
+    results_dir = 'results/pddlgym-gen/{}/{}/'.format(args.search_alg,tag)
+    return results_dir+'seed-{:03d}.pickle'.format(args.seed)
+
+def solve(args=None):
+    """Instantiate PDDL domain with PDDLGym and solve with the specified macro-actions and search algorithm
+
+    Args:
+        args (argparse.Namespace, optional):
+            The parsed arguments (see parse_args). Defaults to parsing sys.argv.
+    """
+    if args is None:
+        args = parse_args()
 
     # Set up the domain
     env = gym.make("PDDLEnv-Gen-{}-v0".format(args.env_name.capitalize()))
@@ -98,6 +123,10 @@ def solve():
         'get_successors': get_successors,
         'max_transitions': args.max_transitions,
     }
+    if args.max_seconds is not None:
+        search_dict['max_seconds'] = args.max_seconds
+    if args.max_memory_gb is not None:
+        search_dict['max_memory_bytes'] = int(args.max_memory_gb * 2**30)
 
     if args.search_alg == 'weighted_astar':
         assert (args.g_weight is not None
@@ -107,11 +136,18 @@ def solve():
 
     if 'bfws' in args.search_alg:
         search_dict['precision'] = args.bfws_precision
+    iw_stop_reason = None
     if args.search_alg == 'bfws_rg':
         goal_fns = [(lambda x, i=i: goal.literals[i] in x.state.literals) for i, _ in enumerate(goal.literals)]
-        relevant_atoms = iw.iw(1, start, get_successors, goal_fns)
-        if not relevant_atoms:
-            relevant_atoms = iw.iw(2, start, get_successors, goal_fns)
+        # IW counts against the run's budgets, and the search gets the time it leaves
+        iw_start_time = time.monotonic()
+        relevant_atoms = iw.find_relevant_atoms(start, get_successors, goal_fns,
+                                                search_dict.get('max_seconds'),
+                                                search_dict.get('max_memory_bytes'))
+        iw_stop_reason = relevant_atoms.stop_reason
+        if 'max_seconds' in search_dict:
+            search_dict['max_seconds'] = max(
+                0, search_dict['max_seconds'] - (time.monotonic() - iw_start_time))
         if not relevant_atoms:
             relevant_atoms = None
         search_dict['R'] = relevant_atoms
@@ -120,15 +156,17 @@ def solve():
     search_results = search_fn(**search_dict)
 
     #%% Save the results
-    tag = '{}'.format(args.env_name)
-    tag += '/{}'.format(args.macro_type)
-
-    results_dir = 'results/pddlgym-gen/{}/{}/'.format(args.search_alg,tag)
-    os.makedirs(results_dir, exist_ok=True)
-    with open(results_dir+'seed-{:03d}.pickle'.format(args.seed), 'wb') as file:
+    results_path = get_results_path(args)
+    os.makedirs(os.path.dirname(results_path), exist_ok=True)
+    with open(results_path, 'wb') as file:
         pickle.dump(search_results, file)
 
     plan = search_results[1]
+    register_run(results_path, n_expanded=search_results[2], n_transitions=search_results[3],
+                 n_errors=heuristic(search_results[0][-1]),
+                 n_action_steps=sum(len(macro) for macro in plan), n_macro_steps=len(plan),
+                 stop_reason=getattr(search_results, 'stop_reason', None),
+                 iw_stop_reason=iw_stop_reason, args=vars(args))
     print("Plan length:", len(plan))
     env.close()
 
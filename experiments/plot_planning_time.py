@@ -1,6 +1,6 @@
 import argparse
 from collections import namedtuple
-import glob
+import multiprocessing
 import os
 import pickle
 import sys
@@ -17,10 +17,15 @@ import experiments.npuzzle.plot_config as npuzzle_cfg
 import experiments.suitcaselock.plot_config as suitcaselock_cfg
 import experiments.pddlgym.plot_config as pddlgym_cfg
 
+from domains.cache import CACHE_DIR
 import domains.npuzzle
 import domains.cube
 import domains.suitcaselock
 import experiments.search
+from experiments.profiling import SearchProfile, get_profile_path
+from experiments.results import read_manifest, load_run, index_results
+
+# Aliases for unpickling results saved by older versions of the code
 sys.modules['npuzzle'] = domains.npuzzle
 sys.modules['cube'] = domains.cube
 sys.modules['suitcaselock'] = domains.suitcaselock
@@ -46,6 +51,15 @@ def parse_args():
                         help='If enabled, skip plots and go straight to printing summary table')
     parser.add_argument('--no-save', action='store_true',
                         help='Whether to actually save the plots/summary files to disk')
+    parser.add_argument('--profile', action='store_true',
+                        help='Also plot the per-phase search time of profiled runs')
+    parser.add_argument('--n_workers', type=int, default=os.cpu_count(),
+                        help='Number of processes to use for loading new or changed runs')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Reload every run instead of reusing previously loaded data')
+    parser.add_argument('--reindex', action='store_true',
+                        help='Add results files that are missing from the manifest (e.g. '
+                             'from before it existed) by walking the results directory')
     return parser.parse_args()
 
 
@@ -92,23 +106,23 @@ def parse_filepath(path, field_names, prefix):
 
     return namedtuple('MetaData', field_names)(*parsed_sections)
 
-def load_data(alg, pddl_env=None, pddl_problem_id=None):
-    """Load all data in RESULTS_DIR matching the specified algorithm"""
-    result_files = sorted(glob.glob(RESULTS_DIR+'/**', recursive=True))
+# Increment whenever load_run_data's output changes, so that cached runs are reloaded
+PLOT_CACHE_VERSION = 1
 
-    learning_curves = []
-    macro_data = []
-    final_results = []
-    for filepath in result_files:
-        if not os.path.isfile(filepath) or os.path.splitext(filepath)[-1] != '.pickle':
-            continue
-        if 'archive' in filepath:
-            continue
+def load_run_data(filepath):
+    """Load the learning curve and final results of a single run in RESULTS_DIR
+
+    Returns:
+        A (sim_steps, h_scores, final_results) tuple, where sim_steps and h_scores are
+        arrays giving the run's learning curve, and final_results is a dict
+    """
+    if os.path.splitext(filepath)[-1] == '.npz':
+        run = load_run(filepath)
+        sim_steps, h_scores = run['curve_transitions'].tolist(), run['curve_h'].tolist()
+        n_transitions, n_errors = int(run['n_transitions']), int(run['n_errors'])
+        n_action_steps, n_macro_steps = len(run['plan']), len(run['step_lengths'])
+    else:
         metadata = parse_filepath(filepath, cfg.FIELDS, prefix=RESULTS_DIR)
-        if metadata.alg != alg:
-            continue
-        if pddl_env is not None and metadata.pddl_env != pddl_env:
-            continue
         with open(filepath, 'rb') as file:
             search_results = pickle.load(file)
         states, actions, _, n_transitions, candidates = search_results[:5]
@@ -120,39 +134,157 @@ def load_data(alg, pddl_env=None, pddl_problem_id=None):
             h_scores = [node.h_score[1] for transitions, node in candidates]
         else:
             h_scores = [node.h_score for transitions, node in candidates]
+        n_action_steps = cfg.get_primitive_steps(actions)
+        n_macro_steps = cfg.get_macro_steps(actions)
+
+    # Extend final value to end of plot
+    if n_errors > 0:
+        sim_steps += [n_transitions]
+        h_scores += [n_errors]
+
+    final_results = {
+        'transitions': n_transitions,
+        'n_errors': n_errors,
+        'n_action_steps': n_action_steps,
+        'n_macro_steps': n_macro_steps,
+    }
+    return np.asarray(sim_steps), np.asarray(h_scores), final_results
+
+def get_plot_cache_path():
+    """Return the path of the cache of loaded runs for RESULTS_DIR"""
+    experiment = os.path.basename(os.path.normpath(RESULTS_DIR))
+    return os.path.join(CACHE_DIR, 'plot-data-{}.pickle'.format(experiment))
+
+def load_plot_cache():
+    """Return the cache of loaded runs for RESULTS_DIR
+
+    The cache is empty if there isn't one, or if it was saved with a different
+    PLOT_CACHE_VERSION.
+    """
+    try:
+        with open(get_plot_cache_path(), 'rb') as file:
+            cache = pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return {}
+    if not isinstance(cache, dict) or cache.get('version') != PLOT_CACHE_VERSION:
+        return {}
+    return cache['runs']
+
+def save_plot_cache(cache):
+    """Save the cache of loaded runs for RESULTS_DIR"""
+    cache_path = get_plot_cache_path()
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+    with open(tmp_path, 'wb') as file:
+        pickle.dump({'version': PLOT_CACHE_VERSION, 'runs': cache}, file)
+    os.replace(tmp_path, cache_path)
+
+def load_data(alg, pddl_env=None, pddl_problem_id=None, n_workers=1, use_cache=True):
+    """Load all data in RESULTS_DIR matching the specified algorithm
+
+    Runs are found through the experiment's manifest rather than by walking RESULTS_DIR
+    (use --reindex to add runs saved before the manifest existed). Both .npz runs and
+    older .pickle runs are loaded. Each run's data is cached on disk, keyed by the file's
+    path, modification time and size (and PLOT_CACHE_VERSION), so only new or changed
+    runs are loaded.
 
-        # Extend final value to end of plot
-        if n_errors > 0:
-            sim_steps += [n_transitions]
-            h_scores += [n_errors]
-
-        # Save learning curves
-        for sim_step, h_score in zip(sim_steps, h_scores):
-            learning_curves.append({
-                **metadata._asdict(),
-                'transitions': sim_step,
-                'n_errors': h_score,
-            })
-
-        # # Save macro data
-        # for length in cfg.get_macro_lengths(actions):
-        #     macro_data.append({
-        #         **metadata._asdict(),
-        #         'macro_length': length,
-        #     })
-
-        # Save final results
-        final_results.append({
-            **metadata._asdict(),
-            'transitions': n_transitions,
-            'n_errors': n_errors,
-            'n_action_steps': cfg.get_primitive_steps(actions),
-            'n_macro_steps': cfg.get_macro_steps(actions),
-        })
+    Args:
+        alg (str):
+            The search algorithm whose results to load
+        pddl_env (str, optional):
+            The PDDLGym environment whose results to load (used with PDDLGym)
+        n_workers (int):
+            The number of processes to use for loading new or changed runs
+        use_cache (bool):
+            Whether to reuse previously loaded runs; if False, every run is reloaded
 
-    results = [learning_curves, final_results] #, macro_data
-    return tuple(map(pd.DataFrame, results))
+    Returns:
+        A (learning_curves, final_results) tuple of DataFrames
+    """
+    result_files = [RESULTS_DIR + entry['path'] for entry in read_manifest(RESULTS_DIR)]
+    if not result_files:
+        print('No runs in the manifest for {}. '.format(RESULTS_DIR)
+              + 'Use --reindex to add existing results.')
 
+    runs = []
+    for filepath in result_files:
+        if 'archive' in filepath:
+            continue
+        metadata = parse_filepath(filepath, cfg.FIELDS, prefix=RESULTS_DIR)
+        if metadata.alg != alg:
+            continue
+        if pddl_env is not None and metadata.pddl_env != pddl_env:
+            continue
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            continue
+        runs.append((filepath, metadata, (stat.st_mtime_ns, stat.st_size)))
+
+    cache = load_plot_cache()
+    stale_files = [filepath for filepath, _, key in runs
+                   if not use_cache or filepath not in cache or cache[filepath][0] != key]
+    if stale_files:
+        print('Loading {} new or changed runs...'.format(len(stale_files)))
+        if n_workers > 1 and len(stale_files) > 1:
+            # Workers are forked so that they inherit cfg and RESULTS_DIR
+            context = multiprocessing.get_context('fork')
+            with context.Pool(min(n_workers, len(stale_files))) as pool:
+                chunksize = max(1, len(stale_files) // (4 * n_workers))
+                run_data = pool.map(load_run_data, stale_files, chunksize=chunksize)
+        else:
+            run_data = list(map(load_run_data, stale_files))
+        keys = {filepath: key for filepath, _, key in runs}
+        cache.update({filepath: (keys[filepath], data)
+                      for filepath, data in zip(stale_files, run_data)})
+        cache = {filepath: entry for filepath, entry in cache.items()
+                 if filepath in keys or os.path.exists(filepath)}
+        save_plot_cache(cache)
+
+    if not runs:
+        return pd.DataFrame(), pd.DataFrame()
+
+    run_data = [cache[filepath][1] for filepath, _, _ in runs]
+    sim_steps, h_scores, final_results = zip(*run_data)
+    metadata = pd.DataFrame([metadata._asdict() for _, metadata, _ in runs])
+
+    # Repeat each run's metadata for every point on its learning curve
+    curve_lengths = [len(steps) for steps in sim_steps]
+    learning_curves = metadata.loc[metadata.index.repeat(curve_lengths)]
+    learning_curves = learning_curves.reset_index(drop=True)
+    learning_curves['transitions'] = np.concatenate(sim_steps)
+    learning_curves['n_errors'] = np.concatenate(h_scores)
+
+    final_results = pd.concat([metadata, pd.DataFrame(list(final_results))], axis=1)
+    return learning_curves, final_results
+
+def load_profiles(alg, pddl_env=None):
+    """Load the search profiles in RESULTS_DIR matching the specified algorithm
+
+    Returns:
+        A DataFrame with a row per profiled run, giving the seconds spent in each phase
+    """
+    # Profiles are saved alongside the results of the runs in the manifest
+    profile_files = [get_profile_path(RESULTS_DIR + entry['path'])
+                     for entry in read_manifest(RESULTS_DIR)]
+
+    profiles = []
+    for filepath in profile_files:
+        if 'archive' in filepath or not os.path.exists(filepath):
+            continue
+        metadata = parse_filepath(filepath, cfg.FIELDS, prefix=RESULTS_DIR)
+        if metadata.alg != alg:
+            continue
+        if pddl_env is not None and metadata.pddl_env != pddl_env:
+            continue
+        profile = SearchProfile.load(filepath).to_dict()
+        profiles.append({
+            **metadata._asdict(),
+            **profile['times'],
+            'total_time': profile['total_time'],
+            'n_expanded': profile['n_expanded'],
+        })
+    return pd.DataFrame(profiles)
 
 def _autoscale_ticks(set_fn, get_fn, dtype=float):
     """Automatically scale ticks and return a string for labeling the axis"""
@@ -295,6 +427,28 @@ def plot_entanglement_boxes(data, plot_vars, save=True):
     plt.show()
 
 
+def get_profile_means(profiles, category):
+    """Return the mean time per expansion (in µs) spent in each search phase, by category"""
+    phases = SearchProfile.PHASES + ['other']
+    per_expansion = profiles[phases].div(profiles['n_expanded'], axis=0) * 1e6
+    per_expansion[category] = profiles[category]
+    means = per_expansion.groupby(category)[phases].mean()
+    return means.loc[:, (means > 0).any()]
+
+def plot_profile(means, category, save=True):
+    """Stacked barplot of the mean time per expansion spent in each search phase"""
+    plt.rcParams.update({'font.size': cfg.FONTSIZE})
+    _, ax = plt.subplots(figsize=cfg.FIGSIZE)
+    means.plot.barh(stacked=True, ax=ax, colormap='tab20', width=0.7)
+    ax.set_xlabel('Time per expansion (µs)')
+    ax.set_ylabel('')
+    ax.legend(loc='lower right', fontsize='small')
+    plt.tight_layout()
+    if save:
+        plt.savefig('results/plots/{}/{}_profile_by_{}.png'.format(
+            cfg.DIR, cfg.NAME, category), dpi=100)
+    plt.show()
+
 def get_summary(results, category):
     """Print a summary of the planning results broken down for the specified category"""
     summary = results.groupby([category], as_index=False).mean().round(1)
@@ -305,7 +459,9 @@ def get_summary(results, category):
 
 def make_plots():
     """Make the plots and print summaries"""
-    learning_curves, final_results = load_data(alg=args.alg, pddl_env=args.pddl_env)
+    learning_curves, final_results = load_data(alg=args.alg, pddl_env=args.pddl_env,
+                                               n_workers=args.n_workers,
+                                               use_cache=(not args.no_cache))
     # learning_curves, final_results, macro_data = load_data(alg=args.alg, pddl_env=args.pddl_env)
     # print(macro_data.query("macro_type=='focused' and goal_type=='default_goal'").groupby('seed').sum().mean())
     # print(macro_data.query("macro_type=='expert' and goal_type=='default_goal'").groupby('seed').sum().mean())#
@@ -335,6 +491,14 @@ def make_plots():
             plot_entanglement_boxes(final_results.query("n_vars==@plot_vars.n_vars"), plot_vars, save=(not args.no_save))
 
     summary_text = []
+    if args.profile:
+        profiles = load_profiles(alg=args.alg, pddl_env=args.pddl_env)
+        if not profiles.empty:
+            means = get_profile_means(profiles, category='macro_type')
+            if not args.summary:
+                plot_profile(means, category='macro_type', save=(not args.no_save))
+            summary_text.append(str(means.round(1)))
+
     if any([summary_type == 'macro_type' for summary_type in cfg.SUMMARIES]):
         try:
             results = final_results.query("goal_type=='default_goal'")
@@ -372,4 +536,6 @@ if __name__ == '__main__':
     if args.name == 'pddlgym':
         cfg.DIR = cfg.DIR.format(args.pddl_env)
         cfg.NAME = args.pddl_env
+    if args.reindex:
+        print('Indexed {} new and {} removed runs'.format(*index_results(RESULTS_DIR)))
     make_plots()
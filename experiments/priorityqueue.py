@@ -1,4 +1,8 @@
+from collections import deque
 import heapq
+import itertools
+import pickle
+import random
 from dataclasses import dataclass, field
 from typing import Any
 
@@ -97,6 +101,270 @@ class PriorityQueue():
         """Return the list of (priority, data) tuples in the queue"""
         return [item.unwrapped() for item in sorted(self.heap)]
 
+class _PushCounter:
+    """Push counter for open lists that break priority ties by insertion order"""
+    def _init_counter(self, tiebreak):
+        assert tiebreak in ['fifo', 'lifo']
+        self.step = 1 if tiebreak == 'fifo' else -1
+        self.counter = itertools.count(0, self.step)
+
+    def __getstate__(self):
+        # Store the counter's next value, since itertools.count can't always be pickled
+        state = self.__dict__.copy()
+        state['counter'] = next(self.counter)
+        self.counter = itertools.count(state['counter'], self.step)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.counter = itertools.count(state['counter'], self.step)
+
+class HeapQueue(_PushCounter):
+    """Binary heap open list for best-first search
+
+    Entries are plain (priority, tiebreak, item) tuples, so items themselves are never
+    compared. Push and pop are O(log n).
+
+    Args:
+        tiebreak (str, ['fifo' or 'lifo']):
+            Whether to pop the oldest or newest of the items with equal priority
+    """
+    def __init__(self, tiebreak='fifo'):
+        self.heap = []
+        self._init_counter(tiebreak)
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, priority, item, key=None):
+        """Add `item` to the queue with the given priority
+
+        Items are never replaced, so the key is ignored and stale duplicates must be
+        skipped by the caller when they are popped.
+        """
+        heapq.heappush(self.heap, (priority, next(self.counter), item))
+
+    def pop(self):
+        """Remove and return the (priority, item) tuple with the smallest priority"""
+        priority, _, item = heapq.heappop(self.heap)
+        return priority, item
+
+class BucketQueue:
+    """Bucket open list for best-first search with few distinct priorities
+
+    Items are kept in a FIFO/LIFO bucket per distinct priority, and only the distinct
+    priorities are kept in a heap. Priorities can be any hashable values that can be
+    ordered, including lexicographic tuples like BFWS's (width, goalcount, g). With
+    the small integer ranges of goal-count heuristics, push and pop are O(1) apart from
+    creating or emptying a bucket.
+
+    Args:
+        tiebreak (str, ['fifo' or 'lifo']):
+            Whether to pop the oldest or newest of the items with equal priority
+    """
+    def __init__(self, tiebreak='fifo'):
+        assert tiebreak in ['fifo', 'lifo']
+        self.lifo = (tiebreak == 'lifo')
+        self.buckets = {}
+        self.priorities = []
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def push(self, priority, item, key=None):
+        """Add `item` to the queue with the given priority
+
+        Items are never replaced, so the key is ignored and stale duplicates must be
+        skipped by the caller when they are popped.
+        """
+        bucket = self.buckets.get(priority)
+        if bucket is None:
+            bucket = self.buckets[priority] = deque()
+            heapq.heappush(self.priorities, priority)
+        bucket.append(item)
+        self.length += 1
+
+    def pop(self):
+        """Remove and return the (priority, item) tuple with the smallest priority"""
+        priority = self.priorities[0]
+        bucket = self.buckets[priority]
+        item = bucket.pop() if self.lifo else bucket.popleft()
+        if not bucket:
+            del self.buckets[priority]
+            heapq.heappop(self.priorities)
+        self.length -= 1
+        return priority, item
+
+class IndexedPriorityQueue(_PushCounter):
+    """Addressable binary heap open list for best-first search
+
+    Each item has a hashable key, and a position map from keys to heap slots allows
+    the item for a key to be replaced (e.g. decrease-key) or removed in place, so the
+    queue never holds more than one item per key. Push, pop and remove are O(log n).
+
+    A replaced item is ordered as if it were newly pushed, so for searches that only
+    ever lower a state's priority when replacing it (like A*), items come out in the
+    same order as from HeapQueue after skipping stale duplicates.
+
+    Args:
+        tiebreak (str, ['fifo' or 'lifo']):
+            Whether to pop the oldest or newest of the items with equal priority
+    """
+    def __init__(self, tiebreak='fifo'):
+        # Entries are (priority, counter, key, item) tuples; counters are unique, so
+        # keys and items are never compared
+        self.heap = []
+        self.position = {}
+        self._init_counter(tiebreak)
+
+    def __len__(self):
+        return len(self.heap)
+
+    def __contains__(self, key):
+        return key in self.position
+
+    def push(self, priority, item, key):
+        """Add `item` to the queue with the given priority, replacing any queued item
+        with the same key"""
+        entry = (priority, next(self.counter), key, item)
+        index = self.position.get(key)
+        if index is None:
+            self.heap.append(entry)
+            self._sift_up(len(self.heap) - 1)
+        else:
+            old_entry = self.heap[index]
+            self.heap[index] = entry
+            if entry < old_entry:
+                self._sift_up(index)
+            else:
+                self._sift_down(index)
+
+    def pop(self):
+        """Remove and return the (priority, item) tuple with the smallest priority"""
+        priority, _, key, item = self.heap[0]
+        self._delete(0)
+        del self.position[key]
+        return priority, item
+
+    def remove(self, key):
+        """Remove and return the (priority, item) tuple with the given key"""
+        index = self.position.pop(key)
+        priority, _, _, item = self.heap[index]
+        self._delete(index)
+        return priority, item
+
+    def _delete(self, index):
+        last = self.heap.pop()
+        if index < len(self.heap):
+            old_entry = self.heap[index]
+            self.heap[index] = last
+            if last < old_entry:
+                self._sift_up(index)
+            else:
+                self._sift_down(index)
+
+    def _sift_up(self, index):
+        heap, position = self.heap, self.position
+        entry = heap[index]
+        while index > 0:
+            parent = (index - 1) >> 1
+            if not entry < heap[parent]:
+                break
+            heap[index] = heap[parent]
+            position[heap[index][2]] = index
+            index = parent
+        heap[index] = entry
+        position[entry[2]] = index
+
+    def _sift_down(self, index):
+        heap, position = self.heap, self.position
+        entry = heap[index]
+        size = len(heap)
+        child = 2 * index + 1
+        while child < size:
+            if child + 1 < size and heap[child + 1] < heap[child]:
+                child += 1
+            if not heap[child] < entry:
+                break
+            heap[index] = heap[child]
+            position[heap[index][2]] = index
+            index = child
+            child = 2 * index + 1
+        heap[index] = entry
+        position[entry[2]] = index
+
+# Open list implementations for best-first search, by name
+OPEN_LISTS = {
+    'heap': HeapQueue,
+    'bucket': BucketQueue,
+    'indexed': IndexedPriorityQueue,
+}
+
+def test_open_lists():
+    """Test that open lists agree on the order of items, including ties"""
+    priorities = [3, 1, 2, 1, 3, 0, 2, 1]
+    for tiebreak, order in [('fifo', 1), ('lifo', -1)]:
+        expected = sorted(range(len(priorities)), key=lambda i: (priorities[i], order * i))
+        for open_list in OPEN_LISTS.values():
+            queue = open_list(tiebreak=tiebreak)
+            assert not queue
+            for i, priority in enumerate(priorities):
+                queue.push(priority, i, key=i)
+            assert len(queue) == len(priorities)
+            assert [queue.pop()[1] for _ in priorities] == expected
+            assert not queue
+
+    # Lexicographic tuple priorities, interleaving pushes and pops
+    for open_list in OPEN_LISTS.values():
+        queue = open_list()
+        queue.push((1, 5, 2), 'a', key='a')
+        queue.push((0, 9, 9), 'b', key='b')
+        queue.push((1, 4, 7), 'c', key='c')
+        assert queue.pop() == ((0, 9, 9), 'b')
+        queue.push((1, 4, 7), 'd', key='d')
+        queue.push((0, 0, 0), 'e', key='e')
+        assert [queue.pop()[1] for _ in range(4)] == ['e', 'c', 'd', 'a']
+
+    # Unpickled open lists continue to break ties in the same order
+    for tiebreak in ['fifo', 'lifo']:
+        for open_list in OPEN_LISTS.values():
+            queue = open_list(tiebreak=tiebreak)
+            for i, priority in enumerate(priorities):
+                queue.push(priority, i, key=i)
+            copied = pickle.loads(pickle.dumps(queue))
+            for copy_ in [queue, copied]:
+                for i in range(3):
+                    copy_.push(1, 'new-{}'.format(i), key='new-{}'.format(i))
+            n_items = len(queue)
+            assert len(copied) == n_items
+            assert [queue.pop() for _ in range(n_items)] == [copied.pop() for _ in range(n_items)]
+
+def test_indexed_priority_queue():
+    """Test decrease-key and removal in the addressable heap"""
+    rng = random.Random(0)
+    queue = IndexedPriorityQueue()
+    expected = {}
+    for _ in range(2000):
+        key = rng.randrange(100)
+        if key in queue and rng.random() < 0.2:
+            assert queue.remove(key) == expected.pop(key)
+        else:
+            priority = rng.randrange(20)
+            queue.push(priority, (key, priority), key=key)
+            expected[key] = (priority, (key, priority))
+        assert len(queue) == len(expected)
+    popped = [queue.pop() for _ in range(len(queue))]
+    assert sorted(popped) == sorted(expected.values())
+    assert [priority for priority, _ in popped] == sorted(p for p, _ in expected.values())
+
+    # Replacing an item orders it as if it were newly pushed
+    queue = IndexedPriorityQueue()
+    for key, priority in [('a', 3), ('b', 2), ('c', 2), ('a', 2)]:
+        queue.push(priority, key, key=key)
+    assert len(queue) == 3
+    assert [queue.pop()[1] for _ in range(3)] == ['b', 'c', 'a']
+
 def test():
     """Test priority queue functionality"""
 
@@ -151,6 +419,9 @@ def test():
     queue.push( (12, 'buz') )
     assert queue.items() == [(10, 'foo'), (9, 'fiz'), (7, 'bar')]
 
+    test_open_lists()
+    test_indexed_priority_queue()
+
 
 if __name__ == '__main__':
     test()
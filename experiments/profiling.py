@@ -0,0 +1,136 @@
+import json
+import os
+import time
+
+class SearchProfile:
+    """Opt-in per-phase timers and counters for the best-first search loop
+
+    Pass an instance as the `profile` argument of a best-first search, and the search
+    will time each call it makes in the phases below. Profiling works by wrapping those
+    calls in timers, so searches without a profile run exactly as before.
+
+    Phases:
+        pop, push:   open list operations
+        priority:    computing the open list priority of new nodes
+        successors:  generating successors (get_successors or get_successors_batch)
+        keys:        computing canonical state keys for the closed set and g-scores
+        heuristic:   heuristic evaluations (including any width augmentation)
+        goal:        goal checks
+        atoms:       tracking path atoms for BFWS(R)
+        best_n:      keeping track of the best N nodes
+        progress:    progress bar updates
+        checkpoint:  saving checkpoints
+        other:       everything else, e.g. closed-set/g-score lookups and node creation
+
+    Args:
+        sample_every (int):
+            If positive, also record the per-phase costs of every sample_every-th
+            expansion, to see how costs vary over the course of the search
+    """
+    PHASES = ['pop', 'push', 'priority', 'successors', 'keys', 'heuristic', 'goal', 'atoms',
+              'best_n', 'progress', 'checkpoint']
+    SAMPLE_COLUMNS = ['n_expanded', 'n_successors', 'total'] + PHASES
+
+    def __init__(self, sample_every=0):
+        self.sample_every = sample_every
+        self.times = dict.fromkeys(self.PHASES, 0.0)
+        self.counts = dict.fromkeys(self.PHASES, 0)
+        self.samples = []
+        self.total_time = 0.0
+        self.n_expanded = 0
+        self.n_transitions = 0
+        self._start_time = None
+        self._sample_start = None
+
+    def timed(self, phase, fn):
+        """Return a version of `fn` that adds its call time and count to `phase`"""
+        times, counts = self.times, self.counts
+        clock = time.perf_counter
+        def timed_fn(*args, **kwargs):
+            start = clock()
+            result = fn(*args, **kwargs)
+            times[phase] += clock() - start
+            counts[phase] += 1
+            return result
+        return timed_fn
+
+    def start(self):
+        """Start timing the search"""
+        self._start_time = time.perf_counter()
+
+    def stop(self, n_expanded, n_transitions):
+        """Stop timing the search and record its final counters"""
+        self.total_time += time.perf_counter() - self._start_time
+        self.n_expanded = n_expanded
+        self.n_transitions = n_transitions
+
+    def should_sample(self, n_expanded):
+        """Return whether the expansion with the given (1-based) index is sampled"""
+        return self.sample_every > 0 and n_expanded % self.sample_every == 0
+
+    def start_sample(self):
+        """Start recording the costs of a sampled expansion"""
+        self._sample_start = (time.perf_counter(), list(self.times.values()))
+
+    def end_sample(self, n_expanded, n_successors):
+        """Finish recording the costs of a sampled expansion"""
+        start, start_times = self._sample_start
+        total = time.perf_counter() - start
+        phase_times = [now - then for now, then in zip(self.times.values(), start_times)]
+        self.samples.append([n_expanded, n_successors, total] + phase_times)
+
+    @property
+    def other_time(self):
+        """The search time that wasn't spent in any timed phase"""
+        return max(0.0, self.total_time - sum(self.times.values()))
+
+    def to_dict(self):
+        """Return the profile as a JSON-serializable dict"""
+        return {
+            'total_time': self.total_time,
+            'n_expanded': self.n_expanded,
+            'n_transitions': self.n_transitions,
+            'times': {**self.times, 'other': self.other_time},
+            'counts': self.counts,
+            'sample_every': self.sample_every,
+            'sample_columns': self.SAMPLE_COLUMNS,
+            'samples': self.samples,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a profile from the output of `to_dict`"""
+        profile = cls(sample_every=data['sample_every'])
+        profile.total_time = data['total_time']
+        profile.n_expanded = data['n_expanded']
+        profile.n_transitions = data['n_transitions']
+        profile.times.update({phase: data['times'][phase] for phase in cls.PHASES})
+        profile.counts.update(data['counts'])
+        profile.samples = data['samples']
+        return profile
+
+    def save(self, path):
+        """Save the profile to a JSON file"""
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file)
+
+    @classmethod
+    def load(cls, path):
+        """Load a profile saved by `save`"""
+        with open(path, 'r') as file:
+            return cls.from_dict(json.load(file))
+
+    def summary(self):
+        """Return a table of the time, share and call count of each phase"""
+        lines = ['{:<12}{:>10}{:>8}{:>12}'.format('phase', 'seconds', '%', 'calls')]
+        total = self.total_time or 1.0
+        for phase, seconds in {**self.times, 'other': self.other_time}.items():
+            lines.append('{:<12}{:>10.3f}{:>8.1f}{:>12}'.format(
+                phase, seconds, 100 * seconds / total, self.counts.get(phase, '')))
+        lines.append('{:<12}{:>10.3f}  ({} expanded, {} transitions)'.format(
+            'total', self.total_time, self.n_expanded, self.n_transitions))
+        return '\n'.join(lines)
+
+def get_profile_path(results_path):
+    """Return the path of the profile saved alongside a results file"""
+    return os.path.splitext(results_path)[0] + '.profile.json'
@@ -0,0 +1,213 @@
+import json
+import os
+
+import numpy as np
+
+MANIFEST_NAME = 'manifest.jsonl'
+
+def get_manifest_path(results_path, results_root='results'):
+    """Return the manifest path for the experiment directory containing `results_path`
+
+    Each experiment (e.g. results/cube/) has a single manifest, with one line per run.
+    """
+    experiment = os.path.relpath(results_path, results_root).split(os.sep)[0]
+    return os.path.join(results_root, experiment, MANIFEST_NAME)
+
+def get_h_score(node):
+    """Return a SearchNode's goal-count score, ignoring any BFWS width"""
+    if isinstance(node.h_score, tuple):
+        return node.h_score[1]
+    return node.h_score
+
+def save_run(results_path, search_results, plan, n_errors, args=None, **summary):
+    """Save the results of one search as a compact .npz file, and add it to the manifest
+
+    The file holds the plan as primitive action ids (with the number of primitive actions
+    in each plan step, so macro boundaries are kept) and the learning curve of
+    (transitions, h_score) for each candidate. The manifest line holds the summary
+    statistics, so runs can be tabulated without opening their files.
+
+    Args:
+        results_path (str):
+            The path of the .npz file to write
+        search_results (tuple):
+            The (states, actions, n_expanded, n_transitions, candidates, ...) results
+        plan (list):
+            The primitive action ids for each of the plan's actions/macros
+        n_errors (int):
+            The number of goal variables that the final state doesn't satisfy
+        args (argparse.Namespace, optional):
+            The arguments of the run, to record in the manifest
+        **summary:
+            Additional JSON-serializable statistics to record in the manifest, such as
+            iw_stop_reason. String values are also saved in the .npz file.
+
+    Returns:
+        The manifest entry for the run
+    """
+    _, _, n_expanded, n_transitions, candidates = search_results[:5]
+    step_lengths = np.asarray([len(step) for step in plan], dtype=np.int32)
+    stop_reason = getattr(search_results, 'stop_reason', None)
+    columns = {
+        'plan': np.asarray([action for step in plan for action in step], dtype=np.int32),
+        'step_lengths': step_lengths,
+        'curve_transitions': np.asarray([n for n, _ in candidates], dtype=np.int64),
+        'curve_h': np.asarray([get_h_score(node) for _, node in candidates], dtype=np.float64),
+        'n_expanded': np.int64(n_expanded),
+        'n_transitions': np.int64(n_transitions),
+        'n_errors': np.int64(n_errors),
+        'stop_reason': np.str_(stop_reason or ''),
+    }
+    for name, value in summary.items():
+        if value is None or isinstance(value, str):
+            columns[name] = np.str_(value or '')
+    os.makedirs(os.path.dirname(results_path), exist_ok=True)
+    tmp_path = '{}.{}.tmp'.format(results_path, os.getpid())
+    with open(tmp_path, 'wb') as file:
+        np.savez_compressed(file, **columns)
+    os.replace(tmp_path, results_path)
+
+    return register_run(results_path, n_expanded=int(n_expanded),
+                        n_transitions=int(n_transitions), n_errors=int(n_errors),
+                        n_action_steps=int(step_lengths.sum()),
+                        n_macro_steps=len(step_lengths), stop_reason=stop_reason,
+                        args=vars(args) if args is not None else None, **summary)
+
+def register_run(results_path, **summary):
+    """Add a completed run to its experiment's manifest
+
+    Args:
+        results_path (str):
+            The path of the run's results file
+        **summary:
+            JSON-serializable summary statistics to store with the run
+
+    Returns:
+        The manifest entry for the run
+    """
+    manifest_path = get_manifest_path(results_path)
+    entry = {'path': os.path.relpath(results_path, os.path.dirname(manifest_path)), **summary}
+    append_to_manifest(manifest_path, entry)
+    return entry
+
+def append_to_manifest(manifest_path, entry):
+    """Append an entry to a manifest
+
+    Each entry is written with a single O_APPEND write, so concurrent solves (e.g. from
+    batch_solve) can share a manifest without interleaving their lines.
+    """
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    line = (json.dumps(entry) + '\n').encode()
+    fd = os.open(manifest_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+def read_manifest(results_dir):
+    """Return the manifest entries for an experiment directory, in order
+
+    Runs that were saved more than once (e.g. re-run with --overwrite) keep only their
+    latest entry. Runs whose results files were found to be missing by `index_results`
+    are left out, but other entries are returned without checking the filesystem.
+    """
+    manifest_path = os.path.join(results_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return []
+    entries = {}
+    with open(manifest_path, 'r') as file:
+        for line in file:
+            # Skip a line that was cut short, e.g. if a solve was killed mid-write
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            entries.pop(entry['path'], None)
+            if not entry.get('removed', False):
+                entries[entry['path']] = entry
+    return list(entries.values())
+
+def get_registered_paths(results_dir):
+    """Return the set of results paths in an experiment directory's manifest"""
+    return {os.path.normpath(os.path.join(results_dir, entry['path']))
+            for entry in read_manifest(results_dir)}
+
+def index_results(results_dir, extensions=('.npz', '.pickle')):
+    """Bring an experiment directory's manifest in line with the results files on disk
+
+    This walks the whole directory, so it only needs to be run for results that were
+    saved before the manifest existed, or that were added or removed by hand. Files
+    missing from the manifest are added without summary statistics, and entries whose
+    files no longer exist are marked as removed.
+
+    Returns:
+        The number of (added, removed) entries
+    """
+    registered = get_registered_paths(results_dir)
+    on_disk = set()
+    for dirpath, _, filenames in os.walk(results_dir):
+        on_disk.update(os.path.normpath(os.path.join(dirpath, filename))
+                       for filename in filenames
+                       if os.path.splitext(filename)[-1] in extensions)
+    manifest_path = os.path.join(results_dir, MANIFEST_NAME)
+    for path in sorted(on_disk - registered):
+        append_to_manifest(manifest_path, {'path': os.path.relpath(path, results_dir)})
+    for path in sorted(registered - on_disk):
+        append_to_manifest(manifest_path, {'path': os.path.relpath(path, results_dir),
+                                           'removed': True})
+    return len(on_disk - registered), len(registered - on_disk)
+
+def load_run(results_path):
+    """Load the columns of a run saved by `save_run` as a dict of arrays"""
+    with np.load(results_path) as data:
+        return {name: data[name] for name in data.files}
+
+def test():
+    """Test saving and loading runs"""
+    import tempfile
+    from types import SimpleNamespace
+
+    from experiments.search import SearchNode, SearchResults
+
+    assert get_manifest_path('results/foo/gbfs/seed-001.npz') == 'results/foo/manifest.jsonl'
+    with tempfile.TemporaryDirectory() as results_root:
+        candidates = [(0, SearchNode('a', 0, 5)), (30, SearchNode('b', 1, (1, 2)))]
+        search_results = SearchResults((['a', 'b'], [['x', 'y'], ['z']], 2, 40, candidates),
+                                       stop_reason='max_transitions')
+
+        old_cwd = os.getcwd()
+        os.chdir(results_root)
+        try:
+            results_path = os.path.join('results', 'foo', 'gbfs', 'seed-001.npz')
+            save_run(results_path, search_results, plan=[[0, 1], [2]], n_errors=2)
+            entry = save_run(results_path, search_results, plan=[[0, 1], [2]], n_errors=2,
+                             args=SimpleNamespace(seed=1), iw_stop_reason='max_seconds')
+            assert entry['path'] == os.path.join('gbfs', 'seed-001.npz')
+            assert (entry['n_action_steps'], entry['n_macro_steps']) == (3, 2)
+            assert read_manifest('results/foo') == [entry]
+            assert entry['args'] == {'seed': 1} and entry['iw_stop_reason'] == 'max_seconds'
+            assert read_manifest('results/bar') == []
+
+            run = load_run(results_path)
+            assert run['plan'].tolist() == [0, 1, 2] and run['step_lengths'].tolist() == [2, 1]
+            assert run['curve_transitions'].tolist() == [0, 30]
+            assert run['curve_h'].tolist() == [5, 2]
+            assert (run['n_expanded'], run['n_transitions'], run['n_errors']) == (2, 40, 2)
+            assert str(run['stop_reason']) == 'max_transitions'
+            assert str(run['iw_stop_reason']) == 'max_seconds'
+
+            # Index a legacy result and a removed one
+            legacy_path = os.path.join('results', 'foo', 'gbfs', 'seed-002.pickle')
+            open(legacy_path, 'wb').close()
+            register_run(os.path.join('results', 'foo', 'gbfs', 'seed-003.npz'))
+            assert index_results('results/foo') == (1, 1)
+            assert index_results('results/foo') == (0, 0)
+            assert get_registered_paths('results/foo') == {results_path, legacy_path}
+            assert not [name for name in os.listdir(os.path.dirname(results_path))
+                        if name.endswith('.tmp')]
+        finally:
+            os.chdir(old_cwd)
+    print('All tests passed.')
+
+if __name__ == '__main__':
+    test()
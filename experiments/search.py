@@ -1,6 +1,11 @@
 from collections import defaultdict
 from collections.abc import Iterable
 from inspect import signature
+import io
+import os
+import pickle
+import sys
+import time
 
 from tqdm import tqdm
 import numpy as np
@@ -22,17 +27,114 @@ class SearchNode:
             The parent of the node, if there is one
         action (optional):
             The action that transitioned from parent to this node, if there was one
+        atoms (int, optional):
+            The relevant atoms in the search path segment ending at this node, as a
+            bitmask. This is filled in when the node is expanded; see `PathAtoms`.
+        r (int, optional):
+            The number of relevant atoms in `atoms`, i.e. BFWS's #r
     """
-    def __init__(self, state, g_score, h_score, parent=None, action=None):
+    # Searches hold millions of nodes, so avoid a per-instance __dict__
+    __slots__ = ('state', 'action', 'g_score', 'h_score', 'parent', 'atoms', 'r')
+
+    def __init__(self, state, g_score, h_score, parent=None, action=None, atoms=None,
+                 r=None):
         self.state = state
         self.action = action
         self.g_score = g_score
         self.h_score = h_score
         self.parent = parent
+        self.atoms = atoms
+        self.r = r
     def __cmp__(self, other):
         return 0
     def __eq__(self, other):
         return True
+    def __getstate__(self):
+        # Path atoms are search bookkeeping and can be recomputed; don't pickle them
+        return {name: getattr(self, name) for name in self.__slots__
+                if name not in ['atoms', 'r']}
+    def __setstate__(self, state):
+        # Older pickles store the node's __dict__; newer ones may store (None, slots)
+        if isinstance(state, tuple):
+            state = {**(state[0] or {}), **state[1]}
+        for name in self.__slots__:
+            setattr(self, name, state.get(name))
+
+class SearchResults(tuple):
+    """The results tuple of a best-first search, with a record of why the search stopped
+
+    This unpacks and slices like the usual (states, actions, n_expanded, n_transitions,
+    candidates[, best_n]) tuple.
+
+    Attributes:
+        stop_reason (str):
+            'goal' if the goal was found, 'exhausted' if the open list ran out, or else
+            the name of the budget that ran out: 'max_transitions', 'max_seconds' or
+            'max_memory_bytes'
+    """
+    def __new__(cls, results, stop_reason=None):
+        self = super().__new__(cls, results)
+        self.stop_reason = stop_reason
+        return self
+
+def get_rss_bytes():
+    """Return the resident memory of this process in bytes
+
+    Reads /proc/self/statm where available, and otherwise falls back to the peak
+    resident memory reported by getrusage.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS, but KB elsewhere
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+class SearchBudget:
+    """Wall-clock and memory budgets for a search
+
+    Time is checked on every call to `exceeded`, but since reading the memory usage is
+    slower, it is sampled at most every `memory_check_interval` seconds.
+
+    Args:
+        max_seconds (float, optional):
+            The wall-clock budget, in seconds from when the SearchBudget is created
+        max_memory_bytes (int, optional):
+            The budget for the process's resident memory, in bytes
+        memory_check_interval (float):
+            The minimum number of seconds between memory checks
+    """
+    def __init__(self, max_seconds=None, max_memory_bytes=None, memory_check_interval=0.25):
+        self.max_seconds = max_seconds
+        self.max_memory_bytes = max_memory_bytes
+        self.memory_check_interval = memory_check_interval
+        self.start_time = time.monotonic()
+        self.next_memory_check = self.start_time
+
+    def exceeded(self):
+        """Return the name of the budget that has run out ('max_seconds' or
+        'max_memory_bytes'), or None if neither has"""
+        if self.max_seconds is None and self.max_memory_bytes is None:
+            return None
+        now = time.monotonic()
+        if self.max_seconds is not None and now - self.start_time >= self.max_seconds:
+            return 'max_seconds'
+        if self.max_memory_bytes is not None and now >= self.next_memory_check:
+            self.next_memory_check = now + self.memory_check_interval
+            if get_rss_bytes() >= self.max_memory_bytes:
+                return 'max_memory_bytes'
+        return None
+
+def get_key(state):
+    """Return the canonical hashable key for a state
+
+    Domains can expose a compact, cached `key` attribute so that search tables avoid
+    repeatedly hashing and comparing full state objects. Otherwise the state itself
+    is used as the key.
+    """
+    return getattr(state, 'key', state)
 
 def reconstruct_path(node):
     """Iteratively reconstruct the search path by working backwards from the specified node"""
@@ -44,12 +146,21 @@ def reconstruct_path(node):
         node = node.parent
     return list(reversed(states)), list(reversed(actions))
 
+def reconstruct_best_n(best_n):
+    """Reconstruct the action sequences for a priority queue of (h_score, SearchNode) items
+
+    Searches that save their best N nodes keep the nodes themselves and only reconstruct
+    the paths of the ones that survive to the end of the search.
+
+    Returns:
+        A list of (h_score, actions) tuples, in the order of `best_n.items()`
+    """
+    return [(h_score, reconstruct_path(node)[1]) for h_score, node in best_n.items()]
+
 def get_unique_atoms(states):
-    unique_states = sorted(list(set(states)), key=lambda x: tuple(list(x)))
     unique_atoms = set([])
-    for state in unique_states:
-        for pos, val in enumerate(state):
-            unique_atoms.add((pos,val))
+    for state in set(states):
+        unique_atoms.update(enumerate(state))
     return unique_atoms
 
 def atoms_in_path(node, any_h=False):
@@ -61,8 +172,146 @@ def atoms_in_path(node, any_h=False):
         node = node.parent
     return get_unique_atoms(states)
 
+class PathAtoms:
+    """Incremental tracker for the relevant atoms in each node's search path segment
+
+    Each node's path atoms are kept as an int bitmask in `node.atoms`, with one bit per
+    relevant atom (numbered in the order the atoms are first seen), and their count #r
+    in `node.r`. A node's atoms and #r are computed from its parent's, examining only
+    the variables that changed between them, so the cost per node doesn't grow with
+    the number of atoms in the path.
+
+    Args:
+        relevant_atoms (callable):
+            A function that takes an iterable of (pos, val) atoms and returns the
+            frozenset of those that are relevant
+    """
+    def __init__(self, relevant_atoms=frozenset):
+        self.relevant_atoms = relevant_atoms
+        self.bits = {}
+
+    def _get_bit(self, atom):
+        bit = self.bits.get(atom)
+        if bit is None:
+            bit = self.bits[atom] = len(self.bits)
+        return bit
+
+    def update(self, node):
+        """Fill in the path atoms and #r of `node`
+
+        This gives the same atoms as `relevant_atoms(atoms_in_path(node))`. The node's
+        parent, if any, must already have its path atoms filled in.
+        """
+        parent = node.parent
+        if parent is None or parent.atoms is None or not parent.h_score <= node.h_score:
+            atoms = self.relevant_atoms(enumerate(node.state))
+            node.atoms = sum(1 << self._get_bit(atom) for atom in atoms)
+            node.r = len(atoms)
+            return
+        mask, r = parent.atoms, parent.r
+        new_atoms = self.relevant_atoms((pos, val) for pos, (val, parent_val)
+                                        in enumerate(zip(node.state, parent.state))
+                                        if val != parent_val)
+        for atom in new_atoms:
+            bit = 1 << self._get_bit(atom)
+            if not mask & bit:
+                mask |= bit
+                r += 1
+        node.atoms, node.r = mask, r
+
+    def decode(self, mask):
+        """Return the set of atoms in a bitmask"""
+        return {atom for atom, bit in self.bits.items() if mask >> bit & 1}
+
+CHECKPOINT_VERSION = 3
+
+class _CheckpointPickler(pickle.Pickler):
+    """Pickler that stores SearchNodes by reference to a flat node table
+
+    Pickling a node's chain of parents recursively would hit python's recursion limit,
+    so each node is pickled as its index in the table, and the table stores parents as
+    indices. Ancestors are always indexed before their descendants.
+    """
+    def __init__(self, file):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.node_ids = {}
+        self.nodes = []
+
+    def persistent_id(self, obj):
+        if not isinstance(obj, SearchNode):
+            return None
+        if id(obj) not in self.node_ids:
+            unindexed = []
+            node = obj
+            while node is not None and id(node) not in self.node_ids:
+                unindexed.append(node)
+                node = node.parent
+            for node in reversed(unindexed):
+                self.node_ids[id(node)] = len(self.nodes)
+                self.nodes.append(node)
+        return self.node_ids[id(obj)]
+
+    def node_table(self):
+        """Return the indexed nodes as a dict of columns"""
+        return {
+            'state': [node.state for node in self.nodes],
+            'action': [node.action for node in self.nodes],
+            'g_score': [node.g_score for node in self.nodes],
+            'h_score': [node.h_score for node in self.nodes],
+            'atoms': [node.atoms for node in self.nodes],
+            'r': [node.r for node in self.nodes],
+            'parent': np.asarray([-1 if node.parent is None else self.node_ids[id(node.parent)]
+                                  for node in self.nodes], dtype=np.int64),
+        }
+
+class _CheckpointUnpickler(pickle.Unpickler):
+    def __init__(self, file, nodes):
+        super().__init__(file)
+        self.nodes = nodes
+
+    def persistent_load(self, pid):
+        return self.nodes[pid]
+
+def save_checkpoint(path, search_state):
+    """Atomically save a dict of search state, including any SearchNodes it refers to
+
+    The file holds the pickled node table, followed by the pickled search state. It is
+    written to a temporary file first, so an interrupted save never corrupts the
+    previous checkpoint.
+    """
+    buffer = io.BytesIO()
+    pickler = _CheckpointPickler(buffer)
+    pickler.dump(search_state)
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'wb') as file:
+        pickle.dump((CHECKPOINT_VERSION, pickler.node_table()), file,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+        file.write(buffer.getbuffer())
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+def load_checkpoint(path):
+    """Load a dict of search state saved by `save_checkpoint`"""
+    with open(path, 'rb') as file:
+        version, table = pickle.load(file)
+        if version != CHECKPOINT_VERSION:
+            raise ValueError('Unsupported checkpoint version {} in {}'.format(version, path))
+        nodes = []
+        for state, action, g_score, h_score, atoms, r, parent in zip(
+                table['state'], table['action'], table['g_score'], table['h_score'],
+                table['atoms'], table['r'], table['parent'].tolist()):
+            nodes.append(SearchNode(state, g_score, h_score, action=action, atoms=atoms, r=r,
+                                    parent=nodes[parent] if parent >= 0 else None))
+        return _CheckpointUnpickler(file, nodes).load()
+
 def _best_first_search(start, is_goal, step_cost, heuristic, get_successors, get_priority,
-                    max_transitions=0, save_best_n=1, quiet=False):
+                    max_transitions=0, save_best_n=1, queue='heap', tiebreak='fifo',
+                    k_best=1, get_successors_batch=None, checkpoint_path=None,
+                    checkpoint_interval=600, profile=None, max_seconds=None,
+                    max_memory_bytes=None, quiet=False):
     """Core implementation of best-first search
 
     Best-first search is a general search algorithm that performs forward search
@@ -85,96 +334,238 @@ def _best_first_search(start, is_goal, step_cost, heuristic, get_successors, get
         heuristic (callable):
             A function that takes a state as input and returns its heuristic value
         get_successors (callable):
-            A function that takes a state as input and returns all possible successor states
+            A function that takes a state as input and returns all possible successors, as
+            a list of (state, action) pairs. Batched domains may instead return (state,
+            action, h) triples, where h is the precomputed heuristic value of each state.
         get_priority (callable):
             A function that takes a SearchNode as input and returns its priority
         max_transitions (int):
             The simulation budget for the search
         save_best_n (int):
             The number of best SearchNodes to maintain during the search
+        queue (str, ['heap', 'bucket' or 'indexed']):
+            The open list implementation (see priorityqueue.OPEN_LISTS). Bucket queues
+            are faster when there are few distinct priorities, as with goal-count
+            heuristics. Indexed queues replace a state's node when a better path to it
+            is found, rather than leaving a stale duplicate in the open list.
+        tiebreak (str, ['fifo' or 'lifo']):
+            Whether to expand the oldest or newest of the nodes with equal priority
+        k_best (int):
+            The number of best open nodes to expand together in each iteration. Their
+            successors are only added to the open list after all k have been expanded.
+            Expansions still count towards max_transitions (and candidates) one at a
+            time, but the budget is only checked between batches, so it can be exceeded
+            by up to k-1 expansions.
+        get_successors_batch (callable, optional):
+            A function that takes a list of states as input and returns the list of
+            get_successors() results for each of them, so that domains can generate and
+            evaluate the successors of all k nodes in a single batch
+        checkpoint_path (str, optional):
+            Where to periodically save the full search state. If the file already
+            exists, the search resumes from it (ignoring `start`) and then proceeds
+            exactly as if it had never been interrupted, provided the other arguments
+            are the same. A final checkpoint is saved if the search stops without
+            finding the goal, so it can also be resumed with a larger max_transitions.
+        checkpoint_interval (float):
+            The number of seconds between checkpoints
+        profile (SearchProfile, optional):
+            If given, time each phase of the search loop into this profile (see
+            experiments.profiling)
+        max_seconds (float, optional):
+            The wall-clock budget for the search, in seconds
+        max_memory_bytes (int, optional):
+            The budget for the process's resident memory, in bytes (see SearchBudget)
         quiet (boolean):
             Whether to suppress progress bars
+
+    Returns:
+        A SearchResults tuple. Like the transition budget, the time and memory budgets
+        are checked between expansions, and when one runs out the search stops with the
+        path to the best node so far, recording which budget ran out as `stop_reason`.
     """
+    budget = SearchBudget(max_seconds, max_memory_bytes)
     n_expanded = 0
     n_transitions = 0
-    open_set = pq.PriorityQueue()
+    open_set = pq.OPEN_LISTS[queue](tiebreak=tiebreak)
     closed_set = set()
     g_score = defaultdict(lambda: float('inf'))
-    g_score[start] = 0
-    n_heuristic_params = len(signature(heuristic).parameters)
+    # Heuristics may optionally accept the number of relevant path atoms #r, and/or a
+    # precomputed value h
+    heuristic_params = signature(heuristic).parameters
+    takes_h = 'h' in heuristic_params
+    n_heuristic_params = len(heuristic_params) - takes_h
     if n_heuristic_params == 1:
-        heuristic_fn = lambda x, R: heuristic(x)
+        if takes_h:
+            heuristic_fn = lambda x, r, h=None: heuristic(x, h=h)
+        else:
+            heuristic_fn = lambda x, r, h=None: heuristic(x) if h is None else h
     else:
-        heuristic_fn = lambda x, R: heuristic(x, R)
-    root = SearchNode(state=start, g_score=0, h_score=heuristic_fn(start, set([])), parent=None, action=None)
-
-    # Adding root to open set
-    open_set.push((get_priority(root), root))
-    candidates = [(n_transitions, root)]
-    best = root
+        if takes_h:
+            heuristic_fn = lambda x, r, h=None: heuristic(x, r, h=h)
+        else:
+            heuristic_fn = lambda x, r, h=None: heuristic(x, r)
+    # Only track path atoms for heuristics that use them (e.g. BFWS's #r)
+    track_atoms = n_heuristic_params > 1
+    path_atoms = PathAtoms(getattr(heuristic, 'relevant_atoms', frozenset))
+    r = 0
     # save best N nodes, always ejecting the max priority element to make room
     best_n = pq.PriorityQueue(maxlen=save_best_n, mode='max')
+    save_best = lambda node: best_n.push((node.h_score, node))
+    state_key = get_key
+    update_atoms = path_atoms.update
+    if profile is not None:
+        # Time each phase of the search by wrapping the functions it calls
+        is_goal = profile.timed('goal', is_goal)
+        heuristic_fn = profile.timed('heuristic', heuristic_fn)
+        get_priority = profile.timed('priority', get_priority)
+        get_successors = profile.timed('successors', get_successors)
+        if get_successors_batch is not None:
+            get_successors_batch = profile.timed('successors', get_successors_batch)
+        state_key = profile.timed('keys', state_key)
+        update_atoms = profile.timed('atoms', update_atoms)
+        save_best = profile.timed('best_n', save_best)
+
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        # Resuming from checkpoint...
+        saved = load_checkpoint(checkpoint_path)
+        n_expanded = saved['n_expanded']
+        n_transitions = saved['n_transitions']
+        open_set = saved['open_set']
+        closed_set = saved['closed_set']
+        g_score.update(saved['g_score'])
+        candidates = saved['candidates']
+        best = saved['best']
+        best_n = saved['best_n']
+        path_atoms.bits = saved['atom_bits']
+        if saved['heuristic_state'] is not None:
+            heuristic.load_state_dict(saved['heuristic_state'])
+    else:
+        root = SearchNode(state=start, g_score=0, h_score=heuristic_fn(start, 0),
+                          parent=None, action=None)
 
-    with tqdm(total=max_transitions, disable=quiet) as progress:
+        # Adding root to open set
+        g_score[state_key(start)] = 0
+        open_set.push(get_priority(root), root, state_key(start))
+        candidates = [(n_transitions, root)]
+        best = root
+
+    def save():
+        save_checkpoint(checkpoint_path, {
+            'n_expanded': n_expanded,
+            'n_transitions': n_transitions,
+            'open_set': open_set,
+            'closed_set': closed_set,
+            'g_score': dict(g_score),
+            'candidates': candidates,
+            'best': best,
+            'best_n': best_n,
+            'atom_bits': path_atoms.bits,
+            'heuristic_state': (heuristic.state_dict() if hasattr(heuristic, 'state_dict')
+                                else None),
+        })
+    last_checkpoint = time.time()
+    push, pop = open_set.push, open_set.pop
+    if profile is not None:
+        save = profile.timed('checkpoint', save)
+        push = profile.timed('push', push)
+        pop = profile.timed('pop', pop)
+
+    with tqdm(total=max_transitions, initial=n_transitions, disable=quiet) as progress:
+        update_progress = progress.update
+        if profile is not None:
+            update_progress = profile.timed('progress', update_progress)
         while open_set and n_transitions < max_transitions:
-            _, current = open_set.pop()
-            if current.state in closed_set:
-                continue  # Node already in closed set; ignore it
-            closed_set.add(current.state)
-
-            n_expanded += 1
-            if is_goal(current):
-                candidates.append((n_transitions, current))
-                # Found goal! Reconstructing path...
-                return reconstruct_path(current) + (n_expanded, n_transitions, candidates)
-
-            if (current.h_score < best.h_score
-                    or (current.h_score == best.h_score
-                        and current.g_score < best.g_score)):
-                # Found better node!
-                best = current
-                candidates.append((n_transitions, current))
-
-            best_n.push((current.h_score, reconstruct_path(current)[1]))
-
-            # Considering successors...
-            successors = get_successors(current.state)
-            n_transitions += len(successors)
-            progress.update(len(successors))
-            atoms = None
-            for state, action in successors:
-                if state in closed_set:
-                    continue
-
-                # Evaluating successor node
-                g_score_via_current = g_score[current.state] + step_cost(action)
-                if g_score_via_current < g_score[state]:
-                    # Found better path to `state`
-                    g_score[state] = g_score_via_current
-                    # We'd like to remove any existing `state` SearchNodes from the
-                    # heap, but removing from a heap is tricky. Instead we just add
-                    # a new node, allowing duplicates to exist in the heap, and we
-                    # wait for them to be pulled out in due time. Duplicates will be
-                    # ignored anyway after the first instance of `state` is added to
-                    # `closed_set`.
-
-                    # Only compute atoms once for each node expansion
-                    if atoms is None:
-                        atoms = atoms_in_path(current)
-                    neighbor = SearchNode(state=state, g_score=g_score[state],
-                                          h_score=heuristic_fn(state, atoms),
-                                          parent=current, action=action)
-                    if is_goal(neighbor):
-                        candidates.append((n_transitions, neighbor))
-                        # Found goal! Reconstructing path...
-                        return reconstruct_path(neighbor) + (n_expanded, n_transitions, candidates)
-                    # Improved path to successor node; adding to open set
-                    open_set.push((get_priority(neighbor), neighbor))
+            stop_reason = budget.exceeded()
+            if stop_reason is not None:
+                break
+            if (checkpoint_path is not None
+                    and time.time() - last_checkpoint >= checkpoint_interval):
+                save()
+                last_checkpoint = time.time()
+
+            # Pop the k best nodes that haven't been expanded yet
+            batch = []
+            while open_set and len(batch) < k_best:
+                _, current = pop()
+                current_key = state_key(current.state)
+                if current_key in closed_set:
+                    continue  # Node already in closed set; ignore it
+                closed_set.add(current_key)
+                batch.append((current, current_key))
+            successor_lists = None
+            if get_successors_batch is not None:
+                successor_lists = get_successors_batch([node.state for node, _ in batch])
+
+            for i, (current, current_key) in enumerate(batch):
+                n_expanded += 1
+                sampled = profile is not None and profile.should_sample(n_expanded)
+                if sampled:
+                    profile.start_sample()
+                if is_goal(current):
+                    candidates.append((n_transitions, current))
+                    # Found goal! Reconstructing path...
+                    return SearchResults(reconstruct_path(current)
+                                         + (n_expanded, n_transitions, candidates), 'goal')
+
+                if (current.h_score < best.h_score
+                        or (current.h_score == best.h_score
+                            and current.g_score < best.g_score)):
+                    # Found better node!
+                    best = current
+                    candidates.append((n_transitions, current))
+
+                save_best(current)
+
+                # Considering successors...
+                if successor_lists is None:
+                    successors = get_successors(current.state)
+                else:
+                    successors = successor_lists[i]
+                n_transitions += len(successors)
+                update_progress(len(successors))
+                if track_atoms:
+                    update_atoms(current)
+                    r = current.r
+                for state, action, *precomputed_h in successors:
+                    key = state_key(state)
+                    if key in closed_set:
+                        continue
+
+                    # Evaluating successor node
+                    g_score_via_current = g_score[current_key] + step_cost(action)
+                    if g_score_via_current < g_score[key]:
+                        # Found better path to `state`
+                        g_score[key] = g_score_via_current
+                        # Indexed open lists replace any existing `state` SearchNode.
+                        # Otherwise we just add a new node, allowing duplicates to exist in
+                        # the open list, and we wait for them to be pulled out in due time.
+                        # Duplicates will be ignored anyway after the first instance of
+                        # `state` is added to `closed_set`.
+                        neighbor = SearchNode(state=state, g_score=g_score_via_current,
+                                              h_score=heuristic_fn(state, r,
+                                                                   *precomputed_h),
+                                              parent=current, action=action)
+                        if is_goal(neighbor):
+                            candidates.append((n_transitions, neighbor))
+                            # Found goal! Reconstructing path...
+                            return SearchResults(reconstruct_path(neighbor)
+                                                 + (n_expanded, n_transitions, candidates),
+                                                 'goal')
+                        # Improved path to successor node; adding to open set
+                        push(get_priority(neighbor), neighbor, key)
+                if sampled:
+                    profile.end_sample(n_expanded, len(successors))
+
+        else:
+            stop_reason = 'max_transitions' if open_set else 'exhausted'
 
         # No solution found. Reconstructing path to best node...
+        if checkpoint_path is not None:
+            save()
+        results = reconstruct_path(best) + (n_expanded, n_transitions, candidates)
         if save_best_n > 1:
-            return reconstruct_path(best) + (n_expanded, n_transitions, candidates, best_n.items())
-        return reconstruct_path(best) + (n_expanded, n_transitions, candidates)
+            results += (reconstruct_best_n(best_n),)
+        return SearchResults(results, stop_reason)
 
 class WeightedAStarPriority:
     def __init__(self, gh_weights):
@@ -195,12 +586,16 @@ class GBFSPriority():
     def __call__(self, node):
         return node.h_score
 
-def best_first_search(*args, **kwargs):
+def best_first_search(*args, profile=None, **kwargs):
     """Best-first search"""
     # This function wraps the core implementation to ensure that the returned list
     # of 'candidate' SearchNodes have each had their parent information stripped
     # so that the results can be pickled without hitting python's recursion limit.
-    results = _best_first_search(*args, **kwargs)
+    if profile is not None:
+        profile.start()
+    results = _best_first_search(*args, profile=profile, **kwargs)
+    if profile is not None:
+        profile.stop(n_expanded=results[2], n_transitions=results[3])
     candidates = results[4]
     for _, node in candidates:
         node.parent = None
@@ -215,7 +610,8 @@ def astar(*args, **kwargs):
 
 def dijkstra(*args, **kwargs):
     """Dijkstra's algorithm"""
-    return best_first_search(*args, heuristic=lambda x: 0, get_priority=DijkstraPriority(), **kwargs)
+    return best_first_search(*args, heuristic=lambda x, h=None: 0, get_priority=DijkstraPriority(),
+                             **kwargs)
 
 def gbfs(*args, **kwargs):
     """Greedy best-first search (GBFS)"""
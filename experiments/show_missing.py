@@ -1,13 +1,12 @@
-import glob
+from collections import defaultdict
 from itertools import groupby, count
-import os
 
-import numpy as np
 import pandas as pd
 
 from experiments.plot_planning_time import (
     parse_args, parse_filepath, cube_cfg, npuzzle_cfg, suitcaselock_cfg
 )
+from experiments.results import read_manifest, index_results
 
 # ------------------------------------------------------------------------------
 # Adapted from https://codereview.stackexchange.com/a/5202
@@ -23,36 +22,27 @@ def ranges_to_string(range_):
 # ------------------------------------------------------------------------------
 
 def show_missing(max_seed):
-    """Show seeds in [1,max_seed] that are missing from the current results"""
-    result_files = sorted(glob.glob(RESULTS_DIR+'/**', recursive=True))
+    """Show seeds in [1,max_seed] that are missing from the current results
 
-    completed_runs = []
-    for filepath in result_files:
-        if not os.path.isfile(filepath):
-            continue
-        metadata = parse_filepath(filepath, cfg.FIELDS, prefix=RESULTS_DIR)
+    Completed runs are read from the experiment's manifest, so the results directory
+    itself isn't walked (use --reindex to add results from before the manifest existed).
+    """
+    completed_seeds = defaultdict(set)
+    for entry in read_manifest(RESULTS_DIR):
+        metadata = parse_filepath(RESULTS_DIR + entry['path'], cfg.FIELDS, prefix=RESULTS_DIR)
         if metadata.alg != args.alg:
             continue
+        key = tuple(value for field, value in metadata._asdict().items() if field != 'seed')
+        completed_seeds[key].add(metadata.seed)
 
-        completed_runs.append({
-            **metadata._asdict(),
-        })
-
-    completed_runs = pd.DataFrame(completed_runs)
-
-    columns = [column for column in list(completed_runs.columns) if column != 'seed']
-    keys = completed_runs[columns].values
-    if len(keys) == 0:
+    if not completed_seeds:
         print('No results found.')
         return
-    str_keys = list(map(lambda x: np.array(list(map(str, x))), keys))
-    unique_idx = np.unique(np.stack(str_keys), axis=0, return_index=True)[1]
+    columns = [field for field in cfg.FIELDS if field != 'seed']
 
     results = []
-    for key in keys[unique_idx]:
-        all_matching_keys = np.all(keys==key, axis=1)
-        completed_seeds = completed_runs['seed'][all_matching_keys]
-        missing = [x for x in range(1, max_seed+1) if x not in list(completed_seeds)]
+    for key in sorted(completed_seeds, key=lambda key: tuple(map(str, key))):
+        missing = [x for x in range(1, max_seed+1) if x not in completed_seeds[key]]
         missing_str = ranges_to_string(missing)
         if not missing:
             missing_str = 'N/A'
@@ -76,5 +66,7 @@ if __name__ == '__main__':
         'suitcaselock': suitcaselock_cfg,
     }[args.name]
     RESULTS_DIR = 'results/' + args.name + '/'
+    if args.reindex:
+        print('Indexed {} new and {} removed runs'.format(*index_results(RESULTS_DIR)))
 
     show_missing(max_seed=100)
@@ -1,20 +1,26 @@
 import argparse
 import copy
 import os
-import pickle
 import random
 import sys
 
 import numpy as np
 
-from domains.suitcaselock import SuitcaseLock
-from experiments import search
+from domains import effects
+from domains.suitcaselock import SuitcaseLock, expand_all
+from experiments import search, bfws, bidirectional, idastar, parallel_search
+from experiments.profiling import SearchProfile, get_profile_path
+from experiments.results import save_run
 
 
-def parse_args():
+def parse_args(args=None):
     """Parse input arguments
 
     Use --help to see a pretty description of the arguments
+
+    Args:
+        args (list, optional):
+            The list of argument strings to parse. Defaults to sys.argv[1:].
     """
     if 'ipykernel' in sys.argv[0]:
         sys.argv = [sys.argv[0]]
@@ -28,22 +34,61 @@ def parse_args():
     parser.add_argument('--entanglement', type=int, default=1,
                         help='Maximum number of variables changed per primitive action')
     parser.add_argument('--search_alg', type=str, default='gbfs',
-                        choices = ['astar', 'gbfs', 'weighted-astar', 'bfws'],
+                        choices = ['astar', 'gbfs', 'weighted_astar', 'bfws',
+                                   'bidirectional_astar', 'bidirectional_gbfs', 'idastar',
+                                   'rbfs', 'parallel_astar', 'parallel_gbfs'],
                         help='Search algorithm to run')
+    parser.add_argument('--queue', type=str, default='heap',
+                        choices=['heap', 'bucket', 'indexed'],
+                        help='Open list for best-first search')
+    parser.add_argument('--k_best', type=int, default=1,
+                        help='Number of best nodes to expand per iteration of best-first search')
+    parser.add_argument('--profile', action='store_true',
+                        help='Time each phase of best-first search, and save the profile '
+                             'next to the results')
+    parser.add_argument('--profile_sample_every', type=int, default=0,
+                        help='Also record the per-phase costs of every Nth expansion')
+    parser.add_argument('--n_search_workers', type=int, default=os.cpu_count(),
+                        help='Number of worker processes for parallel search algorithms')
     parser.add_argument('--g_weight', type=float, default=None,
                         help='Weight for g-score in weighted A*')
     parser.add_argument('--h_weight', type=float, default=None,
                         help='Weight for h-score in weighted A*')
     parser.add_argument('--max_transitions', type=lambda x: int(float(x)), default=1e5,
                         help='Maximum number of state transitions')
+    parser.add_argument('--max_seconds', type=float, default=None,
+                        help='Wall-clock budget for best-first search, after which it stops '
+                             'with the best node so far')
+    parser.add_argument('--max_memory_gb', type=float, default=None,
+                        help='Resident memory budget for best-first search (in GB)')
     parser.add_argument('--bfws_precision', type=int, default=2,
                         help='The number of width values, w \in {1,...,P}, to use when the search algorithm is best-first width search')
-    return parser.parse_args()
+    return parser.parse_args(args)
+
+
+def get_results_path(args):
+    """Return the path of the results file for the given arguments"""
+    tag = 'n_vars-{}/n_values-{}/entanglement-{}'
+    tag = tag.format(args.n_vars, args.n_values, args.entanglement)
+
+    search_alg = args.search_alg
+    if args.k_best > 1:
+        search_alg += '-k_{}'.format(args.k_best)
+    if args.queue != 'heap':
+        search_alg += '-queue_{}'.format(args.queue)
+    results_dir = 'results/suitcaselock/{}/{}/'.format(search_alg, tag)
+    return results_dir+'seed-{:03d}.npz'.format(args.random_seed)
 
 
-def solve():
-    """Instantiate a SuitcaseLock and solve with the specified search algorithm"""
-    args = parse_args()
+def solve(args=None):
+    """Instantiate a SuitcaseLock and solve with the specified search algorithm
+
+    Args:
+        args (argparse.Namespace, optional):
+            The parsed arguments (see parse_args). Defaults to parsing sys.argv.
+    """
+    if args is None:
+        args = parse_args()
 
     seed = args.random_seed
 
@@ -67,12 +112,31 @@ def solve():
         'astar': search.astar,
         'gbfs': search.gbfs,
         'weighted_astar': search.weighted_astar,
-        'bfws': search.bfws,
+        'bfws': bfws.bfws,
+        'bidirectional_astar': bidirectional.bidirectional_astar,
+        'bidirectional_gbfs': bidirectional.bidirectional_gbfs,
+        'idastar': idastar.idastar,
+        'rbfs': idastar.rbfs,
+        'parallel_astar': parallel_search.parallel_astar,
+        'parallel_gbfs': parallel_search.parallel_gbfs,
     }[args.search_alg]
 
+    diffs = np.stack(actions)
+    # Successor goal counts only need to look at the dials each action changes
+    changed_positions = effects.get_changed_positions(diffs != 0)
+
     def get_successors(lock):
-        # don't deepcopy unless you want billions of copies of the actions list!
-        return [(copy.copy(lock).apply_macro(diff=a), a) for a in actions]
+        # Generate all successors and their heuristic values in one batch
+        states, goal_counts = lock.expand(diffs, goal, changed_positions)
+        return [(lock.child(state), a, h)
+                for (state, a, h) in zip(states, actions, goal_counts.tolist())]
+
+    def get_successors_batch(locks):
+        # Generate the successors of several nodes and their heuristic values in one batch
+        states, goal_counts = expand_all(locks, diffs, goal=goal)
+        return [[(lock.child(state), a, h)
+                 for (state, a, h) in zip(lock_states, actions, lock_goal_counts.tolist())]
+                for lock, lock_states, lock_goal_counts in zip(locks, states, goal_counts)]
 
     search_dict = {
         'start': start,
@@ -83,26 +147,52 @@ def solve():
         'max_transitions': args.max_transitions,
     }
 
+    # Bidirectional and linear-space searches don't use a single open list
+    if args.search_alg in ['astar', 'gbfs', 'weighted_astar', 'bfws']:
+        search_dict['queue'] = args.queue
+        if args.k_best > 1:
+            search_dict['k_best'] = args.k_best
+            search_dict['get_successors_batch'] = get_successors_batch
+        if args.profile:
+            search_dict['profile'] = SearchProfile(sample_every=args.profile_sample_every)
+        if args.max_seconds is not None:
+            search_dict['max_seconds'] = args.max_seconds
+        if args.max_memory_gb is not None:
+            search_dict['max_memory_bytes'] = int(args.max_memory_gb * 2**30)
+
+    if 'parallel' in args.search_alg:
+        search_dict['n_workers'] = args.n_search_workers
+
     if args.search_alg == 'weighted_astar':
         assert (args.g_weight is not None
                 and args.h_weight is not None), 'Must specify weights if using weighted A*.'
         gh_weights = (args.g_weight, args.h_weight)
         search_dict['gh_weights'] = gh_weights
     elif args.search_alg == 'bfws':
-        search_dict['bfws'] = True
-        search_dict['bfws_precision'] = args.bfws_precision
+        search_dict['precision'] = args.bfws_precision
+    elif 'bidirectional' in args.search_alg:
+        # Search backward from the goal by subtracting each action's diff
+        def get_predecessors(lock):
+            states, start_counts = lock.expand(-diffs, start, changed_positions)
+            return [(lock.child(state), a, h)
+                    for (state, a, h) in zip(states, actions, start_counts.tolist())]
+        del search_dict['is_goal']
+        search_dict['goal'] = goal
+        search_dict['get_predecessors'] = get_predecessors
+        search_dict['backward_heuristic'] = lambda lock: sum(lock.summarize_effects(baseline=start) > 0)
 
     #%% Run the search
     search_results = search_fn(**search_dict)
 
     #%% Save the results
-    tag = 'n_vars-{}/n_values-{}/entanglement-{}'
-    tag = tag.format(args.n_vars, args.n_values, args.entanglement, args.max_transitions)
-
-    results_dir = 'results/suitcaselock/{}/{}/'.format(args.search_alg, tag)
-    os.makedirs(results_dir, exist_ok=True)
-    with open(results_dir+'seed-{:03d}.pickle'.format(seed), 'wb') as file:
-        pickle.dump(search_results, file)
+    results_path = get_results_path(args)
+    action_ids = {a.tobytes(): i for i, a in enumerate(actions)}
+    plan = [[action_ids[a.tobytes()]] for a in search_results[1]]
+    n_errors = sum(search_results[0][-1].summarize_effects(baseline=goal) > 0)
+    save_run(results_path, search_results, plan, n_errors, args=args)
+    if 'profile' in search_dict:
+        search_dict['profile'].save(get_profile_path(results_path))
+        print(search_dict['profile'].summary())
 
 
 if __name__ == '__main__':
@@ -1,7 +1,26 @@
-from collections import defaultdict
+import itertools
 import unittest
 
+import numpy as np
+
 class WidthAugmentedHeuristic:
+    """Novelty-based width augmentation for a heuristic
+
+    Seen atom tuples are stored as bitsets, one table per (r, h) bucket and tuple size k.
+    Each table has a row for every combination of k variables, and a bit for every
+    combination of k value codes. Values are mapped to integer codes per variable as
+    they are encountered, and the tables grow whenever a variable sees a new value.
+
+    Args:
+        n_variables (int):
+            The number of state variables
+        heuristic (callable):
+            The state->heuristic function to augment
+        R (set, optional):
+            The set of relevant (pos, val) atoms to use for #r; if None, all atoms count
+        precision (int):
+            One more than the size of the largest atom tuples to check for novelty
+    """
     def __init__(self, n_variables, heuristic, R=set([]), precision=2):
         if precision < 2:
             raise ValueError('precision must be >= 2')
@@ -12,60 +31,110 @@ class WidthAugmentedHeuristic:
         self.R = R
         self.precision = precision
 
+        # (n_combos, k) arrays of variable indices for each tuple size k
+        self.combos = dict()
+        for k in range(1, precision):
+            combos = list(itertools.combinations(range(self.n_variables), k))
+            self.combos[k] = np.array(combos, dtype=np.intp).reshape(-1, k)
+        self.rows = {k: np.arange(len(combos)) for k, combos in self.combos.items()}
+
+        self.value_codes = [dict() for _ in range(self.n_variables)]
+        self.capacity = 0
         self.history = dict()
-        self.history[1] = dict()
-        self.history[2] = dict()
-        self.history[3] = dict()
-        for i in range(self.n_variables):
-            self.history[1][i] = defaultdict(set)
-            for j in range(i+1, self.n_variables):
-                self.history[2][(i,j)] = defaultdict(set)
-                for k in range(j+1, self.n_variables):
-                    self.history[3][(i,j,k)] = defaultdict(set)
-
-    def __call__(self, x, atoms=set([])):
-        h = self.heuristic(x)
-        if self.R is not None:
-            r = len(atoms.intersection(self.R))
-        else:
-            r = len(atoms)
-        w = self.get_width(x, (r, h))
-        self.record(x, (r, h))
+
+    def state_dict(self):
+        """Return the novelty tables, so that a search checkpoint can restore them"""
+        return {'value_codes': self.value_codes, 'capacity': self.capacity,
+                'history': self.history}
+
+    def load_state_dict(self, state):
+        """Restore novelty tables saved by `state_dict`"""
+        self.value_codes = state['value_codes']
+        self.capacity = state['capacity']
+        self.history = state['history']
+
+    def relevant_atoms(self, atoms):
+        """Return the frozenset of `atoms` that count towards #r"""
+        atoms = frozenset(atoms)
+        if self.R is None:
+            return atoms
+        return atoms.intersection(self.R)
+
+    def __call__(self, x, r=0, h=None):
+        """Return the (width, h) of state `x`, given the number of relevant path atoms #r
+
+        The search tracks #r incrementally on each node (see search.PathAtoms), counting
+        only the atoms that pass `relevant_atoms`.
+        """
+        if h is None:
+            h = self.heuristic(x)
+        codes = self.encode(x)
+        w = self._get_width(codes, (r, h))
+        self._record(codes, (r, h))
         return w, h
 
+    def encode(self, x):
+        """Map each variable's value in state `x` to its integer code"""
+        codes = np.empty(self.n_variables, dtype=np.intp)
+        n_values = self.capacity
+        for i, val in enumerate(x):
+            value_codes = self.value_codes[i]
+            code = value_codes.get(val)
+            if code is None:
+                code = value_codes[val] = len(value_codes)
+                n_values = max(n_values, code + 1)
+            codes[i] = code
+        if n_values > self.capacity:
+            self._grow(n_values)
+        return codes
+
+    def _grow(self, capacity):
+        """Re-layout the bit tables to hold `capacity` codes per variable"""
+        for tables in self.history.values():
+            for k, table in tables.items():
+                n_combos = len(table)
+                bits = np.unpackbits(table, axis=1, count=self.capacity**k, bitorder='little')
+                bits = bits.reshape((n_combos,) + (self.capacity,)*k)
+                padding = ((0, 0),) + ((0, capacity - self.capacity),)*k
+                bits = np.pad(bits, padding).reshape(n_combos, capacity**k)
+                tables[k] = np.packbits(bits, axis=1, bitorder='little')
+        self.capacity = capacity
+
+    def _get_tables(self, h):
+        tables = self.history.get(h)
+        if tables is None:
+            n_bits = lambda k: self.capacity**k
+            tables = {k: np.zeros((len(combos), (n_bits(k) + 7)//8), dtype=np.uint8)
+                      for k, combos in self.combos.items()}
+            self.history[h] = tables
+        return tables
+
+    def _locate(self, codes, k):
+        """Return the (row, byte, mask) bit locations of the size-k atom tuples in `codes`"""
+        values = codes[self.combos[k]] @ (self.capacity ** np.arange(k-1, -1, -1))
+        masks = np.left_shift(1, values & 7).astype(np.uint8)
+        return self.rows[k], values >> 3, masks
+
     def record(self, x, h):
-        for i in range(self.n_variables):
-            self.history[1][i][h].add(x[i])
-            if self.precision > 2:
-                for j in range(i+1, self.n_variables):
-                    self.history[2][(i,j)][h].add((x[i],x[j]))
-                    if self.precision > 3:
-                        for k in range(j+1, self.n_variables):
-                            self.history[3][(i,j,k)][h].add((x[i],x[j],x[k]))
+        self._record(self.encode(x), h)
+
+    def _record(self, codes, h):
+        tables = self._get_tables(h)
+        for k, table in tables.items():
+            rows, cols, masks = self._locate(codes, k)
+            table[rows, cols] |= masks
 
     def get_width(self, x, h):
-        # consider length 1 atoms
-        for i in range(self.n_variables):
-            if x[i] not in self.history[1][i][h]:
-                return 1
-        if self.precision == 2:
-            return 2
-        # consider length 2 atoms
-        for i in range(self.n_variables):
-            for j in range(i+1, self.n_variables):
-                if (x[i], x[j]) not in self.history[2][(i,j)][h]:
-                    return 2
-        if self.precision == 3:
-            return 3
-        # consider length 4 atoms
-        for i in range(self.n_variables):
-            for j in range(i+1, self.n_variables):
-                for k in range(j+1, self.n_variables):
-                    if (x[i], x[j], x[k]) not in self.history[3][(i,j,k)][h]:
-                        return 3
-        if self.precision == 4:
-            return 4
-        raise NotImplementedError
+        return self._get_width(self.encode(x), h)
+
+    def _get_width(self, codes, h):
+        # consider length 1, 2, and 3 atoms in turn
+        tables = self._get_tables(h)
+        for k in range(1, self.precision):
+            rows, cols, masks = self._locate(codes, k)
+            if not np.all(tables[k][rows, cols] & masks):
+                return k
+        return self.precision
 
 class TestWidthAugmentedHeuristic(unittest.TestCase):
     def test_fixed_h(self):
@@ -116,5 +185,26 @@ class TestWidthAugmentedHeuristic(unittest.TestCase):
         self.assertEqual(f(2,1,2,2), (1, 4))
         self.assertEqual(f(2,1,2,1), (2, 4))
 
+    def test_matches_reference(self):
+        import random
+        random.seed(0)
+        h = WidthAugmentedHeuristic(5, heuristic=lambda x: 0, precision=4)
+        history = set([])
+        def reference_width(x, bucket):
+            for k in range(1, 4):
+                for combo in itertools.combinations(range(5), k):
+                    if (bucket, combo, tuple(x[i] for i in combo)) not in history:
+                        return k
+            return 4
+        for n_values in [2, 3, 5, 9]:
+            for _ in range(200):
+                x = [random.randrange(n_values) for _ in range(5)]
+                bucket = (0, random.randrange(3))
+                self.assertEqual(h.get_width(x, bucket), reference_width(x, bucket))
+                h.record(x, bucket)
+                for k in range(1, 4):
+                    for combo in itertools.combinations(range(5), k):
+                        history.add((bucket, combo, tuple(x[i] for i in combo)))
+
 if __name__ == '__main__':
     unittest.main(argv=[''], verbosity=2, exit=False)